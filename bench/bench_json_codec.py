@@ -0,0 +1,111 @@
+# 微基准：标准库 json vs orjson，在本服务典型的中文负载上对比编解码耗时
+#
+# 用法：python bench/bench_json_codec.py [--n 20000] [--history 20]
+# 每个场景先断言两种实现的输出一致（解码结果相等 / 编码 bytes 相同），再计时。
+
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("OPEN_API_KEY", "bench")
+os.environ.setdefault("DASHSCOPE_API_KEY", "bench")
+
+try:
+    import orjson
+except ImportError:
+    sys.exit("orjson is not installed; nothing to compare (the service falls back to stdlib json)")
+
+from bench.bench_prompt_build import make_payload  # noqa: E402
+from models.record_model import SummarizeResultResp  # noqa: E402
+
+
+def std_dumps(obj) -> bytes:
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def orjson_dumps(obj) -> bytes:
+    return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS)
+
+
+def make_summary() -> dict:
+    return {
+        "articleTitle": "平凡又温柔的一天",
+        "moodKeywords": "放松,满足",
+        "actionKeywords": "散步,下班,聊天",
+        "memoryPoint": "傍晚在公园散步，看到了很美的晚霞",
+        "analyzeResult": "整体情绪平稳偏积极，工作后的疲惫通过散步得到缓解。" * 3,
+        "article": "今天是平凡又温柔的一天。早上起床后先去楼下买了豆浆油条，" * 20,
+    }
+
+
+def make_upstream_body(history: int) -> dict:
+    msgs = [{"role": "system", "content": "你叫「念念」，是一位陪伴用户记录生活与情绪、拥有极强共情能力的温暖好友。" * 8}]
+    for i in range(history):
+        msgs.append({"role": "user", "content": f"今天第{i}次聊天，我去公园散步了，心情还不错。"})
+        msgs.append({"role": "assistant", "content": "听起来很惬意呀，公园里人多吗？"})
+    return {
+        "model": "qwen-plus-character",
+        "input": {"messages": msgs},
+        "parameters": {"result_format": "text", "temperature": 0.6, "repetition_penalty": 1.15},
+    }
+
+
+def make_upstream_resp() -> bytes:
+    text = json.dumps(make_summary(), ensure_ascii=False)
+    return std_dumps({
+        "output": {"text": text, "finish_reason": "stop"},
+        "usage": {"input_tokens": 3120, "output_tokens": 640},
+        "request_id": "5d1f7a8e-0000-4c0b-9d21-000000000000",
+    })
+
+
+def bench(fn, n: int) -> float:
+    fn()
+    t0 = time.perf_counter()
+    for _ in range(n):
+        fn()
+    return (time.perf_counter() - t0) / n * 1e6
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--n", type=int, default=20000)
+    ap.add_argument("--history", type=int, default=20)
+    args = ap.parse_args()
+
+    ws_frame = json.dumps(make_payload(args.history), ensure_ascii=False)
+    ws_reply = {"reply": "嗯嗯，听起来你今天过得挺充实的～下班路上有没有看到什么好玩的？累了就早点休息。", "sessionId": "s-1"}
+    summary = SummarizeResultResp(**make_summary())
+    upstream_body = make_upstream_body(args.history)
+    upstream_resp = make_upstream_resp()
+
+    # (场景, 标准库, orjson)
+    cases = [
+        ("ws receive  loads(frame)", lambda: json.loads(ws_frame), lambda: orjson.loads(ws_frame)),
+        ("ws send     dumps(reply)", lambda: std_dumps(ws_reply), lambda: orjson_dumps(ws_reply)),
+        ("upstream    dumps(body)", lambda: std_dumps(upstream_body), lambda: orjson_dumps(upstream_body)),
+        ("upstream    loads(resp)", lambda: json.loads(upstream_resp), lambda: orjson.loads(upstream_resp)),
+        (
+            "response    summary dict",
+            lambda: std_dumps(summary.model_dump()),
+            lambda: orjson_dumps(summary.model_dump()),
+        ),
+    ]
+    for name, std_fn, fast_fn in cases:
+        assert std_fn() == fast_fn(), name
+
+    print(f"history={args.history} n={args.n} frame={len(ws_frame.encode())}B body={len(std_dumps(upstream_body))}B")
+    print(f"{'case':<28}{'json us/op':>12}{'orjson us/op':>14}{'speedup':>10}")
+    for name, std_fn, fast_fn in cases:
+        std_us = bench(std_fn, args.n)
+        fast_us = bench(fast_fn, args.n)
+        print(f"{name:<28}{std_us:>12.2f}{fast_us:>14.2f}{std_us / fast_us:>9.1f}x")
+    # 参考：response_model 路由由 FastAPI 直接调用 pydantic-core 序列化，不经过 FastJSONResponse
+    print(f"{'response    pydantic json':<28}{bench(summary.model_dump_json, args.n):>12.2f}")
+
+
+if __name__ == "__main__":
+    main()
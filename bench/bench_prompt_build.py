@@ -0,0 +1,145 @@
+# 微基准：旧路径 build_prompt_messages + to_dict + json.dumps  vs  预编译模板 + 预编码静态前缀
+#
+# 用法：python bench/bench_prompt_build.py [--n 20000] [--history 20]
+# 注：新路径包含 context_packer 对历史的压缩渲染，两边 prompt 内容并不完全相同
+
+import argparse
+import json
+import logging
+import os
+import sys
+import time
+from typing import Any, Dict, List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("OPEN_API_KEY", "bench")
+os.environ.setdefault("DASHSCOPE_API_KEY", "bench")
+# 与旧路径逐条对比消息，使用按配置顺序输出的 sections 布局
+os.environ.setdefault("PROMPT_LAYOUT", "sections")
+
+from models.chat_models import ChatRequest  # noqa: E402
+from routers.chat import CHAT_PROMPTS_NAME, _build_chat_request, _get_payload_value, _load_chat_prompts  # noqa: E402
+from services.context_packer import stringify_value  # noqa: E402
+from services.llm_clients import _encode_body, _encode_messages  # noqa: E402
+from services.prompt_registry import prompt_registry  # noqa: E402
+
+
+def build_prompt_messages(prompts: Dict[str, Any], payload: Dict[str, Any]) -> List[Dict[str, str]]:
+    """旧的逐条模板替换组装路径（已从 routers/chat.py 移除），只作为基准对照保留在这里。"""
+    out: List[Dict[str, str]] = []
+
+    def _process(template: Dict[str, Any]) -> None:
+        role = template.get("role")
+        content = template.get("content")
+        if not role or content is None:
+            return
+
+        needArgs = template.get("needArgs") or []
+        # needArgs empty => keep content
+        if not needArgs:
+            out.append({"role": str(role), "content": str(content)})
+            return
+
+        # needArgs non-empty => all must exist and not None
+        resolved: Dict[str, Any] = {}
+        for k in needArgs:
+            v = _get_payload_value(payload, str(k))
+            if v is None:
+                return  # skip this message
+            resolved[str(k)] = v
+
+        rendered = str(content)
+
+        # inject raw payload values (stringify only for non-strings); the live path renders
+        # preChat / preDailySummary through services.context_packer
+        for k, v in resolved.items():
+            rendered_v = v if isinstance(v, str) else stringify_value(v)
+            rendered = rendered.replace("{" + str(k) + "}", rendered_v)
+
+        out.append({"role": str(role), "content": rendered})
+
+    # 1) system messages (highest priority)
+    for m in (prompts.get("systemMessages") or []):
+        if isinstance(m, dict):
+            _process(m)
+
+    # 2) context messages (optional, placed between system and user)
+    for m in (prompts.get("contextMessages") or []):
+        if isinstance(m, dict):
+            _process(m)
+
+    # 3) user messages
+    for m in (prompts.get("userMessages") or []):
+        if isinstance(m, dict):
+            _process(m)
+
+    return out
+
+
+def make_payload(history: int) -> dict:
+    pre_chat = []
+    for i in range(history):
+        pre_chat.append({"role": "user", "content": f"今天第{i}次聊天，我去公园散步了，心情还不错。", "ts": f"2026-01-01 {8 + i % 12:02d}:00"})
+        pre_chat.append({"role": "assistant", "content": "听起来很惬意呀，公园里人多吗？", "ts": f"2026-01-01 {8 + i % 12:02d}:01"})
+    return {
+        "message": "晚上好，我刚下班回家，有点累。",
+        "currentTime": "2026-01-01 21:30:00",
+        "args": {"lng": 121.473701, "lat": 31.230416},
+        "preChat": pre_chat,
+        "preDailySummary": [{"summaryDate": "2025-12-31", "articleTitle": "跨年夜", "memoryPoint": "和朋友一起跨年"}],
+    }
+
+
+def old_path(prompts: dict, payload: dict) -> bytes:
+    b = ChatRequest.builder().model("qwen-plus-character")
+    for m in build_prompt_messages(prompts, payload):
+        b.addMessage(m["role"], m["content"])
+    req = b.build()
+    msgs = [{"role": m.role, "content": m.content} for m in req.messages]
+    body = {"model": req.model, "input": {"messages": msgs}, "parameters": {"result_format": "text"}}
+    return json.dumps(body, ensure_ascii=False).encode("utf-8")
+
+
+def new_path(payload: dict) -> bytes:
+    req = _build_chat_request(payload, "", _load_chat_prompts())
+    return _encode_body(
+        {"model": req.model, "parameters": {"result_format": "text"}}, _encode_messages(req), "input"
+    )
+
+
+def bench(fn, n: int) -> float:
+    fn()
+    t0 = time.perf_counter()
+    for _ in range(n):
+        fn()
+    return (time.perf_counter() - t0) / n * 1e6
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--n", type=int, default=20000)
+    ap.add_argument("--history", type=int, default=20)
+    args = ap.parse_args()
+    # 避免每次打包的 INFO 日志干扰计时
+    logging.getLogger("uvicorn.error").setLevel(logging.WARNING)
+
+    prompts = prompt_registry.get(CHAT_PROMPTS_NAME)
+    payload = make_payload(args.history)
+
+    # 静态前缀与消息条数必须一致（preChat / preDailySummary 在新路径中经 context_packer 压缩）
+    old_msgs = json.loads(old_path(prompts, payload))["input"]["messages"]
+    new_msgs = json.loads(new_path(payload))["input"]["messages"]
+    assert len(old_msgs) == len(new_msgs)
+    static = _load_chat_prompts().static_count
+    assert old_msgs[:static] == new_msgs[:static]
+
+    old_us = bench(lambda: old_path(prompts, payload), args.n)
+    new_us = bench(lambda: new_path(payload), args.n)
+    print(f"history={args.history} n={args.n}")
+    print(f"old  build_prompt_messages+to_dict+dumps : {old_us:8.2f} us/op")
+    print(f"new  compiled+pre-encoded prefix         : {new_us:8.2f} us/op")
+    print(f"speedup: {old_us / new_us:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,256 @@
+# 本地假上游：同时模拟 DashScope generation 与 OpenAI chat/completions（流式 / 非流式），
+# 可配置延迟分布、错误率与 429 注入，用于压测时替代真实接口。
+#
+# 用法：
+#   python bench/fake_upstream.py --port 9100 --latency lognormal:0.8,0.4 --error-rate 0.01 --rate-429 0.02
+#   DASH_URL=http://127.0.0.1:9100/api/v1/services/aigc/text-generation/generation \
+#   OPEN_URL=http://127.0.0.1:9100/v1/chat/completions uvicorn main:app --port 8001
+#
+# 延迟分布（总耗时，秒；流式时均摊到各 token 间隔）：
+#   fixed:S | uniform:LO,HI | lognormal:MEDIAN,SIGMA | exp:MEAN
+# 前缀缓存：第一条消息（静态 system 前缀）出现过时，usage.prompt_tokens_details.cached_tokens 报告其 token 数
+# 统计：GET /_stats
+
+import argparse
+import asyncio
+import json
+import math
+import random
+import time
+import uuid
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+DASH_PATH = "/api/v1/services/aigc/text-generation/generation"
+OPEN_PATH = "/v1/chat/completions"
+
+_CHAT_REPLY = "嗯嗯，听起来你今天过得挺充实的～下班路上有没有看到什么好玩的？累了就早点休息，明天还要元气满满哦。"
+_SUMMARY_REPLY = json.dumps(
+    {
+        "articleTitle": "平凡又温柔的一天",
+        "moodKeywords": "放松,满足",
+        "actionKeywords": "散步,下班,聊天",
+        "memoryPoint": "傍晚在公园散步，看到了很美的晚霞",
+        "analyzeResult": "整体情绪平稳偏积极，工作后的疲惫通过散步得到缓解。",
+        "article": "今天是平凡又温柔的一天。" * 12,
+    },
+    ensure_ascii=False,
+)
+
+
+def parse_latency(spec: str) -> Callable[[], float]:
+    kind, _, args = spec.partition(":")
+    nums = [float(x) for x in args.split(",") if x]
+    if kind == "fixed":
+        return lambda: nums[0]
+    if kind == "uniform":
+        return lambda: random.uniform(nums[0], nums[1])
+    if kind == "lognormal":
+        mu = math.log(nums[0])
+        return lambda: random.lognormvariate(mu, nums[1])
+    if kind == "exp":
+        return lambda: random.expovariate(1.0 / nums[0])
+    raise ValueError(f"unknown latency spec: {spec}")
+
+
+@dataclass
+class FakeConfig:
+    latency: Callable[[], float] = field(default_factory=lambda: parse_latency("fixed:0.2"))
+    ttft: Callable[[], float] = field(default_factory=lambda: parse_latency("fixed:0.1"))
+    error_rate: float = 0.0
+    rate_429: float = 0.0
+    chunk_chars: int = 4
+
+
+@dataclass
+class FakeStats:
+    requests: int = 0
+    streamed: int = 0
+    injected_429: int = 0
+    injected_5xx: int = 0
+    inflight: int = 0
+    prefix_cache_hits: int = 0
+    peak_inflight: int = 0
+    by_api: Dict[str, int] = field(default_factory=dict)
+
+
+def _messages(body: Dict[str, Any]) -> List[Dict[str, Any]]:
+    msgs = body.get("messages")
+    if msgs is None:
+        msgs = (body.get("input") or {}).get("messages")
+    return msgs if isinstance(msgs, list) else []
+
+
+def _reply_for(messages: List[Dict[str, Any]]) -> str:
+    # summary 提示词要求输出 JSON（含 articleTitle）；其余按聊天回复处理
+    for m in messages:
+        if "articleTitle" in str(m.get("content", "")):
+            return _SUMMARY_REPLY
+    return _CHAT_REPLY
+
+
+def _prompt_tokens(messages: List[Dict[str, Any]]) -> int:
+    return sum(len(str(m.get("content", ""))) for m in messages) // 2
+
+
+def _cached_tokens(messages: List[Dict[str, Any]], seen: set) -> int:
+    if not messages:
+        return 0
+    first = str(messages[0].get("content", ""))
+    if first in seen:
+        return len(first) // 2
+    seen.add(first)
+    return 0
+
+
+def _chunks(text: str, size: int) -> List[str]:
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+
+def create_app(cfg: FakeConfig) -> FastAPI:
+    app = FastAPI(title="fake upstream")
+    stats = FakeStats()
+    prefixes: set = set()
+
+    def _usage_details(messages: List[Dict[str, Any]]) -> Dict[str, Any]:
+        cached = _cached_tokens(messages, prefixes)
+        if cached:
+            stats.prefix_cache_hits += 1
+        return {"prompt_tokens_details": {"cached_tokens": cached}}
+
+    def _inject(api: str):
+        stats.requests += 1
+        stats.by_api[api] = stats.by_api.get(api, 0) + 1
+        r = random.random()
+        if r < cfg.rate_429:
+            stats.injected_429 += 1
+            return JSONResponse({"code": "Throttling.RateQuota", "message": "Requests rate limit exceeded"}, 429)
+        if r < cfg.rate_429 + cfg.error_rate:
+            stats.injected_5xx += 1
+            return JSONResponse({"code": "InternalError", "message": "injected failure"}, 503)
+        return None
+
+    async def _hold(seconds: float):
+        stats.inflight += 1
+        stats.peak_inflight = max(stats.peak_inflight, stats.inflight)
+        try:
+            await asyncio.sleep(max(0.0, seconds))
+        finally:
+            stats.inflight -= 1
+
+    def _stream(events, first_delay: float, total: float, n: int):
+        gap = max(0.0, total - first_delay) / max(1, n)
+
+        async def _gen():
+            stats.streamed += 1
+            stats.inflight += 1
+            stats.peak_inflight = max(stats.peak_inflight, stats.inflight)
+            try:
+                await asyncio.sleep(max(0.0, first_delay))
+                for i, ev in enumerate(events):
+                    if i:
+                        await asyncio.sleep(gap)
+                    yield ev
+            finally:
+                stats.inflight -= 1
+
+        return StreamingResponse(_gen(), media_type="text/event-stream")
+
+    @app.post(DASH_PATH)
+    async def dashscope(request: Request):
+        err = _inject("dashscope")
+        if err is not None:
+            return err
+        body = await request.json()
+        messages = _messages(body)
+        reply = _reply_for(messages)
+        usage_in = _prompt_tokens(messages)
+        details = _usage_details(messages)
+        rid = uuid.uuid4().hex
+        if request.headers.get("x-dashscope-sse", "").lower() == "enable":
+            parts = _chunks(reply, cfg.chunk_chars)
+            events = []
+            for i, part in enumerate(parts):
+                data = {
+                    "output": {"text": part, "finish_reason": "stop" if i == len(parts) - 1 else "null"},
+                    "usage": {"input_tokens": usage_in, "output_tokens": i + 1, **details},
+                    "request_id": rid,
+                }
+                events.append(f"id:{i + 1}\nevent:result\ndata:{json.dumps(data, ensure_ascii=False)}\n\n")
+            return _stream(events, cfg.ttft(), cfg.latency(), len(events))
+        await _hold(cfg.latency())
+        return {
+            "output": {"text": reply, "finish_reason": "stop"},
+            "usage": {"input_tokens": usage_in, "output_tokens": len(reply) // 2, **details},
+            "request_id": rid,
+        }
+
+    @app.post(OPEN_PATH)
+    async def openai(request: Request):
+        err = _inject("openai")
+        if err is not None:
+            return err
+        body = await request.json()
+        messages = _messages(body)
+        reply = _reply_for(messages)
+        usage = {
+            "prompt_tokens": _prompt_tokens(messages),
+            "completion_tokens": len(reply) // 2,
+            **_usage_details(messages),
+        }
+        cid = "chatcmpl-" + uuid.uuid4().hex[:12]
+        if body.get("stream"):
+            events = []
+            for part in _chunks(reply, cfg.chunk_chars):
+                chunk = {"id": cid, "object": "chat.completion.chunk", "choices": [{"index": 0, "delta": {"content": part}}]}
+                events.append(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n")
+            if (body.get("stream_options") or {}).get("include_usage"):
+                events.append(f"data: {json.dumps({'id': cid, 'choices': [], 'usage': usage})}\n\n")
+            events.append("data: [DONE]\n\n")
+            return _stream(events, cfg.ttft(), cfg.latency(), len(events))
+        await _hold(cfg.latency())
+        return {
+            "id": cid,
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model"),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": reply}, "finish_reason": "stop"}],
+            "usage": usage,
+        }
+
+    @app.get("/_stats")
+    def fake_stats():
+        return stats.__dict__
+
+    return app
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="fake DashScope / OpenAI upstream")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=9100)
+    ap.add_argument("--latency", default="lognormal:0.8,0.4", help="总耗时分布")
+    ap.add_argument("--ttft", default="lognormal:0.3,0.3", help="流式首 token 延迟分布")
+    ap.add_argument("--error-rate", type=float, default=0.0, help="503 注入比例")
+    ap.add_argument("--rate-429", type=float, default=0.0, help="429 注入比例")
+    ap.add_argument("--chunk-chars", type=int, default=4, help="流式每帧字符数")
+    ap.add_argument("--seed", type=int, default=None)
+    args = ap.parse_args()
+    if args.seed is not None:
+        random.seed(args.seed)
+    cfg = FakeConfig(
+        latency=parse_latency(args.latency),
+        ttft=parse_latency(args.ttft),
+        error_rate=args.error_rate,
+        rate_429=args.rate_429,
+        chunk_chars=args.chunk_chars,
+    )
+    uvicorn.run(create_app(cfg), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,381 @@
+# 压测：驱动 /ws/chat 与 /summary/daily，输出 p50/p95/p99、RPS、服务端内存，结果可跨 commit 对比
+#
+# 用法：
+#   # 一键：拉起假上游 + 服务（uvicorn main:app），压测后自动关闭
+#   python bench/loadgen.py --spawn --scenario mixed --concurrency 32 --duration 30 --out /tmp/run.json
+#   # 对已运行的服务压测（--server-pid 用于采样 RSS）
+#   python bench/loadgen.py --target http://127.0.0.1:8001 --server-pid 12345 --scenario chat --stream
+#   # 与上一次结果对比
+#   python bench/loadgen.py --spawn --compare /tmp/base.json --out /tmp/new.json
+#
+# 同一组参数 + --seed 下请求序列固定；假上游的延迟分布见 bench/fake_upstream.py。
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import signal
+import subprocess
+import sys
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+import httpx
+import websockets
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+_TOPICS = ["去公园散步", "加班到很晚", "和朋友吃火锅", "看了一部电影", "在家做饭", "跑步五公里", "逛超市", "学习新技能"]
+_MOODS = ["开心", "有点累", "平静", "焦虑", "满足", "无聊"]
+
+
+# ================= 请求构造 =================
+
+def _ts(day: int, minute: int) -> str:
+    return f"2026-01-{1 + day % 28:02d} {8 + minute // 60 % 14:02d}:{minute % 60:02d}"
+
+
+def make_chat_payload(rng: random.Random, history: int, stream: bool) -> Dict[str, Any]:
+    pre_chat = []
+    for i in range(history):
+        topic = rng.choice(_TOPICS)
+        pre_chat.append({"role": "user", "content": f"今天{topic}，感觉{rng.choice(_MOODS)}。", "ts": _ts(0, i * 3)})
+        pre_chat.append({"role": "assistant", "content": f"{topic}听起来不错呀，后来怎么样了？", "ts": _ts(0, i * 3 + 1)})
+    payload: Dict[str, Any] = {
+        "message": f"晚上好，我刚{rng.choice(_TOPICS)}，现在{rng.choice(_MOODS)}。",
+        "currentTime": "2026-01-01 21:30:00",
+        "args": {"lng": 121.4737, "lat": 31.2304},
+        "preChat": pre_chat,
+        "preDailySummary": [
+            {"summaryDate": f"2025-12-{31 - d:02d}", "articleTitle": rng.choice(_TOPICS), "memoryPoint": rng.choice(_TOPICS)}
+            for d in range(rng.randint(0, 5))
+        ],
+    }
+    if stream:
+        payload["stream"] = True
+    return payload
+
+
+def make_summary_payload(rng: random.Random, openid: str, unique: bool) -> Dict[str, Any]:
+    lines = []
+    for i in range(rng.randint(6, 30)):
+        lines.append(f"[{_ts(0, i * 7)}] U:今天{rng.choice(_TOPICS)}，{rng.choice(_MOODS)}")
+        lines.append(f"[{_ts(0, i * 7 + 1)}] A:真好呀，记得照顾好自己")
+    if unique:
+        lines.append(f"#{rng.getrandbits(48):x}")  # 避免命中 summary 缓存
+    return {
+        "type": "daily_summary",
+        "openid": openid,
+        "text": "\n".join(lines),
+        "preDailySummary": [
+            {
+                "article": "平静的一天。" * 5,
+                "moodKeywords": rng.choice(_MOODS),
+                "actionKeywords": rng.choice(_TOPICS),
+                "articleTitle": rng.choice(_TOPICS),
+                "analyzeResult": "情绪平稳",
+                "memoryPoint": rng.choice(_TOPICS),
+                "summaryDate": f"2025-12-{31 - d:02d}",
+            }
+            for d in range(rng.randint(0, 3))
+        ],
+    }
+
+
+# ================= 结果统计 =================
+
+@dataclass
+class Samples:
+    latencies: List[float] = field(default_factory=list)
+    ttfb: List[float] = field(default_factory=list)
+    errors: Dict[str, int] = field(default_factory=dict)
+
+    def error(self, kind: str) -> None:
+        self.errors[kind] = self.errors.get(kind, 0) + 1
+
+
+def _pct(data: List[float], p: float) -> Optional[float]:
+    if not data:
+        return None
+    data = sorted(data)
+    return round(data[min(len(data) - 1, int(p * len(data)))] * 1000, 1)
+
+
+def summarize(s: Samples, seconds: float) -> Dict[str, Any]:
+    n_err = sum(s.errors.values())
+    out: Dict[str, Any] = {
+        "ok": len(s.latencies),
+        "errors": s.errors,
+        "error_rate": round(n_err / (len(s.latencies) + n_err), 4) if (s.latencies or n_err) else 0.0,
+        "rps": round(len(s.latencies) / seconds, 2) if seconds > 0 else 0.0,
+        "p50_ms": _pct(s.latencies, 0.50),
+        "p95_ms": _pct(s.latencies, 0.95),
+        "p99_ms": _pct(s.latencies, 0.99),
+        "max_ms": _pct(s.latencies, 1.0),
+    }
+    if s.ttfb:
+        out["ttfb_p50_ms"] = _pct(s.ttfb, 0.50)
+        out["ttfb_p95_ms"] = _pct(s.ttfb, 0.95)
+        out["ttfb_p99_ms"] = _pct(s.ttfb, 0.99)
+    return out
+
+
+# ================= 内存采样 =================
+
+def _rss_mb(pid: int) -> Optional[float]:
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except (OSError, ValueError):
+        pass
+    return None
+
+
+async def sample_memory(pid: int, out: Dict[str, Any], stop: asyncio.Event) -> None:
+    out["rss_start_mb"] = _rss_mb(pid)
+    peak = out["rss_start_mb"] or 0.0
+    while not stop.is_set():
+        rss = _rss_mb(pid)
+        if rss is not None:
+            peak = max(peak, rss)
+        try:
+            await asyncio.wait_for(stop.wait(), timeout=0.5)
+        except asyncio.TimeoutError:
+            pass
+    out["rss_peak_mb"] = round(peak, 1)
+    end = _rss_mb(pid)
+    out["rss_end_mb"] = round(end, 1) if end is not None else None
+    if out["rss_start_mb"] is not None:
+        out["rss_start_mb"] = round(out["rss_start_mb"], 1)
+
+
+# ================= 虚拟用户 =================
+
+async def chat_user(args, uid: int, deadline: float, warm_until: float, s: Samples) -> None:
+    rng = random.Random(args.seed * 1000 + uid)
+    url = args.target.replace("http", "ws", 1) + "/ws/chat"
+    while time.monotonic() < deadline:
+        try:
+            async with websockets.connect(url, max_size=None, open_timeout=10) as ws:
+                while time.monotonic() < deadline:
+                    payload = make_chat_payload(rng, rng.randint(0, args.history), args.stream)
+                    start = time.monotonic()
+                    first = None
+                    await ws.send(json.dumps(payload, ensure_ascii=False))
+                    while True:
+                        frame = json.loads(await asyncio.wait_for(ws.recv(), timeout=args.timeout))
+                        if "delta" in frame:
+                            first = first or time.monotonic()
+                            continue
+                        break
+                    end = time.monotonic()
+                    if start < warm_until:
+                        continue
+                    if frame.get("error") or not frame.get("reply"):
+                        s.error("empty_reply" if not frame.get("error") else "upstream_error")
+                        continue
+                    s.latencies.append(end - start)
+                    if first is not None:
+                        s.ttfb.append(first - start)
+        except (OSError, asyncio.TimeoutError, websockets.exceptions.WebSocketException) as e:
+            if time.monotonic() >= warm_until:
+                s.error(type(e).__name__)
+            await asyncio.sleep(0.1)
+
+
+async def summary_user(args, uid: int, deadline: float, warm_until: float, s: Samples, client: httpx.AsyncClient) -> None:
+    rng = random.Random(args.seed * 1000 + 500 + uid)
+    while time.monotonic() < deadline:
+        payload = make_summary_payload(rng, f"load-{uid % 64}", rng.random() >= args.cache_ratio)
+        start = time.monotonic()
+        try:
+            r = await client.post(args.target + "/summary/daily", json=payload, timeout=args.timeout)
+            kind = None if r.status_code == 200 else f"http_{r.status_code}"
+        except httpx.HTTPError as e:
+            kind = type(e).__name__
+        end = time.monotonic()
+        if start < warm_until:
+            continue
+        if kind:
+            s.error(kind)
+        else:
+            s.latencies.append(end - start)
+
+
+async def run_load(args, server_pid: Optional[int]) -> Dict[str, Any]:
+    scenarios = ["chat", "summary"] if args.scenario == "mixed" else [args.scenario]
+    samples = {name: Samples() for name in scenarios}
+    memory: Dict[str, Any] = {}
+    stop = asyncio.Event()
+    mem_task = asyncio.create_task(sample_memory(server_pid, memory, stop)) if server_pid else None
+
+    start = time.monotonic()
+    warm_until = start + args.warmup
+    deadline = warm_until + args.duration
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(limits=limits) as client:
+        tasks = []
+        for uid in range(args.concurrency):
+            name = scenarios[uid % len(scenarios)]
+            if name == "chat":
+                tasks.append(chat_user(args, uid, deadline, warm_until, samples[name]))
+            else:
+                tasks.append(summary_user(args, uid, deadline, warm_until, samples[name], client))
+        await asyncio.gather(*tasks)
+    measured = time.monotonic() - warm_until
+
+    stop.set()
+    if mem_task:
+        await mem_task
+    return {
+        "measured_seconds": round(measured, 2),
+        "scenarios": {name: summarize(s, measured) for name, s in samples.items()},
+        "memory": memory,
+    }
+
+
+# ================= 拉起假上游 + 服务 =================
+
+def _wait_http(url: str, timeout: float = 20.0) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(url, timeout=1.0).status_code < 500:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"service not ready: {url}")
+
+
+def spawn(args) -> List[subprocess.Popen]:
+    fake_base = f"http://127.0.0.1:{args.fake_port}"
+    fake = subprocess.Popen(
+        [sys.executable, os.path.join(ROOT, "bench", "fake_upstream.py"), "--port", str(args.fake_port),
+         "--latency", args.fake_latency, "--ttft", args.fake_ttft,
+         "--error-rate", str(args.fake_error_rate), "--rate-429", str(args.fake_429), "--seed", str(args.seed)],
+        cwd=ROOT,
+    )
+    env = {
+        **os.environ,
+        "DASH_URL": fake_base + "/api/v1/services/aigc/text-generation/generation",
+        "OPEN_URL": fake_base + "/v1/chat/completions",
+        "OPEN_API_KEY": os.environ.get("OPEN_API_KEY", "bench"),
+        "DASHSCOPE_API_KEY": os.environ.get("DASHSCOPE_API_KEY", "bench"),
+        "DATA_DIR": os.environ.get("DATA_DIR", "/tmp/agent-bench-data"),
+        "LOG_LEVEL": os.environ.get("LOG_LEVEL", "WARNING"),
+    }
+    port = args.target.rsplit(":", 1)[-1].strip("/")
+    app = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", port, "--log-level", "warning"],
+        cwd=ROOT, env=env,
+    )
+    procs = [fake, app]
+    try:
+        _wait_http(fake_base + "/_stats")
+        _wait_http(args.target + "/healthz")
+    except Exception:
+        stop_procs(procs)
+        raise
+    return procs
+
+
+def stop_procs(procs: List[subprocess.Popen]) -> None:
+    for p in reversed(procs):
+        if p.poll() is None:
+            p.send_signal(signal.SIGINT)
+    for p in procs:
+        try:
+            p.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            p.kill()
+
+
+# ================= 报告 =================
+
+def _git_rev() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, text=True).strip()
+    except Exception:
+        return "unknown"
+
+
+_COLUMNS = ("ok", "rps", "error_rate", "p50_ms", "p95_ms", "p99_ms", "max_ms", "ttfb_p50_ms", "ttfb_p95_ms")
+
+
+def print_report(result: Dict[str, Any], base: Optional[Dict[str, Any]] = None) -> None:
+    meta = result["meta"]
+    print(f"\nrev={meta['rev']} scenario={meta['args']['scenario']} concurrency={meta['args']['concurrency']} "
+          f"measured={result['measured_seconds']}s")
+    for name, cur in result["scenarios"].items():
+        old = (base or {}).get("scenarios", {}).get(name, {})
+        print(f"[{name}] errors={cur['errors']}")
+        for col in _COLUMNS:
+            if cur.get(col) is None:
+                continue
+            line = f"  {col:<12} {cur[col]:>10}"
+            if isinstance(old.get(col), (int, float)) and old[col]:
+                line += f"   base {old[col]:>10}  ({(cur[col] - old[col]) / old[col] * 100:+.1f}%)"
+            print(line)
+    mem = result.get("memory") or {}
+    if mem:
+        base_mem = (base or {}).get("memory") or {}
+        extra = f"   base peak {base_mem.get('rss_peak_mb')} MB" if base_mem else ""
+        print(f"[memory] start={mem.get('rss_start_mb')} MB peak={mem.get('rss_peak_mb')} MB end={mem.get('rss_end_mb')} MB{extra}")
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="load generator for /ws/chat and /summary/daily")
+    ap.add_argument("--target", default="http://127.0.0.1:8001")
+    ap.add_argument("--scenario", choices=("chat", "summary", "mixed"), default="mixed")
+    ap.add_argument("--concurrency", type=int, default=16, help="虚拟用户数（chat 每个用户一条长连接）")
+    ap.add_argument("--duration", type=float, default=30.0, help="统计时长（秒），不含预热")
+    ap.add_argument("--warmup", type=float, default=3.0)
+    ap.add_argument("--timeout", type=float, default=60.0)
+    ap.add_argument("--stream", action="store_true", help="chat 使用流式协议（统计首 token 延迟）")
+    ap.add_argument("--history", type=int, default=20, help="chat preChat 最多轮数（随机 0..N）")
+    ap.add_argument("--cache-ratio", type=float, default=0.0, help="summary 请求中允许命中缓存的比例")
+    ap.add_argument("--seed", type=int, default=42)
+    ap.add_argument("--server-pid", type=int, default=None, help="采样该进程 RSS")
+    ap.add_argument("--out", default=None, help="结果 JSON 输出路径")
+    ap.add_argument("--compare", default=None, help="与之前输出的结果 JSON 对比")
+    ap.add_argument("--spawn", action="store_true", help="自动拉起假上游与服务")
+    ap.add_argument("--fake-port", type=int, default=9100)
+    ap.add_argument("--fake-latency", default="lognormal:0.8,0.4")
+    ap.add_argument("--fake-ttft", default="lognormal:0.3,0.3")
+    ap.add_argument("--fake-error-rate", type=float, default=0.0)
+    ap.add_argument("--fake-429", type=float, default=0.0)
+    args = ap.parse_args()
+    args.target = args.target.rstrip("/")
+
+    procs: List[subprocess.Popen] = []
+    if args.spawn:
+        procs = spawn(args)
+    server_pid = args.server_pid or (procs[1].pid if procs else None)
+    try:
+        result = asyncio.run(run_load(args, server_pid))
+    finally:
+        stop_procs(procs)
+
+    result["meta"] = {
+        "rev": _git_rev(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": sys.version.split()[0],
+        "args": vars(args),
+    }
+    base = None
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            base = json.load(f)
+    print_report(result, base)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
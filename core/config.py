@@ -10,8 +10,196 @@ if not OPEN_API_KEY:
 if not DASHSCOPE_API_KEY:
     raise RuntimeError("请先在环境变量里设置 DASHSCOPE_API_KEY")
 
-DASH_URL = "https://dashscope.aliyuncs.com/api/v1/services/aigc/text-generation/generation"
-OPEN_URL = "https://api.openai.com/v1/chat/completions"
+# 可指向本地 stub（bench/fake_upstream.py）做压测
+DASH_URL = os.getenv("DASH_URL", "https://dashscope.aliyuncs.com/api/v1/services/aigc/text-generation/generation")
+OPEN_URL = os.getenv("OPEN_URL", "https://api.openai.com/v1/chat/completions")
 DEFAULT_CHAT_MODEL = "qwen-plus-character"
 DEFAULT_MODEL = "qwen-plus"
-QIANWEN_MAX = "qwen3-max"
\ No newline at end of file
+QIANWEN_MAX = "qwen3-max"
+
+# === 上游 HTTP 连接池（每个 provider 一个长连接 client）===
+HTTP_POOL_MAX_CONNECTIONS = int(os.getenv("HTTP_POOL_MAX_CONNECTIONS", "100"))
+HTTP_POOL_MAX_KEEPALIVE = int(os.getenv("HTTP_POOL_MAX_KEEPALIVE", "20"))
+HTTP_POOL_KEEPALIVE_EXPIRY = float(os.getenv("HTTP_POOL_KEEPALIVE_EXPIRY", "60"))
+# 需要安装 h2（pip install httpx[http2]），未安装时自动退回 HTTP/1.1
+HTTP2_ENABLED = os.getenv("HTTP2_ENABLED", "0") == "1"
+
+# === 上游超时（秒）===
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "10"))
+# provider 默认 read 超时
+PROVIDER_TIMEOUTS = {
+    "openai": float(os.getenv("OPENAI_TIMEOUT", "20")),
+    "dashscope": float(os.getenv("DASHSCOPE_TIMEOUT", "300")),
+}
+# 按路由覆盖 read 超时；未配置时使用 provider 默认值
+ROUTE_TIMEOUTS = {
+    "chat": float(os.getenv("LLM_TIMEOUT_CHAT", "0")) or None,
+    "summary": float(os.getenv("LLM_TIMEOUT_SUMMARY", "0")) or None,
+    "compact": float(os.getenv("LLM_TIMEOUT_COMPACT", "0")) or None,   # 会话后台压缩
+}
+
+# === 服务进程（serve.py）/ 优雅下线 ===
+SERVE_HOST = os.getenv("SERVE_HOST", "0.0.0.0")
+SERVE_PORT = int(os.getenv("SERVE_PORT", "8001"))
+# worker 进程数；0 表示按可用 CPU（含容器 CPU 配额）自动计算。serve.py 会把实际值写回该变量供各 worker 读取
+SERVE_WORKERS = int(os.getenv("SERVE_WORKERS", "0"))
+# 收到 SIGTERM 后等待进行中的 /ws/chat 回复发完的最长时间（秒）；容器的停止宽限期应大于该值
+SHUTDOWN_DRAIN_SECONDS = float(os.getenv("SHUTDOWN_DRAIN_SECONDS", "25"))
+# 指标按 worker 统计：>0 时每个 worker 另在 METRICS_PORT .. METRICS_PORT + worker 数 - 1 中的一个端口暴露 /metrics
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+
+# === 启动预热（完成后 /readyz 才返回 200）===
+WARMUP_ENABLED = os.getenv("WARMUP_ENABLED", "1") == "1"
+WARMUP_CONNECTIONS = int(os.getenv("WARMUP_CONNECTIONS", "2"))   # 每个 provider 预先建立的连接数
+WARMUP_TIMEOUT = float(os.getenv("WARMUP_TIMEOUT", "15"))        # 预热总时长上限（秒），超时也标记就绪
+# 预热结束前对这些模型各发一次 max_tokens=1 的探测请求（会产生少量 token 消耗）；为空则不发
+WARMUP_PROBE_MODELS = [m.strip() for m in os.getenv("WARMUP_PROBE_MODELS", "").split(",") if m.strip()]
+
+# === 提示词组装 ===
+# consolidated：静态 system 指令合并为一条稳定前缀，动态内容（时间 / 定位 / 历史）全部放在其后，利于上游前缀缓存；
+# sections：按配置文件顺序逐条输出
+PROMPT_LAYOUT = os.getenv("PROMPT_LAYOUT", "consolidated").lower()
+
+# === 提示词配置热加载 ===
+PROMPT_CONFIG_DIR = os.getenv(
+    "PROMPT_CONFIG_DIR",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "config"),
+)
+# mtime 轮询间隔（秒）；安装了 watchfiles 时优先使用文件系统事件（inotify）
+PROMPT_RELOAD_INTERVAL = float(os.getenv("PROMPT_RELOAD_INTERVAL", "2"))
+
+# === daily summary 结果缓存（内存 LRU + SQLite）===
+DATA_DIR = os.getenv(
+    "DATA_DIR",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data"),
+)
+SUMMARY_CACHE_ENABLED = os.getenv("SUMMARY_CACHE_ENABLED", "1") == "1"
+SUMMARY_CACHE_MAX_ITEMS = int(os.getenv("SUMMARY_CACHE_MAX_ITEMS", "1024"))
+SUMMARY_CACHE_TTL = float(os.getenv("SUMMARY_CACHE_TTL", "3600"))
+# 为空则不启用磁盘层
+SUMMARY_CACHE_DB = os.getenv("SUMMARY_CACHE_DB", os.path.join(DATA_DIR, "summary_cache.sqlite3"))
+SUMMARY_CACHE_DISK_TTL = float(os.getenv("SUMMARY_CACHE_DISK_TTL", str(7 * 24 * 3600)))
+
+# === 业务时区：用户在国内，"今天" 与落库的时间戳按这个时区计算（服务器本身通常是 UTC）===
+BUSINESS_TZ = os.getenv("BUSINESS_TZ", "Asia/Shanghai")
+
+# === 用户身份（服务端存储的历史只对通过校验的 openid 开放）===
+# token = "<openid>.<过期 unix 时间>.<HMAC-SHA256 签名>"，由持有同一密钥的登录服务签发；
+# /ws/chat 通过 ?token= 或 Authorization: Bearer 传入，HTTP 接口通过 Authorization: Bearer。为空时所有 token 都无效
+USER_TOKEN_SECRET = os.getenv("USER_TOKEN_SECRET", "")
+
+# === 用户记忆（按 openid 持久化每日总结与聊天轮次，客户端可不再上传历史）===
+# 只对通过 token 校验的 openid 读写（需要配置 USER_TOKEN_SECRET），默认关闭
+USER_MEMORY_ENABLED = os.getenv("USER_MEMORY_ENABLED", "0") == "1"
+# 为空则只保留内存层
+USER_MEMORY_DB = os.getenv("USER_MEMORY_DB", os.path.join(DATA_DIR, "user_memory.sqlite3"))
+USER_MEMORY_HOT_USERS = int(os.getenv("USER_MEMORY_HOT_USERS", "2000"))        # 常驻内存的用户数（LRU）
+# 内存层条目的有效期（秒）：多 worker 时其他 worker 写入的内容最迟这么久后可见；<=0 表示不过期
+USER_MEMORY_HOT_TTL = float(os.getenv("USER_MEMORY_HOT_TTL", "30"))
+USER_MEMORY_MAX_SUMMARIES = int(os.getenv("USER_MEMORY_MAX_SUMMARIES", "366"))  # 每个用户保留的总结条数
+USER_MEMORY_MAX_TURNS = int(os.getenv("USER_MEMORY_MAX_TURNS", "200"))          # 每个用户保留的聊天消息条数
+
+# === 并发请求合并（single-flight）/ 幂等键 ===
+# 完成结果保留时间（秒），窗口内的迟到重试直接复用
+SINGLEFLIGHT_RESULT_TTL = float(os.getenv("SINGLEFLIGHT_RESULT_TTL", "60"))
+
+# === 上下文打包：各段历史注入的 token 预算（<=0 表示不限制）===
+CONTEXT_BUDGET_PRECHAT = int(os.getenv("CONTEXT_BUDGET_PRECHAT", "1500"))
+CONTEXT_BUDGET_PREDAILY = int(os.getenv("CONTEXT_BUDGET_PREDAILY", "600"))
+# /summary/daily 中“用户之前的每日总结”段
+CONTEXT_BUDGET_SUMMARY_HISTORY = int(os.getenv("CONTEXT_BUDGET_SUMMARY_HISTORY", "1200"))
+
+# === 历史每日总结检索（/ws/chat 的 {preDailySummary}）===
+# 开启后按当前消息从历史总结中检索 top-k 条注入，而不是整段注入。
+# 有已校验身份时检索该用户的索引，否则只在本连接上传过的总结中检索
+MEMORY_RETRIEVAL_ENABLED = os.getenv("MEMORY_RETRIEVAL_ENABLED", "1") == "1"
+MEMORY_TOP_K = int(os.getenv("MEMORY_TOP_K", "3"))
+MEMORY_MAX_USERS = int(os.getenv("MEMORY_MAX_USERS", "10000"))          # 进程内保留索引的用户数（LRU）
+MEMORY_MAX_DOCS_PER_USER = int(os.getenv("MEMORY_MAX_DOCS_PER_USER", "366"))
+
+# === /ws/chat 连接 ===
+# 单个连接排队（含已被取代、待回 cancelled 帧）的消息上限；超过时以 1008 关闭连接
+WS_MAX_PENDING_TURNS = int(os.getenv("WS_MAX_PENDING_TURNS", "16"))
+
+# === /ws/chat 服务端会话 ===
+SESSION_TTL = float(os.getenv("SESSION_TTL", "1800"))            # 断线后可恢复的时间窗口（秒）
+SESSION_MAX_SESSIONS = int(os.getenv("SESSION_MAX_SESSIONS", "10000"))
+SESSION_COMPACT_THRESHOLD = int(os.getenv("SESSION_COMPACT_THRESHOLD", "30"))  # 超过该条数触发后台压缩
+SESSION_KEEP_RECENT = int(os.getenv("SESSION_KEEP_RECENT", "10"))  # 压缩时保留的最近条数
+SESSION_MAX_TURNS = int(os.getenv("SESSION_MAX_TURNS", "200"))     # 压缩失败时的硬上限
+SESSION_COMPACT_MODEL = os.getenv("SESSION_COMPACT_MODEL", DEFAULT_MODEL)
+
+# === 上游限流（按 provider / model）===
+# 默认值按 provider；可用 LLM_LIMITS 覆盖，key 为 "provider" 或 "provider:model"，例如
+#   LLM_LIMITS='{"dashscope:qwen3-max": {"rps": 2, "tpm": 60000, "concurrency": 4}}'
+# rps / tpm <= 0 表示不限；concurrency 为 AIMD 的初始并发上限
+# "provider" 是整个 provider 的总上限；"provider:model" 是在总上限之内对该模型的额外限制（未写的项不限）。
+# 没有单独配置的模型只受 provider 总上限约束。
+LLM_LIMIT_DEFAULTS = {
+    "dashscope": {
+        "rps": float(os.getenv("DASHSCOPE_LIMIT_RPS", "15")),
+        "tpm": float(os.getenv("DASHSCOPE_LIMIT_TPM", "1000000")),
+        "concurrency": int(os.getenv("DASHSCOPE_LIMIT_CONCURRENCY", "32")),
+    },
+    "openai": {
+        "rps": float(os.getenv("OPENAI_LIMIT_RPS", "8")),
+        "tpm": float(os.getenv("OPENAI_LIMIT_TPM", "400000")),
+        "concurrency": int(os.getenv("OPENAI_LIMIT_CONCURRENCY", "16")),
+    },
+}
+LLM_LIMITS = os.getenv("LLM_LIMITS", "")
+LLM_LIMIT_MIN_CONCURRENCY = int(os.getenv("LLM_LIMIT_MIN_CONCURRENCY", "1"))
+LLM_LIMIT_MAX_CONCURRENCY = int(os.getenv("LLM_LIMIT_MAX_CONCURRENCY", "128"))
+# 本地排队最长等待（秒），超时返回 503 而不是继续堆积
+LLM_LIMIT_MAX_WAIT = float(os.getenv("LLM_LIMIT_MAX_WAIT", "10"))
+
+# === 调用韧性：重试 / 对冲请求 / 熔断 / 跨 provider 切换 ===
+RETRY_ATTEMPTS = int(os.getenv("RETRY_ATTEMPTS", "2"))             # 瞬时错误的重试次数（不含首次）
+RETRY_BASE_DELAY = float(os.getenv("RETRY_BASE_DELAY", "0.5"))
+RETRY_MAX_DELAY = float(os.getenv("RETRY_MAX_DELAY", "8"))
+# 对冲：请求耗时超过该路由历史延迟的分位数后再发一份，取先返回者
+HEDGE_ROUTES = {r.strip() for r in os.getenv("HEDGE_ROUTES", "chat").split(",") if r.strip()}
+HEDGE_PERCENTILE = float(os.getenv("HEDGE_PERCENTILE", "0.95"))
+HEDGE_MIN_DELAY = float(os.getenv("HEDGE_MIN_DELAY", "2"))
+HEDGE_MIN_SAMPLES = int(os.getenv("HEDGE_MIN_SAMPLES", "20"))
+# 熔断：连续失败达到阈值后打开，open 期间直接切换到备用 provider
+BREAKER_FAILURE_THRESHOLD = int(os.getenv("BREAKER_FAILURE_THRESHOLD", "5"))
+BREAKER_OPEN_SECONDS = float(os.getenv("BREAKER_OPEN_SECONDS", "30"))
+FAILOVER_ENABLED = os.getenv("FAILOVER_ENABLED", "1") == "1"
+# 主 provider 不可用时切换到的模型
+FAILOVER_MODELS = {
+    "dashscope": os.getenv("FAILOVER_GPT_MODEL", "gpt-4o-mini"),
+    "openai": os.getenv("FAILOVER_QWEN_MODEL", DEFAULT_MODEL),
+}
+
+# === 日志 ===
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_JSON = os.getenv("LOG_JSON", "1") == "1"                      # 0 时输出纯文本行
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))       # 队列满时丢弃新日志而不阻塞事件循环
+# 完整 prompt / 响应体的采样率（0~1）；未采样的请求只记一行大小与耗时摘要
+LOG_PAYLOAD_SAMPLE_RATE = float(os.getenv("LOG_PAYLOAD_SAMPLE_RATE", "0.01"))
+LOG_PAYLOAD_MAX_CHARS = int(os.getenv("LOG_PAYLOAD_MAX_CHARS", "4000"))
+
+# === /summary/daily/batch ===
+SUMMARY_BATCH_CONCURRENCY = int(os.getenv("SUMMARY_BATCH_CONCURRENCY", "8"))        # 默认并发
+SUMMARY_BATCH_MAX_CONCURRENCY = int(os.getenv("SUMMARY_BATCH_MAX_CONCURRENCY", "32"))  # 请求可指定的并发上限
+SUMMARY_BATCH_MAX_ITEMS = int(os.getenv("SUMMARY_BATCH_MAX_ITEMS", "5000"))
+# 单条超时（秒），避免个别慢请求长期占用并发名额；<= 0 表示不限
+SUMMARY_BATCH_ITEM_TIMEOUT = float(os.getenv("SUMMARY_BATCH_ITEM_TIMEOUT", "180"))
+
+# === JSON 编解码 ===
+# auto：已安装 orjson 时使用，否则标准库 json；也可强制 orjson / json
+JSON_BACKEND = os.getenv("JSON_BACKEND", "auto").lower()
+
+# === 结构化输出 ===
+# 支持 response_format={"type": "json_object"} 的模型（精确匹配）；summary 对这些模型请求原生 JSON 输出
+JSON_MODE_MODELS = {
+    m.strip()
+    for m in os.getenv(
+        "JSON_MODE_MODELS", "qwen-plus,qwen-max,qwen-turbo,qwen-flash,qwen3-max,gpt-4o,gpt-4o-mini,gpt-4.1,gpt-4.1-mini"
+    ).split(",")
+    if m.strip()
+}
+# 总结结果缺字段时补充调用的输出 token 上限（短字段 / 含 article、analyzeResult 等长字段）
+SUMMARY_FILL_MAX_TOKENS = int(os.getenv("SUMMARY_FILL_MAX_TOKENS", "300"))
+SUMMARY_FILL_MAX_TOKENS_LONG = int(os.getenv("SUMMARY_FILL_MAX_TOKENS_LONG", "2000"))
@@ -0,0 +1,163 @@
+# 日志子系统：QueueHandler → 后台线程 QueueListener 输出 JSON 行；payload 采样 / 截断 / 请求头脱敏
+
+import datetime
+import logging
+import queue
+import random
+import sys
+from logging.handlers import QueueHandler, QueueListener
+from typing import Any, Callable, Dict, List, Mapping, Optional, Tuple
+
+from core.config import (
+    LOG_LEVEL,
+    LOG_JSON,
+    LOG_QUEUE_SIZE,
+    LOG_PAYLOAD_SAMPLE_RATE,
+    LOG_PAYLOAD_MAX_CHARS,
+)
+from utils.json_codec import dumps
+
+__all__ = [
+    "JsonFormatter",
+    "setup_logging",
+    "shutdown_logging",
+    "sample_payload",
+    "lazy_json",
+    "truncate",
+    "redact_headers",
+    "logging_stats",
+]
+
+# 这些 logger 的 handler 会被替换为队列 handler（uvicorn.error 会传播到 uvicorn）
+_ROUTED_LOGGERS = ("", "uvicorn", "uvicorn.access")
+_SENSITIVE_HEADERS = {"authorization", "proxy-authorization", "x-api-key", "api-key", "cookie", "set-cookie"}
+# LogRecord 自带属性；其余属性视为 extra={...} 传入的结构化字段
+_RECORD_ATTRS = set(vars(logging.makeLogRecord({}))) | {"message", "asctime", "taskName"}
+
+_stats: Dict[str, int] = {"dropped": 0, "sampled": 0}
+_listener: Optional[QueueListener] = None
+_saved: Dict[str, Tuple[List[logging.Handler], bool]] = {}
+
+
+class JsonFormatter(logging.Formatter):
+    """一条日志一行 JSON：ts / level / logger / msg + extra 字段 + exc。"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        out: Dict[str, Any] = {
+            "ts": datetime.datetime.fromtimestamp(record.created).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for k, v in record.__dict__.items():
+            if k not in _RECORD_ATTRS and not k.startswith("_"):
+                out[k] = v
+        if record.exc_info:
+            out["exc"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            out["exc"] = record.exc_text
+        return dumps(out, default=str)
+
+
+class _NonBlockingQueueHandler(QueueHandler):
+    """
+    调用方线程（事件循环）只做入队：不格式化、不写 stderr；队列满直接丢弃并计数。
+    消息参数在后台线程中才被 str()，因此调用方不应在打日志后修改传入的可变对象。
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            _stats["dropped"] += 1
+
+
+def setup_logging() -> None:
+    """在 uvicorn 完成自身日志配置之后调用（lifespan 启动时）。重复调用无副作用。"""
+    global _listener
+    if _listener is not None:
+        return
+    q: "queue.Queue[logging.LogRecord]" = queue.Queue(LOG_QUEUE_SIZE)
+    sink = logging.StreamHandler(sys.stderr)
+    sink.setFormatter(
+        JsonFormatter() if LOG_JSON else logging.Formatter("%(asctime)s %(levelname)s %(name)s %(message)s")
+    )
+    handler = _NonBlockingQueueHandler(q)
+    for name in _ROUTED_LOGGERS:
+        lg = logging.getLogger(name)
+        _saved[name] = (lg.handlers[:], lg.propagate)
+        lg.handlers = [handler]
+        # 与 uvicorn 自身配置一致：uvicorn.* 不再向 root 传播，避免同一条日志入队两次
+        lg.propagate = not name
+    logging.getLogger().setLevel(LOG_LEVEL)
+    logging.getLogger("uvicorn.error").setLevel(LOG_LEVEL)
+    _listener = QueueListener(q, sink)
+    _listener.start()
+
+
+def shutdown_logging() -> None:
+    """停止后台线程（会先写完队列中剩余的日志）并恢复原 handler。"""
+    global _listener
+    if _listener is None:
+        return
+    _listener.stop()
+    _listener = None
+    for name, (handlers, propagate) in _saved.items():
+        lg = logging.getLogger(name)
+        lg.handlers = handlers
+        lg.propagate = propagate
+    _saved.clear()
+
+
+def sample_payload() -> bool:
+    """本次请求是否记录完整 prompt / 响应体。"""
+    if LOG_PAYLOAD_SAMPLE_RATE <= 0:
+        return False
+    if LOG_PAYLOAD_SAMPLE_RATE >= 1 or random.random() < LOG_PAYLOAD_SAMPLE_RATE:
+        _stats["sampled"] += 1
+        return True
+    return False
+
+
+def truncate(text: str, max_chars: int = LOG_PAYLOAD_MAX_CHARS) -> str:
+    if max_chars <= 0 or len(text) <= max_chars:
+        return text
+    return f"{text[:max_chars]}...(+{len(text) - max_chars} chars)"
+
+
+class _LazyJson:
+    """str() 时才序列化并截断；作为日志参数传入，序列化发生在后台线程。"""
+
+    __slots__ = ("_fn", "_max_chars")
+
+    def __init__(self, fn: Callable[[], Any], max_chars: int):
+        self._fn = fn
+        self._max_chars = max_chars
+
+    def __str__(self) -> str:
+        try:
+            obj = self._fn()
+            text = obj if isinstance(obj, str) else dumps(obj, default=str)
+        except Exception:
+            text = "<unserializable>"
+        return truncate(text, self._max_chars)
+
+
+def lazy_json(fn: Callable[[], Any], max_chars: int = LOG_PAYLOAD_MAX_CHARS) -> _LazyJson:
+    return _LazyJson(fn, max_chars)
+
+
+def redact_headers(headers: Mapping[str, str]) -> Dict[str, str]:
+    return {k: ("***" if k.lower() in _SENSITIVE_HEADERS else v) for k, v in headers.items()}
+
+
+def logging_stats() -> Dict[str, Any]:
+    return {
+        **_stats,
+        "queued": _listener.queue.qsize() if _listener is not None else 0,
+        "running": _listener is not None,
+        "payload_sample_rate": LOG_PAYLOAD_SAMPLE_RATE,
+    }
@@ -0,0 +1,245 @@
+# 离线批量总结：读取 SummaryReq JSONL（可为 .gz / .bz2 / .xz），按 /summary/daily 的同一逻辑生成结果
+#
+# 用法：
+#   python jobs/nightly_summary.py input.jsonl.gz --out results.jsonl --workers 16 --rps 5
+#   # 中途崩溃后用同样的命令重跑：out 中已成功的条目会被跳过，失败的条目会重试
+#
+# 输入每行一个 SummaryReq（可额外带 "id" 字段作为条目标识；没有时用该行内容的哈希）。
+# 输出每行一条：
+#   {"id": ..., "index": 0, "openid": ..., "ok": true, "data": {...SummarizeResultResp}, "costMs": 812}
+#   {"id": ..., "index": 1, "openid": ..., "ok": false, "status": 502, "detail": "...", "costMs": 40}
+# 模型输出解析失败或缺字段的结果也记为 ok=false（status 502，附带已得到的部分 data）。
+# 输出文件本身就是 checkpoint（逐行追加并 flush），resume 时读取其中 ok=true 的 id。
+# 离线任务没有用户身份，不读写用户记忆 / 检索索引：结果只写入输出文件（与 summary 结果缓存）。
+
+import argparse
+import asyncio
+import bz2
+import gzip
+import hashlib
+import json
+import logging
+import lzma
+import os
+import sys
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, IO, Iterator, List, Optional, Set, Tuple
+
+from pydantic import ValidationError
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models.record_model import SummaryReq  # noqa: E402
+from routers.summary import run_daily_summary_status  # noqa: E402
+from services.http_pool import close_clients, init_clients  # noqa: E402
+from services.metrics import LLM_TOKENS_TOTAL  # noqa: E402
+from services.prompt_registry import prompt_registry  # noqa: E402
+from services.rate_limiter import TokenBucket  # noqa: E402
+from services.summary_cache import CacheControl, summary_cache  # noqa: E402
+
+logger = logging.getLogger("uvicorn.error")
+
+_OPENERS = {".gz": gzip.open, ".bz2": bz2.open, ".xz": lzma.open, ".lzma": lzma.open}
+
+
+def open_text(path: str) -> IO[str]:
+    if path == "-":
+        return sys.stdin
+    opener = _OPENERS.get(os.path.splitext(path)[1].lower(), open)
+    return opener(path, "rt", encoding="utf-8")
+
+
+def item_id(obj: Dict[str, Any], line: str) -> str:
+    rid = obj.get("id")
+    if isinstance(rid, (str, int)) and str(rid):
+        return str(rid)
+    return hashlib.sha1(line.encode("utf-8")).hexdigest()[:20]
+
+
+def iter_items(path: str) -> Iterator[Tuple[int, str, Optional[Dict[str, Any]], str]]:
+    """逐行产出 (index, id, obj | None, error)；解析失败的行 obj 为 None。"""
+    with open_text(path) as f:
+        for index, line in enumerate(f):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                obj = json.loads(line)
+                if not isinstance(obj, dict):
+                    raise ValueError("line is not a JSON object")
+            except Exception as e:
+                yield index, f"line-{index}", None, f"invalid json: {e}"
+                continue
+            yield index, item_id(obj, line), obj, ""
+
+
+def load_done(out_path: str) -> Set[str]:
+    """读取已有输出中成功的条目 id；崩溃时写了一半的最后一行会被忽略。"""
+    done: Set[str] = set()
+    if not os.path.exists(out_path):
+        return done
+    with open(out_path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                rec = json.loads(line)
+            except Exception:
+                continue
+            if rec.get("ok"):
+                done.add(str(rec.get("id")))
+    return done
+
+
+@dataclass
+class RunStats:
+    queued: int = 0
+    skipped: int = 0
+    succeeded: int = 0
+    failed: int = 0
+    failures: Dict[str, int] = field(default_factory=dict)
+    latencies: List[float] = field(default_factory=list)
+    elapsed: float = 0.0
+
+    def fail(self, status: Any) -> None:
+        self.failed += 1
+        self.failures[str(status)] = self.failures.get(str(status), 0) + 1
+
+
+def _pct(data: List[float], p: float) -> Optional[int]:
+    if not data:
+        return None
+    data = sorted(data)
+    return int(data[min(len(data) - 1, int(p * len(data)))] * 1000)
+
+
+async def run(args) -> RunStats:
+    stats = RunStats()
+    done = set() if args.restart else load_done(args.out)
+    cc = CacheControl(read=not args.no_cache, write=not args.no_cache)
+    bucket = TokenBucket(args.rps, max(args.rps, 1.0)) if args.rps > 0 else None
+    queue: "asyncio.Queue[Optional[Tuple[int, str, Dict[str, Any]]]]" = asyncio.Queue(maxsize=args.workers * 4)
+    out = open(args.out, "w" if args.restart else "a", encoding="utf-8")
+
+    def _write(rec: Dict[str, Any]) -> None:
+        out.write(json.dumps(rec, ensure_ascii=False) + "\n")
+        out.flush()
+
+    async def _producer():
+        for index, rid, obj, err in iter_items(args.input):
+            if rid in done:
+                stats.skipped += 1
+                continue
+            if obj is None:
+                stats.fail("invalid_json")
+                _write({"id": rid, "index": index, "ok": False, "status": 400, "detail": err})
+                continue
+            stats.queued += 1
+            await queue.put((index, rid, obj))
+        for _ in range(args.workers):
+            await queue.put(None)
+
+    async def _worker():
+        while True:
+            job = await queue.get()
+            if job is None:
+                return
+            index, rid, obj = job
+            if bucket is not None:
+                while (wait := bucket.wait_time(1)) > 0:
+                    await asyncio.sleep(wait)
+            rec: Dict[str, Any] = {"id": rid, "index": index, "openid": obj.get("openid")}
+            start = time.monotonic()
+            try:
+                body = SummaryReq(**{k: v for k, v in obj.items() if k != "id"})
+                result, complete = await asyncio.wait_for(run_daily_summary_status(body, cc), args.item_timeout)
+                if complete:
+                    rec.update(ok=True, data=result.model_dump())
+                    stats.succeeded += 1
+                    stats.latencies.append(time.monotonic() - start)
+                else:
+                    # 解析失败 / 缺字段：记为失败，resume 时会重新生成；data 保留已得到的部分字段
+                    rec.update(ok=False, status=502, detail="incomplete summary", data=result.model_dump())
+                    stats.fail(502)
+            except asyncio.TimeoutError:
+                rec.update(ok=False, status=504, detail="item timeout")
+                stats.fail(504)
+            except ValidationError as e:
+                rec.update(ok=False, status=400, detail=str(e)[:500])
+                stats.fail(400)
+            except Exception as e:
+                status = getattr(e, "status_code", None) or 500
+                rec.update(ok=False, status=status, detail=str(getattr(e, "detail", None) or e)[:500])
+                stats.fail(status)
+            rec["costMs"] = int((time.monotonic() - start) * 1000)
+            _write(rec)
+
+    async def _progress(t0: float):
+        while True:
+            await asyncio.sleep(args.progress)
+            n = stats.succeeded + stats.failed
+            print(
+                f"[progress] done={n} ok={stats.succeeded} failed={stats.failed} skipped={stats.skipped} "
+                f"rate={n / max(1e-9, time.monotonic() - t0):.2f}/s",
+                file=sys.stderr,
+            )
+
+    await init_clients()
+    prompt_registry.load_all()
+    summary_cache.open()
+    t0 = time.monotonic()
+    reporter = asyncio.create_task(_progress(t0)) if args.progress > 0 else None
+    try:
+        await asyncio.gather(_producer(), *[_worker() for _ in range(args.workers)])
+    finally:
+        if reporter is not None:
+            reporter.cancel()
+        out.close()
+        summary_cache.close()
+        await close_clients()
+    stats.elapsed = time.monotonic() - t0
+    return stats
+
+
+def print_report(stats: RunStats) -> None:
+    elapsed = stats.elapsed
+    processed = stats.succeeded + stats.failed
+    report = {
+        "processed": processed,
+        "succeeded": stats.succeeded,
+        "failed": stats.failed,
+        "failures": stats.failures,
+        "skipped_already_done": stats.skipped,
+        "elapsed_s": round(elapsed, 1),
+        "throughput_per_s": round(processed / elapsed, 2) if elapsed > 0 else 0.0,
+        "latency_p50_ms": _pct(stats.latencies, 0.5),
+        "latency_p95_ms": _pct(stats.latencies, 0.95),
+        "prompt_tokens": int(LLM_TOKENS_TOTAL.total(kind="prompt")),
+        "completion_tokens": int(LLM_TOKENS_TOTAL.total(kind="completion")),
+        "cached_prompt_tokens": int(LLM_TOKENS_TOTAL.total(kind="cached")),
+    }
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="offline daily summary runner (JSONL in → JSONL out)")
+    ap.add_argument("input", help="SummaryReq JSONL 文件（.gz/.bz2/.xz 自动解压；- 为 stdin）")
+    ap.add_argument("--out", required=True, help="结果 JSONL（同时作为 checkpoint）")
+    ap.add_argument("--workers", type=int, default=8)
+    ap.add_argument("--rps", type=float, default=0.0, help="本任务的请求速率上限；上游 provider 限流仍然生效")
+    ap.add_argument("--item-timeout", type=float, default=300.0)
+    ap.add_argument("--no-cache", action="store_true", help="不读写 summary 结果缓存")
+    ap.add_argument("--restart", action="store_true", help="忽略已有输出，从头开始（会覆盖 --out）")
+    ap.add_argument("--progress", type=float, default=10.0, help="进度输出间隔（秒），0 关闭")
+    args = ap.parse_args()
+    args.workers = max(1, args.workers)
+
+    level = os.getenv("LOG_LEVEL", "WARNING").upper()
+    logging.getLogger().setLevel(level)
+    logger.setLevel(level)
+    stats = asyncio.run(run(args))
+    print_report(stats)
+    sys.exit(1 if stats.failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,29 +1,203 @@
-from fastapi import FastAPI
+import asyncio
+from contextlib import asynccontextmanager
+
+from fastapi import FastAPI, Response
+from core.logging_setup import setup_logging, shutdown_logging, logging_stats
 from routers.chat import router as chat_router
 from routers.summary import router as summary_router
+from services.http_pool import init_clients, close_clients, pool_stats
+from services.prompt_registry import prompt_registry
+from services.summary_cache import summary_cache
+from services.singleflight import summary_flight
+from services.context_packer import packer_stats
+from services.timeline import parse_cache_info
+from services.chat_session import session_store
+from services.memory_index import memory_store
+from services.user_memory import user_memory
+from services.lifecycle import lifecycle
+from services.warmup import run_warmup, warmup_stats
+from services.rate_limiter import limiter_stats
+from services.resilience import resilience_stats
+from utils.json_codec import FastJSONResponse
+from services.metrics import (
+    CONTENT_TYPE, REQUESTS_TOTAL, format_sample, register_collector, render as render_metrics, start_scrape_server,
+)
+from core.config import METRICS_PORT, SERVE_HOST, SERVE_WORKERS
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # 启动：日志改为队列 + 后台线程输出（需在 uvicorn 配置日志之后）
+    setup_logging()
+    # 启动：创建各 provider 的长连接 client（复用 TCP/TLS）
+    await init_clients()
+    # 启动：一次性加载 config/*.json，并在后台监听变更热加载
+    await prompt_registry.start()
+    # 启动：打开 summary 结果缓存的 SQLite 层
+    summary_cache.open()
+    # 启动：打开按 openid 持久化的用户记忆
+    user_memory.open()
+    # SIGTERM 时先排空 /ws/chat（等进行中的回复发完，再以 1012 关闭），再交给 uvicorn 退出
+    lifecycle.install_signal_handler()
+    # 启动：后台预热（DNS / 连接池 / 提示词编译 / 可选探测），完成后 /readyz 才返回 200
+    warmup_task = asyncio.create_task(run_warmup(lifecycle.mark_ready))
+    # 多 worker 时共享端口上的 /metrics 只代表某一个 worker：每个 worker 另开独立的抓取端口
+    scrape_server = await start_scrape_server(SERVE_HOST, METRICS_PORT, SERVE_WORKERS) if METRICS_PORT > 0 else None
+    try:
+        yield
+    finally:
+        warmup_task.cancel()
+        if scrape_server is not None:
+            scrape_server.close()
+        # 关闭：停止热加载、释放连接池
+        await prompt_registry.stop()
+        summary_cache.close()
+        user_memory.close()
+        await close_clients()
+        shutdown_logging()
+
+
+app = FastAPI(title="Agent (HTTP + WebSocket)", lifespan=lifespan)
+
+
+class RequestMetricsMiddleware:
+    """纯 ASGI 中间件：按路由模板（而不是实际 URL）和状态码计数 HTTP 请求。"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        status = 500
+
+        async def _send(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, _send)
+        finally:
+            route = getattr(scope.get("route"), "path", "unmatched")
+            REQUESTS_TOTAL.inc(route=route, status=status)
+
+
+app.add_middleware(RequestMetricsMiddleware)
+
 
-app = FastAPI(title="Agent (HTTP + WebSocket)")
+def _collect_stats():
+    """抓取 /metrics 时把各模块已有的统计导出为指标。"""
+    lines = ["# TYPE agent_summary_cache_lookups_total counter"]
+    st = summary_cache.stats
+    for result, n in (("memory_hit", st["memory_hits"]), ("disk_hit", st["disk_hits"]),
+                      ("miss", st["misses"]), ("bypass", st["bypass"])):
+        lines.append(format_sample("agent_summary_cache_lookups_total", n, result=result))
+    lines.append("# TYPE agent_singleflight_total counter")
+    for k, n in summary_flight.snapshot().items():
+        if k in ("started", "joined", "recent_hits", "cancelled"):
+            lines.append(format_sample("agent_singleflight_total", n, result=k))
+    lines.append("# TYPE agent_upstream_inflight gauge")
+    lines.append("# TYPE agent_upstream_concurrency_limit gauge")
+    for name, snap in limiter_stats().items():
+        lines.append(format_sample("agent_upstream_inflight", snap["inflight"], limiter=name))
+        lines.append(format_sample("agent_upstream_concurrency_limit", snap["concurrency_limit"], limiter=name))
+    lines.append("# TYPE agent_breaker_open gauge")
+    for name, snap in resilience_stats()["breakers"].items():
+        lines.append(format_sample("agent_breaker_open", 0 if snap["state"] == "closed" else 1, provider=name))
+    lines.append("# TYPE agent_log_dropped_total counter")
+    lines.append(format_sample("agent_log_dropped_total", logging_stats()["dropped"]))
+    return lines
 
-@app.get("/healthz")
+
+register_collector(_collect_stats)
+
+# Prometheus 抓取入口（只含处理本次请求的 worker 的数据；多 worker 时按 METRICS_PORT 逐个抓取）
+@app.get("/metrics", include_in_schema=False)
+def metrics():
+    return Response(render_metrics(), media_type=CONTENT_TYPE)
+
+@app.get("/healthz", response_class=FastJSONResponse)
 def healthz():
     return {"ok": "health !"}
 
+# 就绪探针：启动完成且未在下线时为 200，否则 503（/healthz 只表示进程存活）
+@app.get("/readyz", response_class=FastJSONResponse)
+def readyz():
+    snap = lifecycle.snapshot()
+    body = {"ok": snap["ready"], **snap, "warmup": warmup_stats()}
+    return FastJSONResponse(body, status_code=200 if snap["ready"] else 503)
+
+# 上游连接池统计：in_use / idle / waiting
+@app.get("/api/stats/pool", response_class=FastJSONResponse)
+def poolStats():
+    return {"ok": True, "pools": pool_stats()}
+
+def _prompt_entries(prefix: str):
+    return {
+        e.name: {"etag": e.etag, "mtime": e.mtime, "data": e.data}
+        for e in prompt_registry.entries(prefix)
+    }
+
+# summary 结果缓存命中统计
+@app.get("/api/stats/cache", response_class=FastJSONResponse)
+def cacheStats():
+    return {"ok": True, "summary": summary_cache.snapshot(), "singleflight": summary_flight.snapshot()}
+
+# 历史上下文打包统计：估算的原始 / 打包后 token 及丢弃条数
+@app.get("/api/stats/packer", response_class=FastJSONResponse)
+def packerStats():
+    return {
+        "ok": True,
+        "packer": {**packer_stats, "saved_tokens": packer_stats["raw_tokens"] - packer_stats["packed_tokens"]},
+        "dt_parse_cache": parse_cache_info(),
+    }
+
+# /ws/chat 服务端会话统计
+@app.get("/api/stats/sessions", response_class=FastJSONResponse)
+def sessionStats():
+    return {"ok": True, "sessions": session_store.snapshot()}
+
+# 历史总结检索索引：用户数 / 文档数 / 命中率 / 平均检索耗时
+@app.get("/api/stats/memory", response_class=FastJSONResponse)
+def memoryStats():
+    return {"ok": True, "memory": memory_store.snapshot()}
+
+# 持久化用户记忆：常驻用户数 / 内存命中 / 磁盘加载 / 写入条数
+@app.get("/api/stats/user_memory", response_class=FastJSONResponse)
+def userMemoryStats():
+    return {"ok": True, "user_memory": user_memory.snapshot()}
+
+# 上游限流：当前并发上限 / 在途 / 排队深度 / 速率
+@app.get("/api/stats/limits", response_class=FastJSONResponse)
+def limitStats():
+    return {"ok": True, "limits": limiter_stats()}
+
+@app.get("/api/stats/logging", response_class=FastJSONResponse)
+def loggingStats():
+    return {"ok": True, "logging": logging_stats()}
+
+@app.get("/api/stats/resilience", response_class=FastJSONResponse)
+def resilienceStats():
+    return {"ok": True, "resilience": resilience_stats()}
+
 # 新增: 返回所有 chat 提示词配置
-@app.get("/api/prompts/chat")
+@app.get("/api/prompts/chat", response_class=FastJSONResponse)
 def allChatPrompts():
     """
-    chat prompts 查询入口（仅路由，不做具体实现）
+    chat prompts 查询入口：返回内存中的配置及 etag
     """
-    return {"ok": True}
+    return {"ok": True, "version": prompt_registry.version, "prompts": _prompt_entries("chat_")}
 
 # 新增: 返回所有 summary 提示词配置
-@app.get("/api/prompts/summary")
+@app.get("/api/prompts/summary", response_class=FastJSONResponse)
 def allSummaryPrompts():
     """
-    summary prompts 查询入口（仅路由，不做具体实现）
+    summary prompts 查询入口：返回内存中的配置及 etag
     """
-    return {"ok": True}
+    return {"ok": True, "version": prompt_registry.version, "prompts": _prompt_entries("summary_")}
 
 # 注册路由
 app.include_router(chat_router)      # /ws/chat
-app.include_router(summary_router)   # /api/summary
\ No newline at end of file
+app.include_router(summary_router)   # /api/summary
@@ -1,4 +1,4 @@
-# dataclass：Message / ChatRequest / Builder
+# dataclass：Message / StreamEvent / ChatRequest / Builder
 
 from dataclasses import dataclass, field
 from typing import List, Optional
@@ -8,12 +8,26 @@ class Message:
     role: str
     content: str
 
+@dataclass
+class StreamEvent:
+    """流式输出事件：delta 为增量文本；done=True 的最后一个事件携带 usage。"""
+    delta: str = ""
+    usage: Optional[dict] = None
+    done: bool = False
+
 @dataclass
 class ChatRequest:
     model: str
     messages: List[Message] = field(default_factory=list)
     temperature: Optional[float] = None
     max_completion_tokens: Optional[int] = None
+    # 预编码的静态前缀：messages[:prefix_count] 的 JSON（逗号分隔，不含方括号），请求时直接拼接
+    prefix_json: Optional[bytes] = None
+    prefix_count: int = 0
+    # 静态前缀的摘要（日志中用于确认上游前缀缓存是否命中）
+    prefix_hash: Optional[str] = None
+    # 要求上游以 JSON 对象输出（response_format=json_object），仅对 JSON_MODE_MODELS 中的模型生效
+    json_mode: bool = False
 
     def to_dict(self):
         payload = {
@@ -36,6 +50,9 @@ class ChatRequestBuilder:
         self._messages: List[Message] = []
         self._temperature = None
         self._max_completion_tokens = None
+        self._prefix_json = None
+        self._prefix_count = 0
+        self._prefix_hash = None
 
     def model(self, model: str):
         self._model = model
@@ -45,6 +62,10 @@ class ChatRequestBuilder:
         self._messages.append(Message(role=role, content=content))
         return self
 
+    def addMessages(self, messages: List[Message]):
+        self._messages.extend(messages)
+        return self
+
     def temperature(self, temp: float):
         self._temperature = temp
         return self
@@ -53,10 +74,20 @@ class ChatRequestBuilder:
         self._max_completion_tokens = tokens
         return self
 
+    def encoded_prefix(self, data: bytes, count: int, prefix_hash: Optional[str] = None):
+        """声明当前已添加的前 count 条消息已预编码为 data。"""
+        self._prefix_json = data
+        self._prefix_count = count
+        self._prefix_hash = prefix_hash
+        return self
+
     def build(self) -> "ChatRequest":
         return ChatRequest(
             model=self._model,
             messages=self._messages,
             temperature=self._temperature,
             max_completion_tokens=self._max_completion_tokens,
+            prefix_json=self._prefix_json,
+            prefix_count=self._prefix_count,
+            prefix_hash=self._prefix_hash,
         )
\ No newline at end of file
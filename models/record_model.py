@@ -1,5 +1,5 @@
-from pydantic import BaseModel
-from typing import Literal, List
+from pydantic import BaseModel, Field
+from typing import Literal, List, Optional
 
 class Record(BaseModel):
     """
@@ -24,6 +24,12 @@ class SummaryReq(BaseModel):
     openid: str  # 用户 openId，可为空
     text: str                     # 必填，Memo 拼好的当天聊天内容
     preDailySummary: List[DailySummaryModel] = []
+    # 本次总结所属日期（YYYY-MM-DD）。/summary/daily 不传时按业务时区的今天；批量 / 离线补跑不传时结果不写入用户记忆
+    summaryDate: Optional[str] = Field(None, pattern=r"^\d{4}-\d{2}-\d{2}$")
+
+class SummaryBatchReq(BaseModel):
+    items: List[SummaryReq]
+    concurrency: Optional[int] = None  # 不传时使用 SUMMARY_BATCH_CONCURRENCY
 
 class SummarizeResultResp(BaseModel):
     article: str
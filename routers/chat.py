@@ -1,21 +1,52 @@
 # WebSocket 聊天接口
 
-import json
+import asyncio
 import os
 import logging
+import time
+from collections import deque
 from datetime import datetime
 from fastapi import APIRouter, WebSocket, WebSocketDisconnect, HTTPException
-from services.llm_clients import call_qwen
+from services.llm_clients import smart_call, smart_stream
+from services.rate_limiter import RateLimitTimeout
 from core.config import DASHSCOPE_API_KEY, OPEN_API_KEY, DASH_URL, OPEN_URL, DEFAULT_MODEL,DEFAULT_CHAT_MODEL,QIANWEN_MAX
+from core.config import MEMORY_RETRIEVAL_ENABLED, MEMORY_TOP_K, SESSION_KEEP_RECENT, WS_MAX_PENDING_TURNS
 from models.chat_models import ChatRequest
-from typing import Any, Dict, List
+from services.prompt_compiler import CompiledPrompt, get_compiled
+from services.chat_session import ChatSession, session_store
+from services.context_packer import pack_daily_summaries, pack_prechat, stringify_value, unwrap_list
+from services.timeline import business_now, parse_dt
+from services.memory_index import memory_store
+from services.identity import bearer_token, verify_token
+from services.lifecycle import WsConn, lifecycle
+from services.warmup import register_warmup
+from services.user_memory import UserHistory, user_memory
+from services.metrics import (
+    PROMPT_BUILD_SECONDS,
+    REQUESTS_TOTAL,
+    WS_CONNECTIONS,
+    WS_EMPTY_REPLIES_TOTAL,
+    WS_TURNS_CANCELLED_TOTAL,
+    WS_WASTED_GENERATIONS_TOTAL,
+)
+from typing import Any, Deque, Dict, List, Tuple
+from utils.json_codec import dumps, loads
 
 router = APIRouter()
 logger = logging.getLogger("uvicorn.error")
 
+CHAT_PROMPTS_NAME = "chat_prompts_v2"
+
 @router.websocket("/ws/chat")
 async def ws_chat(ws: WebSocket):
-    await ws.accept()
+    conn = await lifecycle.accept(ws)
+    if conn is None:
+        return
+    WS_CONNECTIONS.inc()
+    # 身份只在建连时按 token 校验一次；payload 里的 openid 不作为读写服务端存储的依据
+    user = verify_token(ws.query_params.get("token") or bearer_token(ws.headers))
+    # 读帧与生成并发：生成期间仍能收到新消息与断开事件
+    turns = _TurnQueue(ws, conn, user)
     try:
         while True:
             try:
@@ -35,171 +66,363 @@ async def ws_chat(ws: WebSocket):
             else:
                 continue
 
-            payload = None
-            try:
-                p = json.loads(raw)
-                if isinstance(p, dict):
-                    payload = p
-            except Exception:
-                pass
+            if not turns.submit(raw):
+                logger.warning("[ws] too many pending messages (%d), closing", WS_MAX_PENDING_TURNS)
+                REQUESTS_TOTAL.inc(route="ws_chat", status="too_many_pending")
+                await conn.close(code=CLOSE_POLICY_VIOLATION, reason="too many pending messages")
+                break
+    finally:
+        await turns.close()
+        WS_CONNECTIONS.dec()
+        lifecycle.release(conn)
+        if lifecycle.draining:
+            await conn.close()
+
+
+# RFC 6455：违反协议约定（这里指客户端不等回复持续灌消息）
+CLOSE_POLICY_VIOLATION = 1008
+
+
+class _Turn:
+    __slots__ = ("raw", "payload", "request_id", "cancelled", "delivered", "task")
+
+    def __init__(self, raw: str, payload: dict | None):
+        self.raw = raw
+        self.payload = payload
+        self.request_id = _request_id(payload)
+        self.cancelled = False
+        # 最终回复帧已发出：之后只剩记录 / 持久化，不再取消
+        self.delivered = False
+        self.task: asyncio.Task | None = None
+
+
+class _TurnQueue:
+    """
+    一个连接上的回复轮次，由单个后台 worker 按顺序执行（同一连接上的帧不会并发发送）：
+      - 带 requestId 的新消息取消仍在生成中的上一轮与排队中的消息（上游 HTTP 请求随之中断），
+        被取消的轮次回一帧 {"requestId", "reply": "", "cancelled": true}；该轮所有回复帧都带相同的 requestId
+      - 不带 requestId 的消息按到达顺序逐条处理，与旧客户端的一问一答行为一致
+      - 连接断开 / 下线超时时取消进行中的一轮；最终回复已发出的一轮不再取消（让它把记录 / 持久化做完）
+      - 排队超过 WS_MAX_PENDING_TURNS 条时 submit 返回 False，由调用方以 1008 关闭连接
+    """
+
+    def __init__(self, ws: WebSocket, conn: WsConn, user: str | None = None):
+        self.ws = ws
+        self.conn = conn
+        # 已校验的 openid；未登录的连接只在自己上传过的总结中检索
+        self.user = user
+        self.memory_key = user or f"conn:{os.urandom(8).hex()}"
+        # 服务端会话（opt-in）：首条消息带 "session": true 或 "sessionId" 后启用，之后客户端只需发送新消息
+        self.session: ChatSession | None = None
+        self._queue: Deque[_Turn] = deque()
+        self._wakeup = asyncio.Event()
+        self._current: _Turn | None = None
+        self._worker = asyncio.create_task(self._run())
+
+    def submit(self, raw: str) -> bool:
+        if len(self._queue) >= WS_MAX_PENDING_TURNS:
+            return False
+        turn = _Turn(raw, _parse_payload(raw))
+        if turn.request_id is not None:
+            for queued in self._queue:
+                queued.cancelled = True
+            self._cancel_current("superseded")
+        self._queue.append(turn)
+        self._wakeup.set()
+        return True
+
+    def _cancel_current(self, reason: str) -> None:
+        cur = self._current
+        if cur is not None and not cur.delivered and cur.task is not None and not cur.task.done():
+            cur.cancelled = True
+            cur.task.cancel()
+            WS_TURNS_CANCELLED_TOTAL.inc(reason=reason)
+
+    async def close(self) -> None:
+        """连接结束：丢弃排队消息，取消进行中的一轮并等待其清理完毕。"""
+        self._queue.clear()
+        cur = self._current
+        self._cancel_current("shutdown" if lifecycle.draining else "disconnect")
+        self._worker.cancel()
+        try:
+            await asyncio.gather(self._worker, *([cur.task] if cur is not None and cur.task else []), return_exceptions=True)
+        finally:
+            if self.user is None:
+                memory_store.discard(self.memory_key)
 
+    async def _run(self) -> None:
+        while True:
+            while not self._queue:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+            # 下线中不再开始新的一轮，连接由 lifecycle 以 1012 关闭
+            if lifecycle.draining:
+                return
+            turn = self._queue.popleft()
             try:
-                prompts = _load_chat_prompts()
-                req_obj = _build_chat_request(payload, raw, prompts)
+                if turn.cancelled:
+                    await self._send_cancelled(turn)
+                    continue
+                session, found = _attach_session(turn.payload, self.session, self.user)
+                if not found:
+                    await _send(self.ws, {"reply": "", "error": "session_not_found", **_ids(turn.request_id)})
+                    continue
+                self.session = session
+                # 优雅下线时等这一轮回复发完，再以 1012 关闭连接
+                with lifecycle.busy(self.conn):
+                    turn.task = asyncio.create_task(
+                        _handle_message(self.ws, turn, self.session, self.memory_key, self.user)
+                    )
+                    self._current = turn
+                    try:
+                        await asyncio.wait({turn.task})
+                    finally:
+                        self._current = None
+                    if turn.task.cancelled():
+                        await self._send_cancelled(turn)
+                    elif turn.task.exception() is not None:
+                        raise turn.task.exception()
+            except (WebSocketDisconnect, OSError):
+                return
             except Exception as e:
-                logger.exception("Chat build failed", exc_info=e)
-                await ws.send_json({"reply": ""})
-                continue
+                logger.exception("[ws] chat turn failed", exc_info=e)
+                await self.conn.close(code=1011, reason="internal error")
+                return
 
-            reply = ""
-            try:
-                reply = await call_qwen(req_obj)
-                if reply is None:
-                    reply = ""
-            except Exception as e:
-                logger.exception("LLM call failed", exc_info=e)
-                reply = ""
+    async def _send_cancelled(self, turn: _Turn) -> None:
+        if turn.request_id is None:
+            return
+        frame = {"reply": "", "cancelled": True, "requestId": turn.request_id}
+        if isinstance(turn.payload, dict) and turn.payload.get("stream") is True:
+            frame["done"] = True
+        await _send(self.ws, frame)
 
-            await ws.send_json({"reply": reply})
-    except WebSocketDisconnect:
-        return
-    
 
+def _ids(request_id: Any) -> Dict[str, Any]:
+    return {"requestId": request_id} if request_id is not None else {}
 
-def _stringify_value(v: Any) -> str:
-    """Convert payload values into a compact string for prompt injection."""
-    if v is None:
-        return ""
-    if isinstance(v, str):
-        return v
-    if isinstance(v, (int, float, bool)):
-        return str(v)
-    # lists/dicts -> json
-    try:
-        return json.dumps(v, ensure_ascii=False)
-    except Exception:
-        return str(v)
 
-
-def _parse_dt(x: Any) -> datetime | None:
-    """Best-effort parse timestamps/dates."""
-    if x is None:
-        return None
-    if isinstance(x, (int, float)):
-        try:
-            ts = float(x)
-            # ms -> s
-            if ts > 1e12:
-                ts = ts / 1000.0
-            return datetime.fromtimestamp(ts)
-        except Exception:
-            return None
-    if not isinstance(x, str):
-        return None
-    s = x.strip()
-    if not s:
-        return None
-    s = s.replace("/", "-")
-    if s.endswith("Z"):
-        s = s[:-1]
+def _parse_payload(raw: str) -> dict | None:
     try:
-        return datetime.fromisoformat(s)
+        p = loads(raw)
     except Exception:
-        pass
-    for fmt in (
-        "%Y-%m-%d %H:%M:%S",
-        "%Y-%m-%d %H:%M",
-        "%Y-%m-%d",
-        "%Y%m%d",
-        "%Y%m%d%H%M%S",
-    ):
-        try:
-            return datetime.strptime(s, fmt)
-        except Exception:
-            continue
-    return None
+        return None
+    return p if isinstance(p, dict) else None
 
 
-def _extract_item_dt(item: Any) -> datetime | None:
-    """Extract a datetime from common fields in a dict item."""
-    if not isinstance(item, dict):
+def _request_id(payload: dict | None) -> Any:
+    """客户端提供的 requestId（字符串或整数），原样回显；没有时返回 None。"""
+    rid = payload.get("requestId") if isinstance(payload, dict) else None
+    if isinstance(rid, bool) or not isinstance(rid, (str, int)) or rid == "":
         return None
-    for k in (
-        "time",
-        "timestamp",
-        "ts",
-        "createdAt",
-        "created_at",
-        "date",
-        "datetime",
-        "summaryDate",
-        "summary_date",
-    ):
-        if k in item:
-            dt = _parse_dt(item.get(k))
-            if dt is not None:
-                return dt
-    return None
+    return rid
+
+
+async def _handle_message(
+    ws: WebSocket,
+    turn: _Turn,
+    session: ChatSession | None,
+    memory_key: str | None = None,
+    user: str | None = None,
+) -> None:
+    """
+    处理一条客户端消息并发送回复（在 _TurnQueue 的任务中执行；最终回复发出前可被取消）。
+    持久化的用户记忆只对已校验身份 user 读写，不看 payload 中的 openid。
+    """
+    raw, payload = turn.raw, turn.payload
+    ids = _ids(turn.request_id)
+    extra = {**ids, **({"sessionId": session.session_id} if session is not None else {})}
+    hist = await user_memory.load(user) if user else None
+    payload = await _with_stored_history(payload, session, hist, user)
 
-def _fmt_dt(dt: datetime, pivot: datetime | None) -> str:
-    """Compact datetime prefix for prompts. Uses month-day + HH:MM in pivot's local interpretation."""
     try:
-        # Keep it short: MM-DD HH:MM
-        return dt.strftime("%m-%d %H:%M")
-    except Exception:
-        return ""
-
+        with PROMPT_BUILD_SECONDS.time(route="chat"):
+            compiled = _load_chat_prompts()
+            req_obj = _build_chat_request(_with_session_history(payload, session), raw, compiled, memory_key)
+    except Exception as e:
+        logger.exception("Chat build failed", exc_info=e)
+        REQUESTS_TOTAL.inc(route="ws_chat", status="build_error")
+        WS_EMPTY_REPLIES_TOTAL.inc(reason="build_error")
+        await _send(ws, {"reply": "", **extra})
+        turn.delivered = True
+        return
 
-def _sort_items_closest_to(items: List[Any], pivot: datetime | None) -> List[Any]:
-    """Sort by closeness to pivot (smallest abs delta first). If no pivot, sort newest first."""
-    indexed = list(enumerate(items))
+    # 流式协议（opt-in）：{"delta": ...} 若干帧 + 最终 {"reply", "usage", "done": true}
+    if isinstance(payload, dict) and payload.get("stream") is True:
+        reply = await _stream_reply(ws, req_obj, extra, ids)
+        turn.delivered = True
+        _record_turn(session, payload, reply)
+        await _persist_turn(user, hist, payload, reply)
+        return
 
-    def key_fn(t):
-        idx, it = t
-        dt = _extract_item_dt(it)
-        if dt is None:
-            # no time info -> push to end, stable order
-            return (1, 10**18, idx)
-        if pivot is None:
-            # newest first
-            return (0, -dt.timestamp(), idx)
-        return (0, abs((dt - pivot).total_seconds()), idx)
+    reply = ""
+    error = None
+    try:
+        # smart_call：按模型前缀路由，带重试 / 对冲 / 熔断 / 跨 provider 切换
+        reply = await smart_call(req_obj, route="chat")
+        if reply is None:
+            reply = ""
+    except Exception as e:
+        logger.exception("LLM call failed: %s", getattr(e, "detail", None) or e, exc_info=e)
+        reply = ""
+        error = _client_error(e)
 
-    indexed.sort(key=key_fn)
-    return [it for _, it in indexed]
+    _count_reply(reply, error)
+    await _send_reply(ws, {"reply": reply, **({"error": error} if error else {}), **extra})
+    turn.delivered = True
+    _record_turn(session, payload, reply)
+    await _persist_turn(user, hist, payload, reply)
 
 
-def _render_messages_value(v: Any, pivot: datetime | None = None) -> str:
-    """Render list of messages into compact lines. Preserve timestamps when present."""
-    if v is None:
-        return ""
-    if isinstance(v, str):
-        return v
-    if isinstance(v, list):
-        lines: List[str] = []
-        for item in v:
-            if isinstance(item, dict):
-                role = _stringify_value(item.get("role", "")).strip()
-                content = _stringify_value(item.get("content", "")).strip()
-                if not content:
-                    continue
+async def _send(ws: WebSocket, data: Dict[str, Any]) -> None:
+    """与 ws.send_json 相同的文本帧，编码走 utils.json_codec。"""
+    await ws.send_text(dumps(data))
 
-                dt = _extract_item_dt(item)
-                dt_prefix = _fmt_dt(dt, pivot) if dt is not None else ""
-                prefix = f"[{dt_prefix}] " if dt_prefix else ""
 
-                if role == "user":
-                    lines.append(f"{prefix}U:{content}")
-                elif role == "assistant":
-                    lines.append(f"{prefix}A:{content}")
-                else:
-                    lines.append(f"{prefix}{content}")
-            else:
-                s = _stringify_value(item).strip()
-                if s:
-                    lines.append(s)
-        return "\n".join(lines)
-    return _stringify_value(v)
+async def _send_reply(ws: WebSocket, data: Dict[str, Any]) -> None:
+    """发送最终回复帧；客户端已断开导致发送失败时，本轮生成记为浪费。"""
+    try:
+        await _send(ws, data)
+    except (WebSocketDisconnect, OSError, RuntimeError):
+        if data.get("reply"):
+            WS_WASTED_GENERATIONS_TOTAL.inc(reason="undelivered")
+        raise
+
+
+def _client_error(e: Exception) -> str:
+    """返回给客户端的固定错误码；上游响应原文只写日志，不下发。"""
+    if isinstance(e, RateLimitTimeout) or (isinstance(e, HTTPException) and e.status_code == 429):
+        return "rate_limited"
+    return "upstream unavailable"
+
+
+def _count_reply(reply: str, error: Any) -> None:
+    REQUESTS_TOTAL.inc(route="ws_chat", status="error" if error else "ok")
+    if not reply:
+        WS_EMPTY_REPLIES_TOTAL.inc(reason="upstream_error" if error else "empty_output")
+
+
+def _attach_session(
+    payload: dict | None, session: ChatSession | None, user: str | None = None
+) -> Tuple[ChatSession | None, bool]:
+    """
+    按 payload 中的 sessionId / session 标记恢复或新建会话，返回 (会话, 是否找到)。
+    "session": true 新建（id 由服务端生成）；sessionId 只能恢复同一用户创建的已有会话，找不到时返回 (None, False)。
+    用户优先取已校验身份，未登录时取 payload 中的 openid。
+    """
+    if not isinstance(payload, dict):
+        return session, True
+    owner = user or _session_owner(payload)
+    sid = payload.get("sessionId")
+    if isinstance(sid, str) and sid.strip():
+        if session is not None and session.session_id == sid.strip() and session.owner == owner:
+            return session, True
+        resumed = session_store.resume(sid.strip(), owner)
+        return resumed, resumed is not None
+    if session is None and payload.get("session") is True:
+        return session_store.create(owner), True
+    return session, True
+
+
+def _session_owner(payload: dict) -> str:
+    openid = _get_payload_value(payload, "openid")
+    return openid if isinstance(openid, str) else ""
+
+
+def _with_session_history(payload: dict | None, session: ChatSession | None) -> dict | None:
+    """会话模式下，客户端未带 preChat 时用服务端保存的历史（摘要 + 最近轮次）补上。"""
+    if session is None or not isinstance(payload, dict) or payload.get("preChat") is not None:
+        return payload
+    history = session.history_items()
+    if not history:
+        return payload
+    return {**payload, "preChat": history}
+
+
+async def _with_stored_history(
+    payload: dict | None, session: ChatSession | None, hist: UserHistory | None, user: str | None
+) -> dict | None:
+    """
+    已校验用户 user 的持久化记忆：客户端带来的总结写入存储；未带 preDailySummary / preChat 时用存储的历史补上。
+    会话模式下 preChat 由服务端会话提供：空会话（新建，或原会话在别的 worker / 已过期而重新创建）先用存储的
+    最近 SESSION_KEEP_RECENT 条打底，与压缩后保留的条数一致，避免第一轮就触发压缩。
+    """
+    if hist is None or not user or not isinstance(payload, dict):
+        return payload
+    summaries = _get_payload_value(payload, "preDailySummary")
+    update: Dict[str, Any] = {}
+    if summaries is None:
+        if hist.summaries:
+            update["preDailySummary"] = hist.summary_list()
+    elif not isinstance(summaries, str):
+        items = [it for it in unwrap_list(summaries, ("items", "list", "summaries")) if isinstance(it, dict)]
+        if items:
+            await user_memory.save_summaries(user, items)
+    if _get_payload_value(payload, "preChat") is None and hist.turns:
+        if session is None:
+            update["preChat"] = list(hist.turns)
+        elif session.is_empty():
+            recent = list(hist.turns)
+            session.turns.extend(recent[max(0, len(recent) - SESSION_KEEP_RECENT):])
+    return {**payload, **update} if update else payload
+
+
+async def _persist_turn(user: str | None, hist: UserHistory | None, payload: dict | None, reply: str) -> None:
+    if hist is None or not user or not isinstance(payload, dict):
+        return
+    user_text = _get_payload_value(payload, "message")
+    ts = payload.get("currentTime")
+    ts = ts if isinstance(ts, str) and ts else business_now()
+    turns = []
+    if isinstance(user_text, str) and user_text.strip():
+        turns.append({"role": "user", "content": user_text.strip(), "ts": ts})
+    if reply:
+        turns.append({"role": "assistant", "content": reply, "ts": ts})
+    await user_memory.append_turns(user, turns)
+
+
+def _record_turn(session: ChatSession | None, payload: dict | None, reply: str) -> None:
+    if session is None or not isinstance(payload, dict):
+        return
+    user_text = _get_payload_value(payload, "message")
+    ts = payload.get("currentTime")
+    session.record(
+        user_text.strip() if isinstance(user_text, str) else "",
+        reply or "",
+        ts if isinstance(ts, str) else None,
+    )
+    session_store.touch(session)
+    session_store.maybe_compact(session)
+
+
+async def _stream_reply(
+    ws: WebSocket, req_obj: ChatRequest, extra: Dict[str, Any] | None = None, ids: Dict[str, Any] | None = None
+) -> str:
+    """逐 token 转发增量输出；失败时以已收到的文本作为最终 reply，保证客户端总能收到结束帧。返回完整 reply。"""
+    parts: List[str] = []
+    usage = None
+    error = None
+    try:
+        async for ev in smart_stream(req_obj, route="chat"):
+            if ev.delta:
+                parts.append(ev.delta)
+                await _send(ws, {"delta": ev.delta, **(ids or {})})
+            if ev.done:
+                usage = ev.usage
+    except asyncio.CancelledError:
+        # 已生成的部分上游照样计费
+        if parts:
+            WS_WASTED_GENERATIONS_TOTAL.inc(reason="cancelled_midstream")
+        raise
+    except WebSocketDisconnect:
+        raise
+    except Exception as e:
+        logger.exception("LLM stream failed: %s", getattr(e, "detail", None) or e, exc_info=e)
+        error = _client_error(e)
+    reply = "".join(parts)
+    _count_reply(reply, error)
+    await _send_reply(ws, {"reply": reply, "usage": usage, "done": True, **({"error": error} if error else {}), **(extra or {})})
+    return reply
 
 
 def _get_payload_value(payload: Any, key: str) -> Any:
@@ -214,123 +437,32 @@ def _get_payload_value(payload: Any, key: str) -> Any:
     return None
 
 
-def _render_prechat_value(v: Any, pivot: datetime | None) -> str:
-    if v is None:
-        return ""
-    if isinstance(v, str):
-        return v
-    if isinstance(v, list):
-        items = _sort_items_closest_to(v, pivot)
-        return _render_messages_value(items, pivot)
-    if isinstance(v, dict):
-        # best-effort: try common message list fields
-        for k in ("messages", "items", "list"):
-            if k in v and isinstance(v.get(k), list):
-                return _render_messages_value(_sort_items_closest_to(v.get(k), pivot), pivot)
-    return _stringify_value(v)
-
-
-def _render_predaily_summary_value(v: Any, pivot: datetime | None) -> str:
-    if v is None:
-        return ""
-    if isinstance(v, str):
+def _render_context_value(key: str, v: Any, pivot: datetime | None) -> str:
+    """历史类参数按 token 预算打包成紧凑文本，其余参数直接字符串化。"""
+    if key == "preChat":
+        return pack_prechat(v, pivot).text
+    if key == "preDailySummary":
+        return pack_daily_summaries(v, pivot).text
+    return stringify_value(v)
+
+def _resolve_summaries(payload: dict, v: Any, memory_key: str | None) -> Any:
+    """
+    {preDailySummary}：客户端带来的总结先增量写入 memory_key 的检索索引，
+    再按当前消息取最相关的 MEMORY_TOP_K 条；没有 memory_key 或索引为空时原样使用 v。
+    memory_key 由连接决定（已校验的 openid 或连接临时 key），不取 payload 中的 openid。
+    """
+    if not MEMORY_RETRIEVAL_ENABLED or not memory_key or isinstance(v, str):
         return v
-    if isinstance(v, list):
-        items = _sort_items_closest_to(v, pivot)
-        lines: List[str] = []
-        for it in items:
-            if not isinstance(it, dict):
-                s = _stringify_value(it).strip()
-                if s:
-                    lines.append(s)
-                continue
-            dt = _extract_item_dt(it)
-            if dt is not None:
-                # include time if present
-                date_s = dt.strftime("%Y-%m-%d %H:%M")
-            else:
-                date_s = _stringify_value(it.get("summaryDate") or it.get("summary_date") or "").strip()
-            title = _stringify_value(it.get("articleTitle") or it.get("title") or "").strip()
-            memory = _stringify_value(it.get("memoryPoint") or "").strip()
-            analyze = _stringify_value(it.get("analyzeResult") or "").strip()
-            article = _stringify_value(it.get("article") or it.get("summary") or "").strip()
-
-            head_parts: List[str] = []
-            if date_s:
-                head_parts.append(date_s)
-            if title:
-                head_parts.append(title)
-            head = " ".join(head_parts).strip()
-
-            extra = memory or analyze or article
-            if extra:
-                # truncate to save tokens
-                if len(extra) > 160:
-                    extra = extra[:160] + "…"
-                lines.append(f"{head}: {extra}" if head else extra)
-            elif head:
-                lines.append(head)
-        return "\n".join([x for x in lines if x])
-
-    if isinstance(v, dict):
-        for k in ("items", "list", "summaries"):
-            if k in v and isinstance(v.get(k), list):
-                return _render_predaily_summary_value(v.get(k), pivot)
-    return _stringify_value(v)
-
-
-def build_prompt_messages(prompts: Dict[str, Any], payload: Dict[str, Any]) -> List[Dict[str, str]]:
-    out: List[Dict[str, str]] = []
-    pivot = _parse_dt(payload.get("currentTime")) if isinstance(payload, dict) else None
-
-    def _process(template: Dict[str, Any]) -> None:
-        role = template.get("role")
-        content = template.get("content")
-        if not role or content is None:
-            return
-
-        needArgs = template.get("needArgs") or []
-        # needArgs empty => keep content
-        if not needArgs:
-            out.append({"role": str(role), "content": str(content)})
-            return
-
-        # needArgs non-empty => all must exist and not None
-        resolved: Dict[str, Any] = {}
-        for k in needArgs:
-            v = _get_payload_value(payload, str(k))
-            if v is None:
-                return  # skip this message
-            resolved[str(k)] = v
-
-        rendered = str(content)
-
-        # For now, do not do special rendering for preChat / preDailySummary.
-        # Inject raw payload values (stringify only for non-strings).
-        for k, v in resolved.items():
-            rendered_v = v if isinstance(v, str) else _stringify_value(v)
-            rendered = rendered.replace("{" + str(k) + "}", rendered_v)
-
-        out.append({"role": str(role), "content": rendered})
-
-    # 1) system messages (highest priority)
-    for m in (prompts.get("systemMessages") or []):
-        if isinstance(m, dict):
-            _process(m)
-
-    # 2) context messages (optional, placed between system and user)
-    for m in (prompts.get("contextMessages") or []):
-        if isinstance(m, dict):
-            _process(m)
-
-    # 3) user messages
-    for m in (prompts.get("userMessages") or []):
-        if isinstance(m, dict):
-            _process(m)
-
-    return out
-
-def _build_chat_request(payload: dict | None, raw_text: str, prompts: dict) -> ChatRequest:
+    items = unwrap_list(v, ("items", "list", "summaries"))
+    if items:
+        memory_store.add(memory_key, items)
+    message = _get_payload_value(payload, "message")
+    picked = memory_store.select(memory_key, message if isinstance(message, str) else "", MEMORY_TOP_K)
+    return picked or v
+
+def _build_chat_request(
+    payload: dict | None, raw_text: str, compiled: CompiledPrompt, memory_key: str | None = None
+) -> ChatRequest:
     b = ChatRequest.builder()
 
     # model
@@ -347,22 +479,41 @@ def _build_chat_request(payload: dict | None, raw_text: str, prompts: dict) -> C
         if isinstance(mt, int):
             b.max_completion_tokens(mt)
 
-    # messages (built from chat_prompts.json)
+    # messages (built from precompiled chat_prompts.json)
     if isinstance(payload, dict):
-        messages = build_prompt_messages(prompts, payload)
-        for m in messages:
-            role = m.get("role")
-            content = m.get("content")
-            if role and content is not None:
-                b.addMessage(role, content)
+        pivot = parse_dt(payload.get("currentTime"))
+        messages = compiled.render(
+            lambda k: (
+                _resolve_summaries(payload, _get_payload_value(payload, k), memory_key)
+                if k == "preDailySummary" else _get_payload_value(payload, k)
+            ),
+            lambda k, v: _render_context_value(k, v, pivot),
+        )
+        b.addMessages(messages)
+        if compiled.static_count:
+            b.encoded_prefix(compiled.static_json, compiled.static_count, compiled.prefix_hash)
 
     return b.build()    
 
-def _load_chat_prompts():
-    cfg_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), "config", "chat_prompts_v2.json")
+def _load_chat_prompts() -> CompiledPrompt:
+    # 内存读取 + 按 etag 缓存的预编译模板；文件变更由 prompt_registry 后台热加载
     try:
-        with open(cfg_path, "r", encoding="utf-8") as f:
-            return json.load(f)
+        return get_compiled(CHAT_PROMPTS_NAME)
     except Exception:
         logger.exception("Failed to load chat prompts json")
-        raise HTTPException(status_code=500, detail="chat prompts json 加载失败")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail="chat prompts json 加载失败")
+
+
+def _warm_chat() -> None:
+    """启动预热：编译 chat 提示词，并用示例数据完整组装一次请求（走一遍渲染 / 打包 / 编码路径）。"""
+    now = time.strftime("%Y-%m-%d %H:%M:%S")
+    sample = {
+        "message": "你好",
+        "currentTime": now,
+        "preChat": [{"role": "user", "content": "你好", "ts": now}],
+        "preDailySummary": [{"summaryDate": now[:10], "articleTitle": "预热", "memoryPoint": "预热", "article": "预热"}],
+    }
+    _build_chat_request(sample, "", _load_chat_prompts())
+
+
+register_warmup("chat", _warm_chat)
@@ -1,19 +1,46 @@
 # 新增：总结接口
 
-from fastapi import APIRouter, HTTPException
-from pydantic import BaseModel
+from fastapi import APIRouter, Header, HTTPException, Request
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, ValidationError
 from typing import List, Optional, Literal
 from models.chat_models import ChatRequest, Message
-from services.llm_clients import smart_call, DEFAULT_MODEL
-from typing import List, Optional, Union, Dict, Any, Literal
-from models.record_model import Record,SummaryReq,SummarizeResultResp
+from services.llm_clients import smart_call, smart_stream, DEFAULT_MODEL
+from typing import List, Optional, Union, Dict, Any, Literal, Tuple
+from models.record_model import Record,SummaryReq,SummaryBatchReq,SummarizeResultResp,DailySummaryModel
+from services.prompt_registry import prompt_registry
+from services.prompt_compiler import get_compiled
+from services.summary_cache import CacheControl, make_cache_key, summary_cache
+from services.singleflight import summary_flight
+from services.context_packer import pack_daily_summaries
+from services.memory_index import memory_store
+from services.identity import bearer_token, verify_token
+from services.timeline import business_today
+from services.user_memory import user_memory
+from services.warmup import register_warmup
+from services.metrics import LLM_PARSE_TOTAL, PARSE_SECONDS, PROMPT_BUILD_SECONDS
+from core.config import (
+    CONTEXT_BUDGET_SUMMARY_HISTORY,
+    SUMMARY_BATCH_CONCURRENCY,
+    SUMMARY_BATCH_MAX_CONCURRENCY,
+    SUMMARY_BATCH_MAX_ITEMS,
+    SUMMARY_BATCH_ITEM_TIMEOUT,
+    SUMMARY_FILL_MAX_TOKENS,
+    SUMMARY_FILL_MAX_TOKENS_LONG,
+)
+from utils.parsing import IncrementalJsonFieldParser, parse_json_object
+from utils.json_codec import dumps
+import asyncio
 import json
 import os
 import re
+import time
 import logging
 
-# 是否允许在缺少 moodKeywords 时进行一次极简补充调用
-FILL_MOOD_WITH_LLM = True
+# 是否允许在结果缺少字段（moodKeywords 等）时进行一次只生成缺失字段的补充调用
+FILL_MOOD_WITH_LLM = os.getenv("SUMMARY_FILL_MISSING", "1") == "1"
+
+SUMMARY_PROMPTS_NAME = "summary_prompts_v2"
 
 router = APIRouter(prefix="/summary")
 
@@ -23,7 +50,331 @@ logger = logging.getLogger("uvicorn.error")
 
 # ================= 主逻辑 =================
 @router.post("/daily", response_model=SummarizeResultResp)
-async def summarize(body: SummaryReq):
+async def summarize(
+    body: SummaryReq,
+    request: Request,
+    cache_control: Optional[str] = Header(None),
+    idempotency_key: Optional[str] = Header(None),
+):
+    return await _cancel_on_disconnect(
+        request,
+        run_daily_summary(
+            body, CacheControl.parse(cache_control), idempotency_key, _verified_user(request), business_today()
+        ),
+    )
+
+
+def _verified_user(request: Request) -> Optional[str]:
+    """Authorization: Bearer <token> 校验通过的 openid。"""
+    return verify_token(bearer_token(request.headers))
+
+
+def _flight_key(cache_key: str, idempotency_key: Optional[str], user: Optional[str]) -> str:
+    if not idempotency_key:
+        return cache_key
+    if user:
+        return f"idem:user:{user}:{idempotency_key}"
+    return f"idem:anon:{idempotency_key}:{cache_key}"
+
+
+def _memory_owner(body: SummaryReq, user: Optional[str]) -> Optional[str]:
+    """已校验身份与请求的 openid 一致时返回它（可读写该用户的存储记忆），否则 None。"""
+    return user if user and user == body.openid else None
+
+
+async def run_daily_summary(
+    body: SummaryReq,
+    cc: CacheControl = CacheControl(),
+    idempotency_key: Optional[str] = None,
+    user: Optional[str] = None,
+    summary_date: Optional[str] = None,
+) -> SummarizeResultResp:
+    """/daily 的完整逻辑，参数与行为见 run_daily_summary_status；只返回结果。"""
+    result, _ = await run_daily_summary_status(body, cc, idempotency_key, user, summary_date)
+    return result
+
+
+async def run_daily_summary_status(
+    body: SummaryReq,
+    cc: CacheControl = CacheControl(),
+    idempotency_key: Optional[str] = None,
+    user: Optional[str] = None,
+    summary_date: Optional[str] = None,
+) -> Tuple[SummarizeResultResp, bool]:
+    """
+    返回 (结果, 是否字段齐全)；解析失败 / 缺字段时为 False（离线任务据此记为失败以便重跑）。
+    /daily 的完整逻辑（可被其他入口直接调用）：查缓存 → 合并并发的相同请求 → 调 LLM → 解析 → 写缓存。
+    传了 Idempotency-Key 时以已校验身份 + key 合并（无身份时还要求请求内容相同，防止冒用他人 openid 加入其请求），
+    否则以请求内容哈希合并。
+    user 为已校验身份的 openid：只有与 body.openid 一致时才读写该用户的存储记忆（历史总结 + 检索索引）。
+    结果记在 body.summaryDate（没有时用 summary_date）名下；两者都没有时不保存结果。
+    """
+    owner = _memory_owner(body, user)
+    date = body.summaryDate or summary_date
+    body = await _with_stored_history(body, owner, date)
+    with PROMPT_BUILD_SECONDS.time(route="summary"):
+        req = _build_summary_request(body)
+    key = _summary_cache_key(body, req)
+    cached = await summary_cache.get(key, cc)
+    if cached is not None:
+        logger.info("daily summary cache hit key=%s", key[:16])
+        await _remember(body, cached, owner, date)
+        return SummarizeResultResp(**cached), True  # 只有字段齐全的结果会进缓存
+
+    flight_key = _flight_key(key, idempotency_key, user)
+    # 与结果缓存同一个门槛：解析失败 / 缺字段的结果不在窗口内复用，重试会重新生成
+    result, complete = await summary_flight.do(
+        flight_key, lambda: _generate_summary(req, key, cc), use_recent=cc.read, remember=lambda r: r[1]
+    )
+    await _remember(body, result.model_dump(), owner, date)
+    return result, complete
+
+
+async def _with_stored_history(body: SummaryReq, user: Optional[str], date: Optional[str]) -> SummaryReq:
+    """客户端未带 preDailySummary 时用服务端保存的该用户历史总结（不含本次总结的日期）补上。"""
+    if body.preDailySummary or not user:
+        return body
+    hist = await user_memory.load(user)
+    if hist is None or not hist.summaries:
+        return body
+    items = []
+    for it in hist.summary_list(exclude_date=date or business_today()):
+        try:
+            items.append(DailySummaryModel.model_validate(it))
+        except ValidationError:
+            continue
+    return body.model_copy(update={"preDailySummary": items}) if items else body
+
+
+async def _remember(body: SummaryReq, result: Dict[str, Any], user: Optional[str], date: Optional[str]) -> None:
+    """
+    把请求带来的历史总结与本次结果（记在 date 名下）增量写入已校验用户的检索索引（供 /ws/chat 按相关度注入）
+    与持久化的用户记忆（之后的请求可以不再上传历史）。没有已校验用户时什么都不写；没有 date 时只写历史总结。
+    """
+    if not user:
+        return
+    items = [item.model_dump() for item in body.preDailySummary]
+    if date and result.get("articleTitle") and not _missing_fields(result):
+        items.append({**result, "summaryDate": date})
+    memory_store.add(user, items)
+    await user_memory.save_summaries(user, items)
+
+
+async def _generate_summary(req: ChatRequest, key: str, cc: CacheControl) -> Tuple[SummarizeResultResp, bool]:
+    """返回 (结果, 是否字段齐全)；只有字段齐全的结果会写入缓存。"""
+    raw = await smart_call(req, route="summary")
+    # 请求 / 响应全文由 llm_clients 按采样率记录，这里只记大小
+    logger.info("LLM raw output len=%d", len(raw or ""))
+    with PARSE_SECONDS.time(route="summary"):
+        obj = _parse_llm_output(raw or "", route="summary")
+    obj = await _fill_missing_fields(req, obj)
+    result = _to_result(obj)
+    # 只缓存字段齐全的结果；缺字段时让下次请求重新生成
+    complete = bool(obj) and not _missing_fields(obj)
+    if complete:
+        await summary_cache.put(key, result.model_dump(), cc)
+    return result, complete
+
+
+async def _cancel_on_disconnect(request: Request, coro):
+    """客户端断开时取消 coro（single-flight 中若无其他等待者，会随之取消上游调用）。"""
+    task = asyncio.ensure_future(coro)
+
+    async def _wait_disconnect():
+        # 请求体已被读完，后续 receive 会一直阻塞到 http.disconnect
+        while (await request.receive())["type"] != "http.disconnect":
+            pass
+
+    watcher = asyncio.ensure_future(_wait_disconnect())
+    try:
+        done, _ = await asyncio.wait({task, watcher}, return_when=asyncio.FIRST_COMPLETED)
+    except asyncio.CancelledError:
+        task.cancel()
+        raise
+    finally:
+        watcher.cancel()
+    if task in done:
+        return task.result()
+    task.cancel()
+    logger.info("daily summary client disconnected, request cancelled")
+    raise HTTPException(status_code=499, detail="client disconnected")
+
+
+# ================= 批量版本 =================
+@router.post("/daily/batch")
+async def summarize_batch(
+    body: SummaryBatchReq,
+    request: Request,
+    cache_control: Optional[str] = Header(None),
+):
+    """
+    批量总结：固定数量的 worker 从队列取任务，走与 /daily 相同的缓存 / 合并 / LLM 路径，
+    每完成一条立即输出一行 NDJSON（按完成顺序，不按提交顺序）：
+      {"event": "result", "index": 0, "openid": "...", "data": {...SummarizeResultResp}}
+      {"event": "error",  "index": 1, "openid": "...", "status": 502, "detail": "..."}
+      {"event": "done", "total": N, "succeeded": n, "failed": m, "costMs": ...}
+    单条失败或超时不影响其他条目；客户端断开时取消未完成的任务。
+    只有 openid 与 Authorization 校验出的用户一致、且带 summaryDate 的条目会保存结果到用户记忆。
+    """
+    if not body.items:
+        raise HTTPException(status_code=400, detail="items 不能为空")
+    if len(body.items) > SUMMARY_BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=413, detail=f"items 最多 {SUMMARY_BATCH_MAX_ITEMS} 条")
+    cc = CacheControl.parse(cache_control)
+    user = _verified_user(request)
+    concurrency = min(max(1, body.concurrency or SUMMARY_BATCH_CONCURRENCY), SUMMARY_BATCH_MAX_CONCURRENCY)
+    concurrency = min(concurrency, len(body.items))
+
+    async def _gen():
+        start = time.monotonic()
+        pending: "asyncio.Queue[int]" = asyncio.Queue()
+        for i in range(len(body.items)):
+            pending.put_nowait(i)
+        done_q: "asyncio.Queue[Dict[str, Any]]" = asyncio.Queue()
+
+        async def _worker():
+            while True:
+                try:
+                    i = pending.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                item = body.items[i]
+                event: Dict[str, Any] = {"index": i, "openid": item.openid}
+                try:
+                    coro = run_daily_summary(item, cc, user=user)
+                    if SUMMARY_BATCH_ITEM_TIMEOUT > 0:
+                        coro = asyncio.wait_for(coro, SUMMARY_BATCH_ITEM_TIMEOUT)
+                    result = await coro
+                    event.update(event="result", data=result.model_dump())
+                except asyncio.TimeoutError:
+                    event.update(event="error", status=504, detail="item timeout")
+                except HTTPException as e:
+                    event.update(event="error", status=e.status_code, detail=e.detail)
+                except Exception as e:
+                    logger.exception("daily summary batch item failed index=%s", i)
+                    event.update(event="error", status=500, detail=str(e))
+                await done_q.put(event)
+
+        workers = [asyncio.create_task(_worker()) for _ in range(concurrency)]
+        succeeded = failed = 0
+        try:
+            for _ in range(len(body.items)):
+                event = await done_q.get()
+                if event["event"] == "result":
+                    succeeded += 1
+                else:
+                    failed += 1
+                yield dumps(event) + "\n"
+            yield dumps({
+                "event": "done",
+                "total": len(body.items),
+                "succeeded": succeeded,
+                "failed": failed,
+                "costMs": int((time.monotonic() - start) * 1000),
+            }) + "\n"
+        finally:
+            # 正常结束时 worker 均已退出；客户端断开时取消剩余任务
+            for w in workers:
+                w.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+
+    return StreamingResponse(_gen(), media_type="application/x-ndjson")
+
+
+# ================= 流式版本 =================
+@router.post("/daily/stream")
+async def summarize_stream(
+    body: SummaryReq,
+    request: Request,
+    format: str = "ndjson",
+    cache_control: Optional[str] = Header(None),
+):
+    """
+    流式总结：上游 token 流边到边增量解析 JSON，每个顶层字段（articleTitle / moodKeywords / article ...）
+    一完整就推送一条事件；最后一条 result 事件与 /daily 的 SummarizeResultResp 一致。
+
+    事件格式（NDJSON 每行一个；format=sse 或 Accept: text/event-stream 时为 SSE）：
+      {"event": "field", "key": "articleTitle", "value": "..."}
+      {"event": "result", "data": {...SummarizeResultResp}}
+      {"event": "error", "detail": "..."}
+    命中缓存时立即推送全部字段与 result。
+    """
+    owner = _memory_owner(body, _verified_user(request))
+    date = body.summaryDate or business_today()
+    body = await _with_stored_history(body, owner, date)
+    with PROMPT_BUILD_SECONDS.time(route="summary"):
+        req = _build_summary_request(body)
+    cc = CacheControl.parse(cache_control)
+    key = _summary_cache_key(body, req)
+    use_sse = format == "sse" or "text/event-stream" in request.headers.get("accept", "")
+
+    def _frame(event: Dict[str, Any]) -> str:
+        data = dumps(event)
+        return f"event: {event['event']}\ndata: {data}\n\n" if use_sse else data + "\n"
+
+    async def _gen():
+        cached = await summary_cache.get(key, cc)
+        if cached is not None:
+            await _remember(body, cached, owner, date)
+            for k in _STREAM_FIELDS:
+                yield _frame({"event": "field", "key": k, "value": cached.get(k, "")})
+            yield _frame({"event": "result", "data": cached})
+            return
+
+        parser = IncrementalJsonFieldParser()
+        parts: List[str] = []
+        sent = set()
+        try:
+            async for ev in smart_stream(req, route="summary"):
+                if not ev.delta:
+                    continue
+                parts.append(ev.delta)
+                for field, value in parser.feed(ev.delta):
+                    if isinstance(value, str):
+                        value = _clean_text(value)
+                    sent.add(field)
+                    yield _frame({"event": "field", "key": field, "value": value})
+        except Exception as e:
+            logger.exception("daily summary stream failed", exc_info=e)
+            detail = e.detail if isinstance(e, HTTPException) else str(e)
+            yield _frame({"event": "error", "detail": detail})
+            return
+        raw = "".join(parts)
+        logger.info("LLM raw output len=%d (stream)", len(raw))
+        with PARSE_SECONDS.time(route="summary_stream"):
+            obj = _parse_llm_output(raw, route="summary_stream")
+        obj = await _fill_missing_fields(req, obj)
+        # 修复或补充调用才得到的字段在 result 之前补发
+        for k in _STREAM_FIELDS:
+            if k not in sent and isinstance(obj.get(k), str):
+                yield _frame({"event": "field", "key": k, "value": _clean_text(obj[k])})
+        result = _to_result(obj).model_dump()
+        if obj and not _missing_fields(obj):
+            await summary_cache.put(key, result, cc)
+        await _remember(body, result, owner, date)
+        yield _frame({"event": "result", "data": result})
+
+    media_type = "text/event-stream" if use_sse else "application/x-ndjson"
+    return StreamingResponse(_gen(), media_type=media_type)
+
+
+# 命中缓存时按此顺序推送字段（与提示词要求的输出顺序一致）
+_STREAM_FIELDS = ("articleTitle", "moodKeywords", "actionKeywords", "memoryPoint", "analyzeResult", "article")
+
+
+def _summary_cache_key(body: SummaryReq, req: ChatRequest) -> str:
+    """规范化请求（不含 openid）+ summary 提示词 etag 与静态前缀摘要（区分提示词布局）+ 模型。"""
+    normalized = {
+        "type": body.type,
+        "text": body.text.strip(),
+        "preDailySummary": [item.model_dump() for item in body.preDailySummary],
+    }
+    prompt_version = f"{prompt_registry.etag(SUMMARY_PROMPTS_NAME)}:{req.prefix_hash or ''}"
+    return make_cache_key(normalized, prompt_version, req.model)
+
+
+def _build_summary_request(body: SummaryReq) -> ChatRequest:
+    """校验请求并组装 summary 的 ChatRequest；校验失败抛 HTTPException。"""
     if body.type != "daily_summary":
         logger.error(f"Invalid summary type: {body.type}")
         raise HTTPException(status_code=400, detail="type 必须为 'daily_summary'")
@@ -31,23 +382,18 @@ async def summarize(body: SummaryReq):
         logger.error("Summary text is empty")
         raise HTTPException(status_code=400, detail="text 不能为空")
 
-    cfg_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), "config", "summary_prompts_v2.json")
     try:
-        with open(cfg_path, "r", encoding="utf-8") as f:
-            prompts = json.load(f)
+        prompts = prompt_registry.get(SUMMARY_PROMPTS_NAME)
+        # systemMessages 全部为静态模板：预编译后直接复用 Message 与预编码 JSON
+        system_compiled = get_compiled(SUMMARY_PROMPTS_NAME, sections=("systemMessages",))
     except Exception:
         logger.exception("Failed to load summary prompts json")
         raise HTTPException(status_code=500, detail="summary prompts json 加载失败")
 
-    system_messages_cfg = prompts.get("systemMessages") or []
     user_messages_cfg = prompts.get("userMessages") or []
     content_prefix = prompts.get("content_prefix") or "=== 待总结内容 ===\n"
 
-    system_messages = [
-        Message(role=m.get("role"), content=m.get("content", ""))
-        for m in system_messages_cfg
-        if (m or {}).get("role") == "system"
-    ]
+    system_messages = list(system_compiled.static_messages)
 
     user_messages = [
         str((m or {}).get("content", ""))
@@ -55,17 +401,19 @@ async def summarize(body: SummaryReq):
         if (m or {}).get("role") == "user"
     ]
 
-    # === 用户之前的每日总结 ===
+    # === 用户之前的每日总结（按 token 预算压缩，最新的优先）===
     pre_summary_block = ""
     if getattr(body, "preDailySummary", None):
         try:
-            pre_summary_json = json.dumps(
-                [item.dict() for item in body.preDailySummary],
-                ensure_ascii=False
+            packed = pack_daily_summaries(
+                [item.model_dump() for item in body.preDailySummary],
+                None,
+                CONTEXT_BUDGET_SUMMARY_HISTORY,
             )
-            pre_summary_block = "===用户之前的每日总结===\n" + pre_summary_json.strip()
+            if packed.text:
+                pre_summary_block = "===用户之前的每日总结===\n" + packed.text
         except Exception:
-            logger.exception("Failed to serialize preDailySummary")
+            logger.exception("Failed to pack preDailySummary")
 
     # === 待总结内容 ===
     user_main_block = content_prefix + body.text
@@ -78,22 +426,70 @@ async def summarize(body: SummaryReq):
         ] if c
     ])
 
-
-    req = ChatRequest(
+    return ChatRequest(
         model=DEFAULT_MODEL,
         messages=[*system_messages, Message(role="user", content=user_combined)],
         max_completion_tokens=2000,
+        prefix_json=system_compiled.static_json or None,
+        prefix_count=system_compiled.static_count,
+        prefix_hash=system_compiled.prefix_hash or None,
+        json_mode=True,
+    )
+
+
+# ================= 缺失字段补充 =================
+
+def _missing_fields(obj: Dict[str, Any]) -> List[str]:
+    return [k for k in _STREAM_FIELDS if not isinstance(obj.get(k), str)]
+
+
+def _build_fill_request(req: ChatRequest, obj: Dict[str, Any], missing: List[str]) -> ChatRequest:
+    """
+    只生成缺失字段的补充请求：角色设定 + 缺失字段各自的规则（systemMessages 中以 "<字段>字段" 开头的条目），
+    用户内容沿用原请求，并附上已生成的字段以保持一致。
+    """
+    system_cfg = prompt_registry.get(SUMMARY_PROMPTS_NAME).get("systemMessages") or []
+    contents = [str((m or {}).get("content", "")) for m in system_cfg if (m or {}).get("role") == "system"]
+    rules = [c for c in contents[1:] if any(c.startswith(f"{k}字段") for k in missing)]
+    messages = [Message(role="system", content=c) for c in contents[:1] + rules]
+    messages.append(Message(role="system", content=f"只输出一个JSON对象，且只包含以下字段:{','.join(missing)}"))
+    present = {k: obj[k][:300] for k in _STREAM_FIELDS if isinstance(obj.get(k), str) and obj[k].strip()}
+    user = req.messages[-1].content
+    if present:
+        user += "\n===已生成的字段（内容需与之一致，不要重复输出）===\n" + dumps(present)
+    messages.append(Message(role="user", content=user))
+    long_fields = {"article", "analyzeResult"}
+    return ChatRequest(
+        model=req.model,
+        messages=messages,
+        max_completion_tokens=SUMMARY_FILL_MAX_TOKENS_LONG if long_fields & set(missing) else SUMMARY_FILL_MAX_TOKENS,
+        json_mode=True,
     )
-    logger.info("daily summary request"+str(req))
-    raw = await smart_call(req)
-    logger.info("daily summary response"+raw)
+
+
+async def _fill_missing_fields(req: ChatRequest, obj: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    解析结果缺少部分字段时，用一次补充调用只生成这些字段并合并；补充失败时返回原结果。
+    完全没有解析出字段时不补充（等价于整次重新生成，交给调用方重试）。
+    """
+    missing = _missing_fields(obj)
+    if not FILL_MOOD_WITH_LLM or not obj or not missing:
+        return obj
+    logger.info("summary output missing fields=%s, requesting fill", missing)
     try:
-        s = str(raw)
-        logger.info("LLM raw output len=%d head=%s", len(s), s)
-    except Exception:
-        logger.exception("Failed to log LLM raw output")
-    obj = _parse_llm_output(raw or "")
+        raw = await smart_call(_build_fill_request(req, obj, missing), route="summary_fill")
+    except Exception as e:
+        logger.warning("summary fill call failed: %s", getattr(e, "detail", None) or e)
+        return obj
+    fill = _parse_llm_output(raw or "", route="summary_fill")
+    merged = dict(obj)
+    for k in missing:
+        if isinstance(fill.get(k), str):
+            merged[k] = fill[k]
+    return merged
+
 
+def _to_result(obj: Dict[str, Any]) -> SummarizeResultResp:
     # 解析失败 → 直接返回空 json
     if not obj:
         return SummarizeResultResp(
@@ -119,30 +515,16 @@ async def summarize(body: SummaryReq):
     )
 
 
-def _parse_llm_output(raw: str) -> Dict[str, Any]:
-    if not raw:
-        return {}
-
-    raw = raw.strip()
-
-    # 有些模型会输出 ```json ... ```，这里先去掉外壳
-    if raw.startswith("```") and raw.endswith("```"):
-        raw = raw.strip("`").strip()
-        # 再防止前面有 json
-        if raw.lower().startswith("json"):
-            raw = raw[4:].strip()
-
-    # 第一次尝试
-    first = _try_parse_json(raw)
-    if isinstance(first, dict):
-        return first
-    if isinstance(first, str):
-        second = _try_parse_json(first)
-        if isinstance(second, dict):
-            return second
-
-    # 解析失败，直接返回空
-    return {}
+def _parse_llm_output(raw: str, route: str = "summary") -> Dict[str, Any]:
+    """
+    容错解析：```json 外壳、前后说明文字、尾随逗号、中文引号、截断等由 parse_json_object 修复，
+    尽量保留能解析的字段；完全无法解析时返回 {}。
+    """
+    obj, outcome = parse_json_object(raw)
+    LLM_PARSE_TOTAL.inc(route=route, outcome=outcome)
+    if outcome != "ok":
+        logger.warning("LLM output parse outcome=%s route=%s fields=%s len=%d", outcome, route, sorted(obj), len(raw))
+    return obj
 
 
 def _clean_text(s: str) -> str:
@@ -150,15 +532,17 @@ def _clean_text(s: str) -> str:
         return ""
     return s.strip()
 
-def _try_parse_json(s: str):
-    try:
-        return json.loads(s)
-    except Exception:
-        return None
-    
 def _as_str(v) -> str:
     if v is None:
         return ""
     if isinstance(v, (dict, list)):
         return json.dumps(v, ensure_ascii=False)
     return str(v)
+
+
+def _warm_summary() -> None:
+    """启动预热：编译 summary 提示词并组装一次请求。"""
+    _build_summary_request(SummaryReq(type="daily_summary", openid="", text="预热"))
+
+
+register_warmup("summary", _warm_summary)
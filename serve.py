@@ -0,0 +1,82 @@
+# 生产启动入口：python serve.py
+#
+# 多 worker 进程共享同一个监听端口（uvicorn 的 Multiprocess supervisor），worker 数默认按可用 CPU 计算
+# （CPU 亲和性与容器 cgroup CPU 配额取小）。每个 worker 有自己的上游连接池、提示词缓存、会话表与限流器；
+# 限流配置按 worker 数均分。SQLite（summary 缓存 / 用户记忆）以 WAL 模式在 worker 间共享；
+# 用户记忆的内存层按 USER_MEMORY_HOT_TTL 过期重读，会话不共享（见 services/chat_session.py）。
+#
+# 指标与 /api/stats/* 同样按 worker 统计：共享端口上的 /metrics 每次只返回接到请求的那个 worker 的数据。
+# 设置 METRICS_PORT 后每个 worker 另占 METRICS_PORT .. METRICS_PORT + worker 数 - 1 中的一个端口单独暴露指标，
+# Prometheus 把这组端口都配成抓取目标，再按 sum without(instance) 汇总（见 services/metrics.py）。
+#
+# 停止时（SIGTERM）每个 worker 先排空 /ws/chat（见 services/lifecycle.py），容器的停止宽限期
+# （docker stop -t / terminationGracePeriodSeconds）应大于 2 × SHUTDOWN_DRAIN_SECONDS。
+# 开发时仍可直接 uvicorn main:app --reload。
+
+import math
+import os
+
+import uvicorn
+
+from core.config import SERVE_HOST, SERVE_PORT, SERVE_WORKERS, SHUTDOWN_DRAIN_SECONDS
+
+
+def _cgroup_cpu_quota() -> float | None:
+    """容器的 CPU 配额（核数）；未限制或读取失败时返回 None。"""
+    try:
+        # cgroup v2："max 100000" 或 "200000 100000"
+        with open("/sys/fs/cgroup/cpu.max") as f:
+            quota, period = f.read().split()[:2]
+        if quota != "max":
+            return int(quota) / int(period)
+        return None
+    except (OSError, ValueError):
+        pass
+    try:
+        # cgroup v1
+        with open("/sys/fs/cgroup/cpu/cpu.cfs_quota_us") as f:
+            quota = int(f.read())
+        with open("/sys/fs/cgroup/cpu/cpu.cfs_period_us") as f:
+            period = int(f.read())
+        return quota / period if quota > 0 and period > 0 else None
+    except (OSError, ValueError):
+        return None
+
+
+def available_cpus() -> int:
+    try:
+        n = len(os.sched_getaffinity(0))
+    except AttributeError:
+        n = os.cpu_count() or 1
+    quota = _cgroup_cpu_quota()
+    if quota is not None:
+        n = min(n, math.ceil(quota))
+    return max(1, n)
+
+
+def resolve_workers() -> int:
+    if SERVE_WORKERS > 0:
+        return SERVE_WORKERS
+    env = os.getenv("WEB_CONCURRENCY")
+    if env and env.isdigit() and int(env) > 0:
+        return int(env)
+    return available_cpus()
+
+
+def main() -> None:
+    workers = resolve_workers()
+    # worker 进程以 spawn 方式启动、重新读取配置：把实际 worker 数传下去（限流份额按它计算）
+    os.environ["SERVE_WORKERS"] = str(workers)
+    uvicorn.run(
+        "main:app",
+        host=SERVE_HOST,
+        port=SERVE_PORT,
+        workers=workers,
+        log_level="info",
+        # WebSocket 已由应用自己排空；这里是留给进行中 HTTP 请求（如 /summary/daily）的时间
+        timeout_graceful_shutdown=int(SHUTDOWN_DRAIN_SECONDS),
+    )
+
+
+if __name__ == "__main__":
+    main()
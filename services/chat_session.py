@@ -0,0 +1,166 @@
+# /ws/chat 服务端会话：保存每个连接的轮次历史，客户端只需发送新消息；历史过长时后台压缩成摘要
+
+import asyncio
+import logging
+import secrets
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+from core.config import (
+    SESSION_TTL,
+    SESSION_MAX_SESSIONS,
+    SESSION_COMPACT_THRESHOLD,
+    SESSION_KEEP_RECENT,
+    SESSION_MAX_TURNS,
+    SESSION_COMPACT_MODEL,
+)
+from models.chat_models import ChatRequest, Message
+from services.context_packer import render_message_line
+from services.llm_clients import smart_call
+from services.timeline import business_now
+
+logger = logging.getLogger("uvicorn.error")
+
+__all__ = ["ChatSession", "SessionStore", "session_store"]
+
+_COMPACT_SYSTEM_PROMPT = (
+    "你是对话压缩助手。请把下面的历史对话压缩成不超过200字的要点摘要："
+    "保留用户提到的人物、事件、情绪变化和尚未聊完的话题；用第三人称，不要逐句复述，不要添加原文没有的信息。"
+)
+
+
+@dataclass
+class ChatSession:
+    session_id: str
+    # 创建该会话的用户（openid，可为空）；恢复时必须一致
+    owner: str = ""
+    # 每条：{"role": "user"|"assistant", "content": str, "ts": str}
+    turns: List[Dict[str, Any]] = field(default_factory=list)
+    # 已压缩的早前对话摘要
+    summary: str = ""
+    last_active: float = field(default_factory=time.monotonic)
+    _compacting: Optional[asyncio.Task] = field(default=None, repr=False)
+
+    def history_items(self) -> List[Dict[str, Any]]:
+        """作为 preChat 注入的历史：摘要（若有）+ 最近轮次。"""
+        items: List[Dict[str, Any]] = []
+        if self.summary:
+            items.append({"role": "system", "content": f"[早前对话摘要] {self.summary}"})
+        items.extend(self.turns)
+        return items
+
+    def is_empty(self) -> bool:
+        return not self.turns and not self.summary
+
+    def record(self, user_text: str, reply: str, ts: Optional[str]) -> None:
+        ts = ts or business_now()
+        if user_text:
+            self.turns.append({"role": "user", "content": user_text, "ts": ts})
+        if reply:
+            self.turns.append({"role": "assistant", "content": reply, "ts": ts})
+        self.last_active = time.monotonic()
+
+
+class SessionStore:
+    """
+    进程内会话表：LRU + TTL。多 worker 部署时重连落到其他 worker 会得到 session_not_found，
+    客户端新建会话即可：已登录用户的新会话会用持久化的最近轮次（user_memory）打底。
+    会话 id 只由服务端生成（不可猜测）；未知 id 或与创建者不一致的恢复请求一律视为不存在。
+    """
+
+    def __init__(self, ttl: float = SESSION_TTL, max_sessions: int = SESSION_MAX_SESSIONS):
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self._sessions: "OrderedDict[str, ChatSession]" = OrderedDict()
+        self.stats: Dict[str, int] = {
+            "created": 0, "resumed": 0, "not_found": 0, "compactions": 0, "compaction_failures": 0,
+        }
+
+    def _evict(self) -> None:
+        now = time.monotonic()
+        while self._sessions:
+            sid, s = next(iter(self._sessions.items()))
+            if len(self._sessions) > self.max_sessions or now - s.last_active > self.ttl:
+                self._sessions.pop(sid, None)
+                if s._compacting is not None:
+                    s._compacting.cancel()
+                continue
+            break
+
+    def create(self, owner: str = "") -> ChatSession:
+        self._evict()
+        s = ChatSession(session_id=secrets.token_urlsafe(18), owner=owner)
+        self._sessions[s.session_id] = s
+        self.stats["created"] += 1
+        return s
+
+    def resume(self, session_id: str, owner: str = "") -> Optional[ChatSession]:
+        """按 id 恢复会话；不存在、已过期或 owner 不一致时返回 None（不会按客户端给的 id 新建）。"""
+        self._evict()
+        s = self._sessions.get(session_id)
+        if s is None or not secrets.compare_digest(s.owner, owner):
+            self.stats["not_found"] += 1
+            return None
+        self._sessions.move_to_end(session_id)
+        s.last_active = time.monotonic()
+        self.stats["resumed"] += 1
+        return s
+
+    def touch(self, session: ChatSession) -> None:
+        session.last_active = time.monotonic()
+        if session.session_id in self._sessions:
+            self._sessions.move_to_end(session.session_id)
+
+    # ---------- 滚动压缩 ----------
+    def maybe_compact(self, session: ChatSession) -> None:
+        """轮次超过阈值时启动后台压缩（同一会话同时只有一个压缩任务）。"""
+        if len(session.turns) <= SESSION_COMPACT_THRESHOLD:
+            return
+        if session._compacting is not None and not session._compacting.done():
+            return
+        session._compacting = asyncio.create_task(self._compact(session))
+
+    async def _compact(self, session: ChatSession) -> None:
+        n = len(session.turns) - SESSION_KEEP_RECENT
+        if n <= 0:
+            return
+        old = session.turns[:n]
+        lines = [render_message_line(t) for t in old]
+        parts = []
+        if session.summary:
+            parts.append("已有摘要：" + session.summary)
+        parts.append("需要合并的对话：\n" + "\n".join(x for x in lines if x))
+        req = ChatRequest(
+            model=SESSION_COMPACT_MODEL,
+            messages=[
+                Message(role="system", content=_COMPACT_SYSTEM_PROMPT),
+                Message(role="user", content="\n".join(parts)),
+            ],
+            max_completion_tokens=400,
+        )
+        try:
+            # 独立路由：不走 chat 的对冲请求，也不混入 chat 的延迟统计与指标
+            summary = (await smart_call(req, route="compact") or "").strip()
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            self.stats["compaction_failures"] += 1
+            logger.exception("[session] compaction failed sid=%s", session.session_id)
+            summary = ""
+
+        if summary:
+            # 只移除参与压缩的那部分；压缩期间新追加的轮次保留
+            session.summary = summary
+            session.turns = session.turns[n:]
+            self.stats["compactions"] += 1
+            logger.info("[session] compacted sid=%s turns=%s -> %s", session.session_id, n, len(session.turns))
+        elif len(session.turns) > SESSION_MAX_TURNS:
+            session.turns = session.turns[-SESSION_MAX_TURNS:]
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {**self.stats, "active": len(self._sessions)}
+
+
+session_store = SessionStore()
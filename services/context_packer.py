@@ -0,0 +1,263 @@
+# 上下文打包：把 preChat / preDailySummary 按 token 预算渲染成紧凑文本，供 chat / summary 两个路由共用
+
+import json
+import logging
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+
+from core.config import CONTEXT_BUDGET_PRECHAT, CONTEXT_BUDGET_PREDAILY
+from services.timeline import TimelineIndex, extract_item_dt
+
+logger = logging.getLogger("uvicorn.error")
+
+__all__ = [
+    "PackResult",
+    "estimate_tokens",
+    "stringify_value",
+    "unwrap_list",
+    "render_message_line",
+    "pack_prechat",
+    "pack_daily_summaries",
+    "packer_stats",
+]
+
+
+# ================= 渲染 =================
+
+def stringify_value(v: Any) -> str:
+    """Convert payload values into a compact string for prompt injection."""
+    if v is None:
+        return ""
+    if isinstance(v, str):
+        return v
+    if isinstance(v, (int, float, bool)):
+        return str(v)
+    # lists/dicts -> json
+    try:
+        return json.dumps(v, ensure_ascii=False)
+    except Exception:
+        return str(v)
+
+
+# 时间解析与排序由 services.timeline 负责（每条只解析一次、记忆化、部分选择）
+_extract_item_dt = extract_item_dt
+
+# 渲染函数的 dt 参数缺省值：表示调用方未提供，需要自行从条目中提取
+_UNSET: Any = object()
+
+
+def _fmt_dt(dt: datetime, pivot: datetime | None) -> str:
+    """Compact datetime prefix for prompts. Uses month-day + HH:MM in pivot's local interpretation."""
+    try:
+        # Keep it short: MM-DD HH:MM
+        return dt.strftime("%m-%d %H:%M")
+    except Exception:
+        return ""
+
+
+def render_message_line(item: Any, pivot: datetime | None = None, dt: datetime | None = _UNSET) -> str:
+    """Render one message item into a compact line ("[MM-DD HH:MM] U:..." / "A:...")."""
+    if isinstance(item, dict):
+        role = stringify_value(item.get("role", "")).strip()
+        content = stringify_value(item.get("content", "")).strip()
+        if not content:
+            return ""
+
+        if dt is _UNSET:
+            dt = _extract_item_dt(item)
+        dt_prefix = _fmt_dt(dt, pivot) if dt is not None else ""
+        prefix = f"[{dt_prefix}] " if dt_prefix else ""
+
+        if role == "user":
+            return f"{prefix}U:{content}"
+        if role == "assistant":
+            return f"{prefix}A:{content}"
+        return f"{prefix}{content}"
+    return stringify_value(item).strip()
+
+
+def _render_summary_line(it: Any, dt: datetime | None = _UNSET) -> str:
+    """Render one daily summary item: "<date> <title>: <memory|analyze|article 截断>"."""
+    if not isinstance(it, dict):
+        return stringify_value(it).strip()
+    if dt is _UNSET:
+        dt = _extract_item_dt(it)
+    if dt is not None:
+        # include time if present
+        date_s = dt.strftime("%Y-%m-%d %H:%M")
+    else:
+        date_s = stringify_value(it.get("summaryDate") or it.get("summary_date") or "").strip()
+    title = stringify_value(it.get("articleTitle") or it.get("title") or "").strip()
+    memory = stringify_value(it.get("memoryPoint") or "").strip()
+    analyze = stringify_value(it.get("analyzeResult") or "").strip()
+    article = stringify_value(it.get("article") or it.get("summary") or "").strip()
+
+    head_parts: List[str] = []
+    if date_s:
+        head_parts.append(date_s)
+    if title:
+        head_parts.append(title)
+    head = " ".join(head_parts).strip()
+
+    extra = memory or analyze or article
+    if extra:
+        # truncate to save tokens
+        if len(extra) > 160:
+            extra = extra[:160] + "…"
+        return f"{head}: {extra}" if head else extra
+    return head
+
+
+# ================= 按预算打包 =================
+
+# 剩余预算不足该值时不再截断塞入半条，直接丢弃
+_MIN_TRUNCATE_TOKENS = 16
+
+# 累计统计（进程内）
+packer_stats: Dict[str, int] = {
+    "packed": 0,
+    "raw_tokens": 0,
+    "packed_tokens": 0,
+    "dropped_items": 0,
+    "truncated_items": 0,
+}
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    粗略 token 估算：中文等非 ASCII 字符约 1 token/字，ASCII 约 4 字符/token。
+    借助 utf-8 编码长度计算，避免逐字符循环。
+    """
+    if not text:
+        return 0
+    n = len(text)
+    non_ascii = (len(text.encode("utf-8")) - n) // 2
+    return non_ascii + (n - non_ascii + 3) // 4
+
+
+# 统计原始注入 token 时最多序列化的条目数：超过时等距抽样后按条数放大
+_RAW_SAMPLE_ITEMS = 32
+
+
+def _estimate_raw_tokens(v: Any, items: Optional[List[Any]]) -> int:
+    """估算原始值按 JSON 注入（旧逻辑）时的 token 数，仅用于统计节省量；长列表抽样估算，不序列化整段历史。"""
+    if items is None:
+        return estimate_tokens(stringify_value(v))
+    n = len(items)
+    if n <= _RAW_SAMPLE_ITEMS:
+        sample = items
+    else:
+        step = n / _RAW_SAMPLE_ITEMS
+        sample = [items[int(i * step)] for i in range(_RAW_SAMPLE_ITEMS)]
+    sampled = sum(estimate_tokens(stringify_value(it)) + 1 for it in sample)
+    return sampled * n // max(1, len(sample))
+
+
+def _truncate_to_tokens(text: str, budget: int) -> str:
+    if estimate_tokens(text) <= budget:
+        return text
+    cut = max(1, int(len(text) * budget / max(1, estimate_tokens(text))))
+    while cut > 1 and estimate_tokens(text[:cut]) + 1 > budget:
+        cut = int(cut * 0.9)
+    return text[:cut] + "…"
+
+
+@dataclass
+class PackResult:
+    text: str
+    raw_tokens: int        # 旧逻辑（整段 JSON 注入）的估算 token
+    packed_tokens: int
+    total: int = 0
+    kept: int = 0
+    truncated: int = 0
+
+    @property
+    def dropped(self) -> int:
+        return max(0, self.total - self.kept)
+
+    @property
+    def saved_tokens(self) -> int:
+        return max(0, self.raw_tokens - self.packed_tokens)
+
+
+def unwrap_list(v: Any, keys: tuple) -> Optional[List[Any]]:
+    if isinstance(v, list):
+        return v
+    if isinstance(v, dict):
+        for k in keys:
+            if isinstance(v.get(k), list):
+                return v.get(k)
+    return None
+
+
+def _pack(
+    section: str,
+    v: Any,
+    pivot: datetime | None,
+    budget: int,
+    list_keys: tuple,
+    render_line: Callable[[Any, datetime | None, datetime | None], str],
+) -> PackResult:
+    items = unwrap_list(v, list_keys)
+    raw_tokens = _estimate_raw_tokens(v, items)
+
+    if items is None:
+        text = stringify_value(v)
+        if budget > 0:
+            text = _truncate_to_tokens(text, budget)
+        res = PackResult(text=text, raw_tokens=raw_tokens, packed_tokens=estimate_tokens(text))
+    else:
+        # 按与 pivot 的接近程度惰性取出（堆上的部分选择），预算用完即停；输出时恢复原始（时间）顺序
+        index = TimelineIndex(items)
+        chosen: List[tuple] = []
+        used = 0
+        truncated = 0
+        for idx in index.iter_closest(pivot):
+            line = render_line(items[idx], pivot, index.dt(idx))
+            if not line:
+                continue
+            cost = estimate_tokens(line) + 1
+            if budget <= 0 or used + cost <= budget:
+                chosen.append((idx, line))
+                used += cost
+                continue
+            remain = budget - used
+            if remain >= _MIN_TRUNCATE_TOKENS:
+                chosen.append((idx, _truncate_to_tokens(line, remain - 1)))
+                truncated = 1
+            break
+        chosen.sort(key=lambda t: t[0])
+        text = "\n".join(line for _, line in chosen)
+        res = PackResult(
+            text=text,
+            raw_tokens=raw_tokens,
+            packed_tokens=estimate_tokens(text),
+            total=len(items),
+            kept=len(chosen),
+            truncated=truncated,
+        )
+
+    packer_stats["packed"] += 1
+    packer_stats["raw_tokens"] += res.raw_tokens
+    packer_stats["packed_tokens"] += res.packed_tokens
+    packer_stats["dropped_items"] += res.dropped
+    packer_stats["truncated_items"] += res.truncated
+    logger.debug(
+        "[packer] section=%s items=%s kept=%s truncated=%s tokens≈%s->%s saved≈%s",
+        section, res.total, res.kept, res.truncated, res.raw_tokens, res.packed_tokens, res.saved_tokens,
+    )
+    return res
+
+
+def pack_prechat(v: Any, pivot: datetime | None, budget: int = CONTEXT_BUDGET_PRECHAT) -> PackResult:
+    """历史会话：优先保留离 currentTime 最近的消息，渲染为 "[MM-DD HH:MM] U:/A:" 行。"""
+    return _pack("preChat", v, pivot, budget, ("messages", "items", "list"), render_message_line)
+
+
+def pack_daily_summaries(v: Any, pivot: datetime | None, budget: int = CONTEXT_BUDGET_PREDAILY) -> PackResult:
+    """历史每日总结：优先保留离 pivot 最近（无 pivot 时最新）的总结，每条一行。"""
+    return _pack(
+        "preDailySummary", v, pivot, budget, ("items", "list", "summaries"),
+        lambda it, _pivot, dt: _render_summary_line(it, dt),
+    )
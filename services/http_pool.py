@@ -0,0 +1,111 @@
+# 上游 HTTP 连接池：每个 provider 一个长连接 httpx.AsyncClient，由 main.py 的 lifespan 创建/关闭
+
+import logging
+from typing import Dict, Optional
+
+import httpx
+
+from core.config import (
+    HTTP_POOL_MAX_CONNECTIONS,
+    HTTP_POOL_MAX_KEEPALIVE,
+    HTTP_POOL_KEEPALIVE_EXPIRY,
+    HTTP2_ENABLED,
+    HTTP_CONNECT_TIMEOUT,
+    PROVIDER_TIMEOUTS,
+    ROUTE_TIMEOUTS,
+)
+
+logger = logging.getLogger("uvicorn.error")
+
+__all__ = ["PROVIDERS", "init_clients", "close_clients", "get_client", "get_timeout", "pool_stats"]
+
+PROVIDERS = ("dashscope", "openai")
+
+_clients: Dict[str, httpx.AsyncClient] = {}
+
+
+def _http2_available() -> bool:
+    if not HTTP2_ENABLED:
+        return False
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        logger.warning("[http_pool] HTTP2_ENABLED=1 但未安装 h2，退回 HTTP/1.1")
+        return False
+    return True
+
+
+def _new_client(provider: str) -> httpx.AsyncClient:
+    limits = httpx.Limits(
+        max_connections=HTTP_POOL_MAX_CONNECTIONS,
+        max_keepalive_connections=HTTP_POOL_MAX_KEEPALIVE,
+        keepalive_expiry=HTTP_POOL_KEEPALIVE_EXPIRY,
+    )
+    return httpx.AsyncClient(
+        limits=limits,
+        timeout=get_timeout(provider),
+        http2=_http2_available(),
+    )
+
+
+async def init_clients() -> None:
+    """lifespan 启动时调用：为每个 provider 创建一个长连接 client。"""
+    for provider in PROVIDERS:
+        if provider not in _clients:
+            _clients[provider] = _new_client(provider)
+    logger.info(
+        "[http_pool] clients ready providers=%s max_conn=%s keepalive=%s http2=%s",
+        list(_clients), HTTP_POOL_MAX_CONNECTIONS, HTTP_POOL_MAX_KEEPALIVE, _http2_available(),
+    )
+
+
+async def close_clients() -> None:
+    """lifespan 关闭时调用：关闭所有 client，释放连接。"""
+    while _clients:
+        provider, client = _clients.popitem()
+        try:
+            await client.aclose()
+        except Exception:
+            logger.exception("[http_pool] close client failed provider=%s", provider)
+
+
+def get_client(provider: str) -> httpx.AsyncClient:
+    """
+    获取 provider 对应的共享 client。
+    未经 lifespan 初始化（如脚本直接调用）时惰性创建，保证调用方始终拿到可用 client。
+    """
+    client = _clients.get(provider)
+    if client is None or client.is_closed:
+        client = _new_client(provider)
+        _clients[provider] = client
+    return client
+
+
+def get_timeout(provider: str, route: Optional[str] = None) -> httpx.Timeout:
+    """route 配置了超时则优先使用，否则使用 provider 默认超时。"""
+    read = ROUTE_TIMEOUTS.get(route) if route else None
+    if read is None:
+        read = PROVIDER_TIMEOUTS.get(provider, 60.0)
+    return httpx.Timeout(read, connect=HTTP_CONNECT_TIMEOUT)
+
+
+def _client_stats(client: httpx.AsyncClient) -> Dict[str, int]:
+    # httpx 没有公开连接池统计，这里读取 httpcore 连接池的内部状态（只读）
+    pool = getattr(getattr(client, "_transport", None), "_pool", None)
+    if pool is None:
+        return {"total": 0, "in_use": 0, "idle": 0, "waiting": 0}
+    conns = list(getattr(pool, "connections", []) or [])
+    requests = list(getattr(pool, "_requests", []) or [])
+    idle = sum(1 for c in conns if c.is_idle())
+    waiting = sum(1 for r in requests if r.is_queued())
+    return {
+        "total": len(conns),
+        "in_use": len(conns) - idle,
+        "idle": idle,
+        "waiting": waiting,
+    }
+
+
+def pool_stats() -> Dict[str, Dict[str, int]]:
+    """各 provider 连接池统计：total / in_use / idle / waiting。"""
+    return {provider: _client_stats(client) for provider, client in _clients.items()}
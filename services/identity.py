@@ -0,0 +1,49 @@
+# 用户身份：payload 里的 openid 由客户端随意填写，不能作为读写服务端存储的依据
+#
+# 登录服务用 USER_TOKEN_SECRET 签发 token = "<openid>.<过期 unix 时间>.<签名>"，
+# 签名为 HMAC-SHA256(secret, "<openid>.<exp>") 的 urlsafe base64（无填充）。
+# 这里只做校验：通过的 openid 才能读写该用户的检索索引与持久化记忆。
+
+import base64
+import hashlib
+import hmac
+import time
+from typing import Mapping, Optional
+
+from core.config import USER_TOKEN_SECRET
+
+__all__ = ["sign_token", "verify_token", "bearer_token"]
+
+
+def _sign(secret: str, message: str) -> str:
+    digest = hmac.new(secret.encode("utf-8"), message.encode("utf-8"), hashlib.sha256).digest()
+    return base64.urlsafe_b64encode(digest).rstrip(b"=").decode("ascii")
+
+
+def sign_token(openid: str, ttl: float, secret: str = USER_TOKEN_SECRET) -> str:
+    """签发 token（供登录服务 / 测试使用）。"""
+    exp = int(time.time() + ttl)
+    return f"{openid}.{exp}.{_sign(secret, f'{openid}.{exp}')}"
+
+
+def verify_token(token: Optional[str], secret: str = USER_TOKEN_SECRET) -> Optional[str]:
+    """校验通过返回 openid；未配置密钥、格式错误、签名不符或已过期时返回 None。"""
+    if not secret or not token:
+        return None
+    parts = token.rsplit(".", 2)
+    if len(parts) != 3:
+        return None
+    openid, exp, sig = parts
+    if not openid or not exp.isdigit() or int(exp) < time.time():
+        return None
+    if not hmac.compare_digest(sig, _sign(secret, f"{openid}.{exp}")):
+        return None
+    return openid
+
+
+def bearer_token(headers: Mapping[str, str]) -> Optional[str]:
+    auth = headers.get("authorization") or ""
+    scheme, _, value = auth.partition(" ")
+    if scheme.lower() != "bearer":
+        return None
+    return value.strip() or None
@@ -0,0 +1,178 @@
+# 进程生命周期：就绪状态（/readyz）与 WebSocket 优雅下线
+#
+# 收到 SIGTERM 后，先于 uvicorn 自身的退出流程：
+#   1. 标记 draining：/readyz 返回 503，负载均衡摘除本实例；新的 /ws/chat 连接直接以 1012 关闭
+#   2. 空闲连接立即以 1012（Service Restart）关闭，客户端据此重连到其他实例
+#   3. 正在生成回复的连接等这一轮回复发完再关闭，最多等 SHUTDOWN_DRAIN_SECONDS
+#   4. 超时仍未结束的连接直接关闭，然后交回 uvicorn 继续正常退出（停止监听 → lifespan 关闭）
+# 状态都是进程内的：多 worker 时每个 worker 各自排空自己的连接。
+
+import asyncio
+import logging
+import signal
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, Optional, Set
+
+from fastapi import WebSocket
+from starlette.websockets import WebSocketState
+
+from core.config import SHUTDOWN_DRAIN_SECONDS
+from services.metrics import WS_DRAINED_TOTAL
+
+logger = logging.getLogger("uvicorn.error")
+
+__all__ = ["CLOSE_SERVICE_RESTART", "WsConn", "Lifecycle", "lifecycle"]
+
+# RFC 6455：服务重启，客户端应稍后重连
+CLOSE_SERVICE_RESTART = 1012
+_CLOSE_REASON = "server restarting, please reconnect"
+
+
+class WsConn:
+    """一个已接受的 /ws/chat 连接；busy 表示正在生成 / 发送回复。"""
+
+    __slots__ = ("ws", "busy", "closed")
+
+    def __init__(self, ws: WebSocket):
+        self.ws = ws
+        self.busy = False
+        self.closed = False
+
+    async def close(self, code: int = CLOSE_SERVICE_RESTART, reason: str = _CLOSE_REASON) -> None:
+        """幂等关闭；对端已断开时忽略。"""
+        if self.closed:
+            return
+        self.closed = True
+        if self.ws.application_state == WebSocketState.DISCONNECTED:
+            return
+        try:
+            await self.ws.close(code=code, reason=reason)
+        except Exception:
+            pass
+
+
+class Lifecycle:
+    def __init__(self, drain_seconds: float = SHUTDOWN_DRAIN_SECONDS):
+        self.drain_seconds = drain_seconds
+        self.ready = False
+        self.draining = False
+        self._conns: Set[WsConn] = set()
+        self._idle: Optional[asyncio.Event] = None
+        self._drain_task: Optional["asyncio.Task[None]"] = None
+        self.stats: Dict[str, float] = {"rejected": 0, "drained_idle": 0, "drained_after_reply": 0,
+                                        "drained_deadline": 0, "last_drain_seconds": 0.0}
+
+    # ---------- 就绪 ----------
+    def mark_ready(self) -> None:
+        self.ready = True
+
+    def is_ready(self) -> bool:
+        return self.ready and not self.draining
+
+    # ---------- 连接登记 ----------
+    async def accept(self, ws: WebSocket) -> Optional[WsConn]:
+        """接受连接并登记；正在下线时以 1012 关闭并返回 None。"""
+        await ws.accept()
+        conn = WsConn(ws)
+        if self.draining:
+            self.stats["rejected"] += 1
+            await conn.close()
+            return None
+        self._conns.add(conn)
+        return conn
+
+    def release(self, conn: WsConn) -> None:
+        self._conns.discard(conn)
+        self._notify()
+
+    @contextmanager
+    def busy(self, conn: WsConn) -> Iterator[None]:
+        """包住一轮回复：下线时会等它结束再关闭连接。"""
+        conn.busy = True
+        try:
+            yield
+        finally:
+            conn.busy = False
+            self._notify()
+
+    def _notify(self) -> None:
+        if self._idle is not None and not any(c.busy for c in self._conns):
+            self._idle.set()
+
+    # ---------- 下线 ----------
+    def install_signal_handler(self) -> None:
+        """
+        在 uvicorn 的 SIGTERM 处理之前插入排空步骤（需在 lifespan 启动阶段、主线程中调用）。
+        排空结束后恢复原处理函数并重新发出 SIGTERM，由 uvicorn 完成其余的退出流程。
+        """
+        if threading.current_thread() is not threading.main_thread():
+            return
+        loop = asyncio.get_running_loop()
+        previous = signal.getsignal(signal.SIGTERM)
+
+        def _forward() -> None:
+            signal.signal(signal.SIGTERM, previous)
+            signal.raise_signal(signal.SIGTERM)
+
+        def _on_sigterm(sig: int, frame: Any) -> None:
+            if self._drain_task is not None:
+                return
+            loop.call_soon_threadsafe(self._start_drain, _forward)
+
+        signal.signal(signal.SIGTERM, _on_sigterm)
+
+    def _start_drain(self, done: Any) -> None:
+        self._drain_task = asyncio.ensure_future(self.drain())
+        self._drain_task.add_done_callback(lambda _: done())
+
+    async def drain(self) -> None:
+        """停止接收新连接，等进行中的回复发完（有截止时间），然后以 1012 关闭全部连接。"""
+        if self.draining:
+            return
+        self.draining = True
+        start = time.monotonic()
+        logger.info("[lifecycle] draining %d websocket(s), deadline=%.0fs", len(self._conns), self.drain_seconds)
+        self._idle = asyncio.Event()
+
+        idle = [c for c in self._conns if not c.busy]
+        for conn in idle:
+            await conn.close()
+        self._count("idle", len(idle))
+
+        busy = [c for c in self._conns if c.busy]
+        if busy:
+            self._notify()
+            try:
+                await asyncio.wait_for(self._idle.wait(), timeout=self.drain_seconds)
+            except asyncio.TimeoutError:
+                logger.warning("[lifecycle] drain deadline exceeded, %d reply(ies) cut off",
+                               sum(1 for c in self._conns if c.busy))
+
+        late = 0
+        for conn in list(self._conns):
+            if conn.busy:
+                late += 1
+            await conn.close()
+        self._count("deadline", late)
+        self._count("after_reply", len(busy) - late)
+        self.stats["last_drain_seconds"] = round(time.monotonic() - start, 3)
+        logger.info("[lifecycle] drained in %.2fs", self.stats["last_drain_seconds"])
+
+    def _count(self, state: str, n: int) -> None:
+        if n > 0:
+            self.stats[f"drained_{state}"] += n
+            WS_DRAINED_TOTAL.inc(n, state=state)
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "ready": self.is_ready(),
+            "draining": self.draining,
+            "connections": len(self._conns),
+            "busy": sum(1 for c in self._conns if c.busy),
+            **self.stats,
+        }
+
+
+lifecycle = Lifecycle()
@@ -1,10 +1,11 @@
 # OpenAI / DashScope 调用封装
 
+import asyncio
 import httpx
+from dataclasses import replace
 from fastapi import HTTPException
 import logging
 import time
-import json
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger("uvicorn.error")
@@ -12,9 +13,20 @@ logger.setLevel(logging.INFO)
 logger.propagate = True
 
 from core.config import DASHSCOPE_API_KEY, OPEN_API_KEY, DASH_URL, OPEN_URL, DEFAULT_MODEL,DEFAULT_CHAT_MODEL,QIANWEN_MAX
-from models.chat_models import ChatRequest
+from core.config import RETRY_ATTEMPTS, HEDGE_ROUTES, FAILOVER_ENABLED, FAILOVER_MODELS, JSON_MODE_MODELS
+from models.chat_models import ChatRequest, StreamEvent
+from services.http_pool import get_client, get_timeout
+from services.prompt_compiler import encode_message
+from services.rate_limiter import RateLimitTimeout, get_limiter
+from services.resilience import (
+    CircuitOpenError, backoff_delay, count, get_breaker, get_latency, hedged, is_transient,
+)
+from services.context_packer import estimate_tokens
+from core.logging_setup import lazy_json, redact_headers, sample_payload, truncate
+from services.metrics import LLM_TOKENS_TOTAL, PROMPT_CACHE_TOTAL, UPSTREAM_ERRORS_TOTAL, UPSTREAM_SECONDS, UPSTREAM_TTFB_SECONDS
+from utils.json_codec import dumps_bytes, loads
 
-__all__ = ["call_gpt", "call_qwen", "smart_call", "DEFAULT_MODEL","DEFAULT_CHAT_MODEL"]
+__all__ = ["call_gpt", "call_qwen", "smart_call", "stream_gpt", "stream_qwen", "smart_stream", "DEFAULT_MODEL","DEFAULT_CHAT_MODEL"]
 
 def _extract_text_from_choices(choices):
     if isinstance(choices, list) and choices:
@@ -52,112 +64,442 @@ def extract_reply(data: dict) -> str:
                 return text
     return str(data)
 
-def _safe_json(obj):
-    """Safely json-serialize any object for logging."""
-    try:
-        return json.dumps(obj, ensure_ascii=False)
-    except Exception:
-        try:
-            return json.dumps(str(obj), ensure_ascii=False)
-        except Exception:
-            return "<unserializable>"
+def _encode_messages(req: ChatRequest) -> bytes:
+    """messages 编码：静态前缀直接复用预编码 bytes，只编码其后的动态消息。"""
+    start = req.prefix_count if req.prefix_json else 0
+    parts = [encode_message(m.role, m.content) for m in req.messages[start:]]
+    if req.prefix_json:
+        parts.insert(0, req.prefix_json)
+    return b"[" + b",".join(parts) + b"]"
+
+def _encode_body(payload: dict, messages_json: bytes, nested_key: str | None = None) -> bytes:
+    """
+    把预编码的 messages 拼入请求体：
+      nested_key=None    → {"messages": [...], ...payload}
+      nested_key="input" → {"input": {"messages": [...]}, ...payload}
+    payload 中不应包含 messages / nested_key。
+    """
+    rest = dumps_bytes(payload)
+    tail = b"," + rest[1:] if len(rest) > 2 else b"}"
+    if nested_key is None:
+        return b'{"messages":' + messages_json + tail
+    return b'{"' + nested_key.encode("ascii") + b'":{"messages":' + messages_json + b"}" + tail
+
+_JSON_HEADERS = {"Content-Type": "application/json"}
+
+def _json_mode(req: ChatRequest) -> bool:
+    """请求了 JSON 输出且模型支持时才发 response_format（failover 换模型后会重新判断）。"""
+    return req.json_mode and req.model in JSON_MODE_MODELS
+
+def _gpt_params(req: ChatRequest) -> dict:
+    """OpenAI 请求体中除 messages 之外的部分。"""
+    params = {k: v for k, v in req.to_dict().items() if k != "messages"}
+    if _json_mode(req):
+        params["response_format"] = {"type": "json_object"}
+    return params
+
+def _qwen_params(req: ChatRequest) -> dict:
+    """DashScope 请求体中除 input.messages 之外的部分。"""
+    payload = {
+        "model": req.model or DEFAULT_MODEL,
+        "parameters": {"result_format": "text"},
+    }
+    if req.temperature is not None:
+        payload["parameters"]["temperature"] = 0.6
+    if req.max_completion_tokens is not None:
+        payload["parameters"]["max_tokens"] = req.max_completion_tokens
+    payload["parameters"]["repetition_penalty"] = 1.15
+    if _json_mode(req):
+        payload["parameters"]["response_format"] = {"type": "json_object"}
+    return payload
+
+def _estimate_req_tokens(req: ChatRequest) -> int:
+    """限流用的 token 估算：prompt 估算值 + 预期输出上限。"""
+    return sum(estimate_tokens(m.content) for m in req.messages) + (req.max_completion_tokens or 512)
 
-async def call_gpt(req: ChatRequest) -> str:
-    headers = {"Authorization": f"Bearer {OPEN_API_KEY}"}
-    payload = req.to_dict()
+def _log_messages(req: ChatRequest) -> list:
+    return [{"role": m.role, "content": m.content} for m in req.messages]
 
+_TAG_PROVIDER = {"GPT": "openai", "QWEN": "dashscope"}
+
+def _usage_tokens(usage) -> tuple:
+    """(prompt, completion)；兼容 OpenAI 与 DashScope 的 usage 字段名。"""
+    if not isinstance(usage, dict):
+        return 0, 0
+    prompt = usage.get("prompt_tokens", usage.get("input_tokens")) or 0
+    completion = usage.get("completion_tokens", usage.get("output_tokens")) or 0
+    return prompt, completion
+
+def _cached_tokens(usage):
+    """上游报告的前缀缓存命中 token 数（OpenAI / DashScope 均在 prompt_tokens_details.cached_tokens）；未报告时为 None。"""
+    if not isinstance(usage, dict):
+        return None
+    details = usage.get("prompt_tokens_details")
+    if isinstance(details, dict) and details.get("cached_tokens") is not None:
+        return details["cached_tokens"]
+    return usage.get("cached_tokens")
+
+# 指标的 model 标签只取已知模型，其余归为 "other"：模型名来自客户端，不能让它决定时间序列数量
+_KNOWN_MODELS = {DEFAULT_MODEL, DEFAULT_CHAT_MODEL, QIANWEN_MAX, *FAILOVER_MODELS.values(), *JSON_MODE_MODELS}
+
+
+def _model_label(model: str | None) -> str:
+    return model if model in _KNOWN_MODELS else "other"
+
+
+def _record_call(tag: str, req: ChatRequest, route: str | None, req_bytes: int, status: int,
+                 cost_ms: int, resp_bytes: int, stream: bool = False, usage=None, first_token_ms=None) -> None:
+    """每次调用都记录：一行大小与耗时摘要（不序列化 prompt）+ 延迟 / token 指标。"""
+    provider = _TAG_PROVIDER[tag]
+    UPSTREAM_SECONDS.observe(cost_ms / 1000, provider=provider, model=_model_label(req.model), route=route, stream="true" if stream else "false")
+    if first_token_ms is not None:
+        UPSTREAM_TTFB_SECONDS.observe(first_token_ms / 1000, provider=provider, model=_model_label(req.model), route=route)
+    prompt_tokens, completion_tokens = _usage_tokens(usage)
+    if prompt_tokens:
+        LLM_TOKENS_TOTAL.inc(prompt_tokens, provider=provider, model=_model_label(req.model), kind="prompt")
+    if completion_tokens:
+        LLM_TOKENS_TOTAL.inc(completion_tokens, provider=provider, model=_model_label(req.model), kind="completion")
+    cached_tokens = _cached_tokens(usage)
+    if usage is not None:
+        if cached_tokens is None:
+            cache_result = "unreported"
+        else:
+            cache_result = "hit" if cached_tokens else "miss"
+            if cached_tokens:
+                LLM_TOKENS_TOTAL.inc(cached_tokens, provider=provider, model=_model_label(req.model), kind="cached")
+        PROMPT_CACHE_TOTAL.inc(provider=provider, route=route, result=cache_result)
     logger.info(
-        "[LLM][GPT][REQUEST] %s",
-        _safe_json({
-            "headers": headers,
-            "payload": payload,
-        }),
+        "[LLM][%s]%s model=%s route=%s status=%s costMs=%s reqBytes=%s respBytes=%s prefix=%s cachedTokens=%s",
+        tag, "[STREAM]" if stream else "", req.model, route, status, cost_ms, req_bytes, resp_bytes,
+        req.prefix_hash, cached_tokens,
+        extra={
+            "llm": tag.lower(), "stream": stream, "model": req.model, "route": route, "status": status,
+            "cost_ms": cost_ms, "req_bytes": req_bytes, "resp_bytes": resp_bytes, "messages": len(req.messages),
+            "first_token_ms": first_token_ms, "usage": usage,
+            "prefix_hash": req.prefix_hash, "cached_tokens": cached_tokens,
+        },
     )
 
+async def call_gpt(req: ChatRequest, route: str | None = None) -> str:
+    headers = {"Authorization": f"Bearer {OPEN_API_KEY}", **_JSON_HEADERS}
+    params = _gpt_params(req)
+    body = _encode_body(params, _encode_messages(req))
+
+    sampled = sample_payload()
+    if sampled:
+        logger.info(
+            "[LLM][GPT][REQUEST] %s",
+            lazy_json(lambda: {"headers": redact_headers(headers), "payload": {**params, "messages": _log_messages(req)}}),
+        )
+
     start = time.time()
-    timeout = httpx.Timeout(20.0, connect=10.0)
-    async with httpx.AsyncClient(timeout=timeout) as client:
-        r = await client.post(OPEN_URL, headers=headers, json=payload)
+    client = get_client("openai")
+    async with get_limiter("openai", params.get("model") or "").slot(_estimate_req_tokens(req)) as slot:
+        r = await client.post(OPEN_URL, headers=headers, content=body, timeout=get_timeout("openai", route))
+        slot.observe(r.status_code)
     cost_ms = int((time.time() - start) * 1000)
 
     if r.status_code != 200:
-        logger.error(
-            "[LLM][GPT][ERROR] costMs=%s response=%s",
-            cost_ms,
-            r.text,
-        )
+        _record_call("GPT", req, route, len(body), r.status_code, cost_ms, len(r.content))
+        logger.error("[LLM][GPT][ERROR] costMs=%s response=%s", cost_ms, truncate(r.text))
         raise HTTPException(status_code=r.status_code, detail=r.text + " err from gpt")
 
     try:
-        resp_json = r.json()
+        resp_json = loads(r.content)
     except Exception:
         resp_json = r.text
 
-    logger.info(
-        "[LLM][GPT][RESPONSE] costMs=%s %s",
-        cost_ms,
-        _safe_json(resp_json),
+    _record_call(
+        "GPT", req, route, len(body), r.status_code, cost_ms, len(r.content),
+        usage=resp_json.get("usage") if isinstance(resp_json, dict) else None,
     )
+    if sampled:
+        logger.info("[LLM][GPT][RESPONSE] costMs=%s %s", cost_ms, lazy_json(lambda: resp_json))
 
     return extract_reply(resp_json)
 
-async def call_qwen(req: ChatRequest) -> str:
-    headers = {"Authorization": f"Bearer {DASHSCOPE_API_KEY}"}
-    msgs = [{"role": m.role, "content": m.content} for m in req.messages]
-    payload = {
-        "model": req.model or DEFAULT_MODEL,
-        "input": {"messages": msgs},
-        "parameters": {"result_format": "text"},
-    }
-    if req.temperature is not None:
-        payload["parameters"]["temperature"] = 0.6
-    if req.max_completion_tokens is not None:
-        payload["parameters"]["max_tokens"] = req.max_completion_tokens
-    payload["parameters"]["repetition_penalty"] = 1.15
-    logger.info(
-        "[LLM][QWEN][REQUEST] %s",
-        _safe_json({
-            "headers": headers,
-            "payload": payload,
-        }),
-    )
+async def call_qwen(req: ChatRequest, route: str | None = None) -> str:
+    headers = {"Authorization": f"Bearer {DASHSCOPE_API_KEY}", **_JSON_HEADERS}
+    params = _qwen_params(req)
+    body = _encode_body(params, _encode_messages(req), "input")
+    sampled = sample_payload()
+    if sampled:
+        logger.info(
+            "[LLM][QWEN][REQUEST] %s",
+            lazy_json(lambda: {
+                "headers": redact_headers(headers),
+                "payload": {**params, "input": {"messages": _log_messages(req)}},
+            }),
+        )
 
     start = time.time()
-    timeout = httpx.Timeout(300.0, connect=10.0)
-
-    async with httpx.AsyncClient(timeout=timeout) as client:
-        r = await client.post(DASH_URL, headers=headers, json=payload)
+    client = get_client("dashscope")
+    async with get_limiter("dashscope", params["model"]).slot(_estimate_req_tokens(req)) as slot:
+        r = await client.post(DASH_URL, headers=headers, content=body, timeout=get_timeout("dashscope", route))
+        slot.observe(r.status_code)
 
     cost_ms = int((time.time() - start) * 1000)
 
     if r.status_code != 200:
-        logger.error(
-            "[LLM][QWEN][ERROR] costMs=%s response=%s",
-            cost_ms,
-            r.text,
-        )
+        _record_call("QWEN", req, route, len(body), r.status_code, cost_ms, len(r.content))
+        logger.error("[LLM][QWEN][ERROR] costMs=%s response=%s", cost_ms, truncate(r.text))
         raise HTTPException(status_code=r.status_code, detail=r.text)
 
     try:
-        resp_json = r.json()
+        resp_json = loads(r.content)
     except Exception:
         resp_json = r.text
 
-    logger.info(
-        "[LLM][QWEN][RESPONSE] costMs=%s %s",
-        cost_ms,
-        _safe_json(resp_json),
+    _record_call(
+        "QWEN", req, route, len(body), r.status_code, cost_ms, len(r.content),
+        usage=resp_json.get("usage") if isinstance(resp_json, dict) else None,
     )
+    if sampled:
+        logger.info("[LLM][QWEN][RESPONSE] costMs=%s %s", cost_ms, lazy_json(lambda: resp_json))
 
     return extract_reply(resp_json)
 
-async def smart_call(req: ChatRequest) -> str:
+# ================= 流式（SSE）调用 =================
+
+async def _iter_sse_data(r: httpx.Response):
+    """逐条产出 SSE 的 data 字段（已去掉 'data:' 前缀）。"""
+    async for line in r.aiter_lines():
+        if line.startswith("data:"):
+            data = line[5:].strip()
+            if data:
+                yield data
+
+def _extract_delta_from_choices(choices) -> str:
+    if isinstance(choices, list) and choices:
+        ch0 = choices[0] or {}
+        delta = ch0.get("delta") or ch0.get("message") or {}
+        content = delta.get("content")
+        if isinstance(content, str):
+            return content
+    return ""
+
+async def stream_gpt(req: ChatRequest, route: str | None = None):
+    """OpenAI 流式调用（stream: true），逐个产出 StreamEvent，最后一个 done=True 携带 usage。"""
+    headers = {"Authorization": f"Bearer {OPEN_API_KEY}", **_JSON_HEADERS}
+    params = {**_gpt_params(req), "stream": True, "stream_options": {"include_usage": True}}
+    body = _encode_body(params, _encode_messages(req))
+    if sample_payload():
+        logger.info("[LLM][GPT][STREAM][REQUEST] %s", lazy_json(lambda: {**params, "messages": _log_messages(req)}))
+
+    start = time.time()
+    first_ms = None
+    usage = None
+    resp_bytes = 0
+    client = get_client("openai")
+    limiter = get_limiter("openai", params.get("model") or "")
+    # 流式请求在整个流期间占用一个并发名额
+    async with limiter.slot(_estimate_req_tokens(req)) as slot, client.stream(
+        "POST", OPEN_URL, headers=headers, content=body, timeout=get_timeout("openai", route)
+    ) as r:
+        slot.observe(r.status_code)
+        if r.status_code != 200:
+            text = (await r.aread()).decode("utf-8", errors="replace")
+            logger.error("[LLM][GPT][STREAM][ERROR] status=%s response=%s", r.status_code, truncate(text))
+            raise HTTPException(status_code=r.status_code, detail=text + " err from gpt")
+        async for data in _iter_sse_data(r):
+            if data == "[DONE]":
+                break
+            try:
+                chunk = loads(data)
+            except Exception:
+                continue
+            if chunk.get("usage"):
+                usage = chunk["usage"]
+            delta = _extract_delta_from_choices(chunk.get("choices"))
+            if delta:
+                if first_ms is None:
+                    first_ms = int((time.time() - start) * 1000)
+                resp_bytes += len(delta.encode("utf-8"))
+                yield StreamEvent(delta=delta)
+
+    _record_call(
+        "GPT", req, route, len(body), 200, int((time.time() - start) * 1000), resp_bytes, stream=True,
+        first_token_ms=first_ms, usage=usage,
+    )
+    yield StreamEvent(usage=usage, done=True)
+
+async def stream_qwen(req: ChatRequest, route: str | None = None):
+    """DashScope 流式调用（X-DashScope-SSE + incremental_output），产出 StreamEvent。"""
+    headers = {
+        "Authorization": f"Bearer {DASHSCOPE_API_KEY}",
+        "X-DashScope-SSE": "enable",
+        "Accept": "text/event-stream",
+        **_JSON_HEADERS,
+    }
+    params = _qwen_params(req)
+    params["parameters"]["incremental_output"] = True
+    body = _encode_body(params, _encode_messages(req), "input")
+    if sample_payload():
+        logger.info("[LLM][QWEN][STREAM][REQUEST] %s", lazy_json(lambda: {**params, "messages": _log_messages(req)}))
+
+    start = time.time()
+    first_ms = None
+    usage = None
+    resp_bytes = 0
+    client = get_client("dashscope")
+    limiter = get_limiter("dashscope", params["model"])
+    # 流式请求在整个流期间占用一个并发名额
+    async with limiter.slot(_estimate_req_tokens(req)) as slot, client.stream(
+        "POST", DASH_URL, headers=headers, content=body, timeout=get_timeout("dashscope", route)
+    ) as r:
+        slot.observe(r.status_code)
+        if r.status_code != 200:
+            text = (await r.aread()).decode("utf-8", errors="replace")
+            logger.error("[LLM][QWEN][STREAM][ERROR] status=%s response=%s", r.status_code, truncate(text))
+            raise HTTPException(status_code=r.status_code, detail=text)
+        async for data in _iter_sse_data(r):
+            try:
+                chunk = loads(data)
+            except Exception:
+                continue
+            if chunk.get("code") and not chunk.get("output"):
+                # 流中途的错误事件
+                logger.error("[LLM][QWEN][STREAM][ERROR] %s", data)
+                raise HTTPException(status_code=502, detail=data)
+            if chunk.get("usage"):
+                usage = chunk["usage"]
+            out = chunk.get("output") or {}
+            delta = out.get("text")
+            if not isinstance(delta, str):
+                delta = _extract_delta_from_choices(out.get("choices"))
+            if delta:
+                if first_ms is None:
+                    first_ms = int((time.time() - start) * 1000)
+                resp_bytes += len(delta.encode("utf-8"))
+                yield StreamEvent(delta=delta)
+
+    _record_call(
+        "QWEN", req, route, len(body), 200, int((time.time() - start) * 1000), resp_bytes, stream=True,
+        first_token_ms=first_ms, usage=usage,
+    )
+    yield StreamEvent(usage=usage, done=True)
+
+# ================= 路由 + 韧性（重试 / 对冲 / 熔断 / 切换）=================
+
+_CALLS = {"openai": call_gpt, "dashscope": call_qwen}
+_STREAMS = {"openai": stream_gpt, "dashscope": stream_qwen}
+
+def _provider_of(model: str) -> str:
+    return "openai" if model.lower().startswith("gpt-") else "dashscope"
+
+def _error_status(exc: Exception) -> str:
+    """错误指标的 status 标签：HTTP 状态码或少量固定类别。"""
+    if isinstance(exc, CircuitOpenError):
+        return "circuit_open"
+    if isinstance(exc, RateLimitTimeout):
+        return "queue_timeout"
+    if isinstance(exc, HTTPException):
+        return str(exc.status_code)
+    if isinstance(exc, httpx.TimeoutException):
+        return "timeout"
+    if isinstance(exc, httpx.TransportError):
+        return "network"
+    return "error"
+
+def _candidates(req: ChatRequest) -> list:
+    """[(provider, req), ...]：主 provider 在前；开启切换时追加备用 provider 的模型。"""
+    model = req.model or DEFAULT_MODEL
+    primary = _provider_of(model)
+    out = [(primary, req)]
+    fallback_model = FAILOVER_MODELS.get(primary) if FAILOVER_ENABLED else None
+    if fallback_model and _provider_of(fallback_model) != primary:
+        out.append((_provider_of(fallback_model), replace(req, model=fallback_model)))
+    return out
+
+async def _call_with_retries(provider: str, req: ChatRequest, route: str | None) -> str:
+    breaker = get_breaker(provider)
+    latency = get_latency(provider, route)
+    hedge_delay = latency.hedge_delay() if route in HEDGE_ROUTES else None
+
+    async def _once() -> str:
+        t0 = time.monotonic()
+        reply = await _CALLS[provider](req, route)
+        latency.observe(time.monotonic() - t0)
+        return reply
+
+    for attempt in range(RETRY_ATTEMPTS + 1):
+        if not breaker.allow():
+            raise CircuitOpenError(provider)
+        try:
+            reply = await hedged(_once, hedge_delay)
+            breaker.record_success()
+            return reply
+        except Exception as e:
+            UPSTREAM_ERRORS_TOTAL.inc(provider=provider, status=_error_status(e))
+            if not is_transient(e):
+                breaker.record_success()  # 4xx 等说明上游可达，不计入熔断
+                raise
+            if isinstance(e, RateLimitTimeout):
+                raise  # 已在本地排满等待时长，同 provider 重试只会再等一轮，直接交给 smart_call 切换
+            breaker.record_failure()
+            if attempt >= RETRY_ATTEMPTS:
+                raise
+            delay = backoff_delay(attempt)
+            count("retries")
+            logger.warning("[LLM][RETRY] provider=%s attempt=%s err=%r sleep=%.2fs", provider, attempt + 1, e, delay)
+            await asyncio.sleep(delay)
+    raise CircuitOpenError(provider)
+
+async def smart_call(req: ChatRequest, route: str | None = None) -> str:
     """
-    简单策略：
+    路由策略：
       - 以 'gpt-' 开头 → 走 OpenAI
       - 以 'qwen' / 其他 → 走 DashScope
+    瞬时错误（429/5xx/超时）带抖动退避重试；配置了对冲的路由在延迟超过历史分位数后加发一份；
+    主 provider 熔断、重试耗尽或本地限流排队超时时切换到 FAILOVER_MODELS 配置的备用模型。
+    """
+    last_exc: Exception | None = None
+    for i, (provider, r) in enumerate(_candidates(req)):
+        if i:
+            count("failovers")
+            logger.warning("[LLM][FAILOVER] -> provider=%s model=%s after %r", provider, r.model, last_exc)
+        try:
+            return await _call_with_retries(provider, r, route)
+        except Exception as e:
+            if not is_transient(e):
+                raise
+            last_exc = e
+    raise last_exc or HTTPException(status_code=503, detail="no upstream available")
+
+async def smart_stream(req: ChatRequest, route: str | None = None):
+    """
+    与 smart_call 相同的路由 / 重试 / 切换策略的流式版本。
+    只在尚未产出任何 token 前重试或切换；流已开始后出错直接抛出。
     """
-    model = (req.model or DEFAULT_MODEL).lower()
-    if model.startswith("gpt-"):
-        return await call_gpt(req)
-    return await call_qwen(req)
\ No newline at end of file
+    last_exc: Exception | None = None
+    for i, (provider, r) in enumerate(_candidates(req)):
+        if i:
+            count("failovers")
+            logger.warning("[LLM][FAILOVER][STREAM] -> provider=%s model=%s after %r", provider, r.model, last_exc)
+        breaker = get_breaker(provider)
+        for attempt in range(RETRY_ATTEMPTS + 1):
+            if not breaker.allow():
+                last_exc = CircuitOpenError(provider)
+                break
+            started = False
+            try:
+                async for ev in _STREAMS[provider](r, route):
+                    started = started or bool(ev.delta)
+                    yield ev
+                breaker.record_success()
+                return
+            except Exception as e:
+                UPSTREAM_ERRORS_TOTAL.inc(provider=provider, status=_error_status(e))
+                if started or not is_transient(e):
+                    if not is_transient(e):
+                        breaker.record_success()
+                    raise
+                last_exc = e
+                if isinstance(e, RateLimitTimeout):
+                    break  # 本地排队超时：不在同 provider 上再等，直接切换
+                breaker.record_failure()
+                if attempt >= RETRY_ATTEMPTS:
+                    break
+                count("retries")
+                await asyncio.sleep(backoff_delay(attempt))
+    raise last_exc or HTTPException(status_code=503, detail="no upstream available")
@@ -0,0 +1,204 @@
+# 每个 openid 一个本地检索索引：历史每日总结按与当前消息的相关度取 top-k 注入 {preDailySummary}
+#
+# BM25 + 中文字符 bigram（连续汉字切成两两一组，ASCII 单词整体作为一个词），无第三方依赖。
+# 倒排表增量维护：新总结（客户端带来的 preDailySummary 或 /summary/daily 的结果）插入时只更新该文档的词项。
+
+import heapq
+import math
+import re
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from core.config import MEMORY_MAX_DOCS_PER_USER, MEMORY_MAX_USERS, MEMORY_TOP_K
+
+__all__ = ["tokenize", "doc_key", "MemoryIndex", "MemoryStore", "memory_store"]
+
+# 参与检索的字段及权重（权重按词频累加）
+FIELD_WEIGHTS = (("articleTitle", 2.0), ("memoryPoint", 2.0), ("moodKeywords", 1.5), ("actionKeywords", 1.5), ("article", 1.0))
+_DATE_FIELDS = ("summaryDate", "summary_date", "date")
+
+_K1 = 1.2
+_B = 0.75
+
+_CJK_OR_WORD = re.compile(r"[一-鿿]+|[a-z0-9]+")
+
+
+def tokenize(text: str) -> List[str]:
+    """连续汉字切成字符 bigram（单字保留为 unigram），字母数字串整体作为一个词。"""
+    out: List[str] = []
+    for run in _CJK_OR_WORD.findall(text.lower()):
+        if run[0] < "一" or len(run) == 1:
+            out.append(run)
+        else:
+            out.extend(run[i:i + 2] for i in range(len(run) - 1))
+    return out
+
+
+def _doc_terms(item: Dict[str, Any]) -> Dict[str, float]:
+    tf: Dict[str, float] = {}
+    for field, weight in FIELD_WEIGHTS:
+        v = item.get(field)
+        if not isinstance(v, str) or not v:
+            continue
+        for t in tokenize(v):
+            tf[t] = tf.get(t, 0.0) + weight
+    return tf
+
+
+def doc_key(item: Dict[str, Any]) -> str:
+    """同一天的总结视为同一文档（重新生成时覆盖）；没有日期时按标题。"""
+    for k in _DATE_FIELDS:
+        v = item.get(k)
+        if isinstance(v, str) and v.strip():
+            return v.strip()[:10]
+    return "title:" + str(item.get("articleTitle") or "")
+
+
+class MemoryIndex:
+    """单个用户的 BM25 倒排索引。文档按 doc_key 去重，超过 max_docs 时淘汰最早插入的。"""
+
+    def __init__(self, max_docs: int = MEMORY_MAX_DOCS_PER_USER):
+        self.max_docs = max_docs
+        self._docs: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._terms: Dict[str, Dict[str, float]] = {}
+        self._lengths: Dict[str, float] = {}
+        self._postings: Dict[str, Dict[str, float]] = {}
+        self._total_len = 0.0
+
+    def __len__(self) -> int:
+        return len(self._docs)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._docs
+
+    def add(self, item: Dict[str, Any]) -> bool:
+        """插入或覆盖一条总结；内容未变化时返回 False。"""
+        key = doc_key(item)
+        old = self._docs.get(key)
+        if old is not None:
+            if old is item or old == item:
+                return False
+            self._remove(key)
+        tf = _doc_terms(item)
+        self._docs[key] = item
+        self._terms[key] = tf
+        length = sum(tf.values())
+        self._lengths[key] = length
+        self._total_len += length
+        for t, f in tf.items():
+            self._postings.setdefault(t, {})[key] = f
+        while len(self._docs) > self.max_docs:
+            self._remove(next(iter(self._docs)))
+        return True
+
+    def _remove(self, key: str) -> None:
+        self._docs.pop(key, None)
+        for t in self._terms.pop(key, {}):
+            posting = self._postings.get(t)
+            if posting is not None:
+                posting.pop(key, None)
+                if not posting:
+                    del self._postings[t]
+        self._total_len -= self._lengths.pop(key, 0.0)
+
+    def search(self, query: str, k: int) -> List[Tuple[float, Dict[str, Any]]]:
+        """按 BM25 得分取前 k 条（得分 > 0）。"""
+        n = len(self._docs)
+        if not n or k <= 0:
+            return []
+        avgdl = self._total_len / n or 1.0
+        scores: Dict[str, float] = {}
+        for t in set(tokenize(query)):
+            posting = self._postings.get(t)
+            if not posting:
+                continue
+            idf = math.log(1.0 + (n - len(posting) + 0.5) / (len(posting) + 0.5))
+            for key, f in posting.items():
+                norm = _K1 * (1.0 - _B + _B * self._lengths[key] / avgdl)
+                scores[key] = scores.get(key, 0.0) + idf * f * (_K1 + 1.0) / (f + norm)
+        # 同分时日期较新的优先
+        top = heapq.nlargest(k, scores.items(), key=lambda kv: (kv[1], kv[0]))
+        return [(s, self._docs[key]) for key, s in top]
+
+    def recent(self, k: int) -> List[Dict[str, Any]]:
+        """按日期最新的 k 条（无日期的排在最后）。"""
+        keys = sorted(self._docs, key=lambda key: (not key.startswith("title:"), key), reverse=True)
+        return [self._docs[key] for key in keys[:k]]
+
+
+class MemoryStore:
+    """
+    key → MemoryIndex（LRU，最多 max_users 个）。key 为已校验身份的 openid，或未登录连接的临时 key（连接结束时 discard）。
+    进程内状态，多 worker 时各自独立。
+    """
+
+    def __init__(self, max_users: int = MEMORY_MAX_USERS):
+        self.max_users = max_users
+        self._users: "OrderedDict[str, MemoryIndex]" = OrderedDict()
+        self.stats: Dict[str, float] = {"inserts": 0, "lookups": 0, "hits": 0, "lookup_us_total": 0.0}
+
+    def _get(self, openid: str, create: bool) -> Optional[MemoryIndex]:
+        index = self._users.get(openid)
+        if index is not None:
+            self._users.move_to_end(openid)
+            return index
+        if not create:
+            return None
+        index = self._users[openid] = MemoryIndex()
+        while len(self._users) > self.max_users:
+            self._users.popitem(last=False)
+        return index
+
+    def add(self, openid: str, items: Iterable[Dict[str, Any]]) -> int:
+        """增量插入；已存在且内容相同的条目跳过。返回新插入 / 覆盖的条数。"""
+        if not openid:
+            return 0
+        index = self._get(openid, create=True)
+        added = 0
+        for item in items:
+            if isinstance(item, dict) and index.add(item):
+                added += 1
+        self.stats["inserts"] += added
+        return added
+
+    def has(self, openid: str) -> bool:
+        index = self._users.get(openid) if openid else None
+        return bool(index)
+
+    def select(self, openid: str, query: str, k: int = MEMORY_TOP_K) -> List[Dict[str, Any]]:
+        """
+        与 query 最相关的 k 条总结；相关条目不足 k 条时用最近的总结补足，
+        保证即使当前消息与历史无关（如 "在吗"），模型仍能看到最近几天的状态。
+        """
+        index = self._get(openid, create=False) if openid else None
+        if index is None:
+            return []
+        start = time.perf_counter()
+        picked = [doc for _, doc in index.search(query or "", k)]
+        self.stats["lookups"] += 1
+        if picked:
+            self.stats["hits"] += 1
+        if len(picked) < k:
+            seen = {id(d) for d in picked}
+            picked.extend(d for d in index.recent(k) if id(d) not in seen)
+            picked = picked[:k]
+        self.stats["lookup_us_total"] += (time.perf_counter() - start) * 1e6
+        return picked
+
+    def discard(self, openid: str) -> None:
+        self._users.pop(openid, None)
+
+    def snapshot(self) -> Dict[str, Any]:
+        lookups = self.stats["lookups"]
+        return {
+            "users": len(self._users),
+            "docs": sum(len(ix) for ix in self._users.values()),
+            "inserts": int(self.stats["inserts"]),
+            "lookups": int(lookups),
+            "hit_rate": round(self.stats["hits"] / lookups, 4) if lookups else 0.0,
+            "avg_lookup_us": round(self.stats["lookup_us_total"] / lookups, 1) if lookups else 0.0,
+        }
+
+
+memory_store = MemoryStore()
@@ -0,0 +1,274 @@
+# 进程内指标（Prometheus 文本格式）：Counter / Gauge / Histogram，无第三方依赖
+#
+# 热路径上只有一次 dict 查找 + 加法；标签值基数有上限，超出的值归入 "other"，
+# 因此 openid / sessionId 等用户维度绝不能作为标签。
+#
+# 指标按进程统计：多 worker 时共享端口上的 /metrics 只返回恰好接到请求的那个 worker 的数据。
+# 配置 METRICS_PORT 后每个 worker 另在 METRICS_PORT + i 上单独暴露指标（start_scrape_server），
+# Prometheus 逐个抓取这些端口，再用 sum without(instance) 汇总。
+
+import asyncio
+import bisect
+import logging
+import os
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+__all__ = [
+    "Counter",
+    "Gauge",
+    "Histogram",
+    "register_collector",
+    "format_sample",
+    "render",
+    "start_scrape_server",
+    "PROMPT_BUILD_SECONDS",
+    "UPSTREAM_SECONDS",
+    "UPSTREAM_TTFB_SECONDS",
+    "PARSE_SECONDS",
+    "REQUESTS_TOTAL",
+    "UPSTREAM_ERRORS_TOTAL",
+    "WS_EMPTY_REPLIES_TOTAL",
+    "LLM_TOKENS_TOTAL",
+    "LLM_PARSE_TOTAL",
+    "PROMPT_CACHE_TOTAL",
+    "WS_CONNECTIONS",
+    "WS_TURNS_CANCELLED_TOTAL",
+    "WS_WASTED_GENERATIONS_TOTAL",
+    "WS_DRAINED_TOTAL",
+    "CONTENT_TYPE",
+]
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+logger = logging.getLogger("uvicorn.error")
+
+# 每个标签的不同取值上限；模型名等来自客户端的值也不会无限增长
+MAX_LABEL_VALUES = 64
+_OTHER = "other"
+
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2, 4, 8, 15, 30, 60, 120)
+FAST_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1)
+
+_metrics: List["_Metric"] = []
+_collectors: List[Callable[[], List[str]]] = []
+
+
+def _escape(v: str) -> str:
+    return v.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _fmt_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, doc: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.doc = doc
+        self.labelnames = tuple(labelnames)
+        self._seen: Tuple[set, ...] = tuple(set() for _ in self.labelnames)
+        _metrics.append(self)
+
+    def _key(self, labels: Dict[str, Any]) -> Tuple[str, ...]:
+        key = []
+        for i, n in enumerate(self.labelnames):
+            v = labels.get(n)
+            v = "" if v is None else str(v)
+            seen = self._seen[i]
+            if v not in seen:
+                if len(seen) >= MAX_LABEL_VALUES:
+                    v = _OTHER
+                else:
+                    seen.add(v)
+            key.append(v)
+        return tuple(key)
+
+    def _header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.doc}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, doc: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, doc, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: Any) -> None:
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0.0) + amount
+
+    def total(self, **match: Any) -> float:
+        """所有标签取值匹配 match 的序列之和（例如 total(kind="prompt")）。"""
+        idx = [(self.labelnames.index(k), str(v)) for k, v in match.items()]
+        return sum(v for key, v in self._values.items() if all(key[i] == want for i, want in idx))
+
+    def render(self) -> List[str]:
+        lines = self._header()
+        for key, v in self._values.items():
+            lines.append(f"{self.name}{_fmt_labels(self.labelnames, key)} {v:g}")
+        return lines
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, amount: float = 1.0, **labels: Any) -> None:
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels: Any) -> None:
+        self._values[self._key(labels)] = float(value)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, doc: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, doc, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # key -> [每个桶的计数..., +Inf 计数, sum]
+        self._values: Dict[Tuple[str, ...], List[float]] = {}
+
+    def observe(self, value: float, **labels: Any) -> None:
+        key = self._key(labels)
+        row = self._values.get(key)
+        if row is None:
+            row = self._values[key] = [0.0] * (len(self.buckets) + 2)
+        row[bisect.bisect_left(self.buckets, value)] += 1
+        row[-1] += value
+
+    @contextmanager
+    def time(self, **labels: Any) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def render(self) -> List[str]:
+        lines = self._header()
+        for key, row in self._values.items():
+            acc = 0.0
+            for i, le in enumerate(self.buckets):
+                acc += row[i]
+                labels = _fmt_labels(self.labelnames, key, 'le="%g"' % le)
+                lines.append(f"{self.name}_bucket{labels} {acc:g}")
+            acc += row[len(self.buckets)]
+            labels = _fmt_labels(self.labelnames, key, 'le="+Inf"')
+            lines.append(f"{self.name}_bucket{labels} {acc:g}")
+            lines.append(f"{self.name}_sum{_fmt_labels(self.labelnames, key)} {row[-1]:.6g}")
+            lines.append(f"{self.name}_count{_fmt_labels(self.labelnames, key)} {acc:g}")
+        return lines
+
+
+def register_collector(fn: Callable[[], List[str]]) -> None:
+    """抓取时才调用的回调，用于导出各模块已有的统计（缓存命中等），不增加热路径开销。"""
+    _collectors.append(fn)
+
+
+def format_sample(name: str, value: float, **labels: Any) -> str:
+    """供 collector 拼一行样本：标签值统一转义，调用方无需关心文本格式细节。"""
+    return f"{name}{_fmt_labels(tuple(labels), [str(v) for v in labels.values()])} {value:g}"
+
+
+def render() -> str:
+    lines: List[str] = []
+    for m in _metrics:
+        lines.extend(m.render())
+    for fn in _collectors:
+        lines.extend(fn())
+    return "\n".join(lines) + "\n"
+
+
+async def _serve_scrape(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+    """任意路径都返回本进程的指标；只读到请求头结束，不解析请求。"""
+    try:
+        await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), 5)
+        body = render().encode("utf-8")
+        head = (
+            f"HTTP/1.1 200 OK\r\nContent-Type: {CONTENT_TYPE}\r\n"
+            f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n"
+        )
+        writer.write(head.encode("ascii") + body)
+        await writer.drain()
+    except (asyncio.TimeoutError, asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+        pass
+    finally:
+        writer.close()
+
+
+async def start_scrape_server(host: str, base_port: int, count: int) -> Optional[asyncio.AbstractServer]:
+    """
+    在 [base_port, base_port + count) 中绑定第一个空闲端口，单独暴露本进程的指标。
+    各 worker 依次抢占，端口即 worker 标识；worker 被重启时会重新拿到空出来的端口。全部占用时返回 None。
+    """
+    for port in range(base_port, base_port + max(1, count)):
+        try:
+            server = await asyncio.start_server(_serve_scrape, host, port)
+        except OSError:
+            continue
+        logger.info("metrics scrape port=%s pid=%s", port, os.getpid())
+        return server
+    logger.warning("no free metrics port in [%s, %s)", base_port, base_port + max(1, count))
+    return None
+
+
+# ================= 指标定义 =================
+
+PROMPT_BUILD_SECONDS = Histogram(
+    "agent_prompt_build_seconds", "Time spent building the upstream prompt.", ("route",), FAST_BUCKETS
+)
+UPSTREAM_SECONDS = Histogram(
+    "agent_upstream_seconds", "Upstream LLM call latency.", ("provider", "model", "route", "stream")
+)
+UPSTREAM_TTFB_SECONDS = Histogram(
+    "agent_upstream_ttfb_seconds", "Time to first streamed token from the upstream LLM.", ("provider", "model", "route")
+)
+PARSE_SECONDS = Histogram(
+    "agent_llm_parse_seconds", "Time spent parsing LLM output into JSON.", ("route",), FAST_BUCKETS
+)
+REQUESTS_TOTAL = Counter(
+    "agent_requests_total", "Handled requests (HTTP requests and WebSocket messages).", ("route", "status")
+)
+UPSTREAM_ERRORS_TOTAL = Counter(
+    "agent_upstream_errors_total", "Failed upstream LLM calls by status.", ("provider", "status")
+)
+WS_EMPTY_REPLIES_TOTAL = Counter(
+    "agent_ws_empty_replies_total", "WebSocket chat replies sent with empty text.", ("reason",)
+)
+LLM_TOKENS_TOTAL = Counter(
+    "agent_llm_tokens_total", "Tokens reported by the upstream usage field (kind: prompt / completion / cached).",
+    ("provider", "model", "kind"),
+)
+LLM_PARSE_TOTAL = Counter(
+    "agent_llm_parse_total", "LLM JSON outputs by parse outcome (ok / repaired / salvaged / failed).", ("route", "outcome")
+)
+PROMPT_CACHE_TOTAL = Counter(
+    "agent_prompt_cache_total",
+    "Upstream calls by prompt prefix cache result (hit / miss / unreported) from the usage field.",
+    ("provider", "route", "result"),
+)
+WS_CONNECTIONS = Gauge("agent_ws_connections", "Open WebSocket connections.")
+WS_TURNS_CANCELLED_TOTAL = Counter(
+    "agent_ws_turns_cancelled_total",
+    "In-flight WebSocket chat turns cancelled before completion (reason: superseded / disconnect / shutdown).",
+    ("reason",),
+)
+WS_WASTED_GENERATIONS_TOTAL = Counter(
+    "agent_ws_wasted_generations_total",
+    "WebSocket chat generations whose output was produced but never delivered"
+    " (reason: undelivered / cancelled_midstream).",
+    ("reason",),
+)
+WS_DRAINED_TOTAL = Counter(
+    "agent_ws_drained_total",
+    "WebSocket connections closed with 1012 during graceful shutdown (state: idle / after_reply / deadline).",
+    ("state",),
+)
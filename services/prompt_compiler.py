@@ -0,0 +1,206 @@
+# 提示词模板预编译：模板 → 字面量/占位符片段；开头的静态消息预先编码成 JSON bytes
+#
+# layout="consolidated"（默认，见 PROMPT_LAYOUT）：所有静态 system 指令合并为一条稳定的前缀消息，
+# 动态内容按变化频率排在其后（越易变越靠后），使上游的前缀缓存（context cache）尽可能命中；
+# layout="sections"：按配置文件中的顺序逐条输出。
+
+import hashlib
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple, Union
+
+from models.chat_models import Message
+from core.config import PROMPT_LAYOUT
+from services.prompt_registry import prompt_registry
+from utils.json_codec import dumps_bytes
+
+__all__ = [
+    "Placeholder",
+    "CompiledTemplate",
+    "CompiledPrompt",
+    "compile_prompt",
+    "get_compiled",
+    "encode_message",
+    "DEFAULT_SECTIONS",
+    "ARG_VOLATILITY",
+]
+
+DEFAULT_SECTIONS = ("systemMessages", "contextMessages", "userMessages")
+
+# consolidated 布局下动态模板的排序依据：参数的变化频率（越大越易变、越靠后），未列出的按 1。
+# 提示词配置中可用 "argVolatility": {"参数": 数值} 覆盖。
+ARG_VOLATILITY = {"preDailySummary": 0, "preChat": 1, "lng": 2, "lat": 2, "currentTime": 3}
+
+
+@dataclass(frozen=True)
+class Placeholder:
+    key: str
+
+
+Segment = Union[str, Placeholder]
+
+
+def encode_message(role: str, content: str) -> bytes:
+    """单条消息的 JSON 编码（与上游请求体使用同一格式）。"""
+    return dumps_bytes({"role": role, "content": content})
+
+
+def _split_segments(content: str, keys: Sequence[str]) -> Tuple[Segment, ...]:
+    """把 content 按 {key} 切成片段；只识别 needArgs 里声明的 key，其余花括号原样保留。"""
+    segments: List[Segment] = [content]
+    for key in keys:
+        token = "{" + key + "}"
+        nxt: List[Segment] = []
+        for seg in segments:
+            if isinstance(seg, Placeholder) or token not in seg:
+                nxt.append(seg)
+                continue
+            parts = seg.split(token)
+            for i, part in enumerate(parts):
+                if i:
+                    nxt.append(Placeholder(key))
+                if part:
+                    nxt.append(part)
+        segments = nxt
+    return tuple(segments)
+
+
+@dataclass(frozen=True)
+class CompiledTemplate:
+    role: str
+    need_args: Tuple[str, ...]
+    segments: Tuple[Segment, ...]
+
+    @property
+    def is_static(self) -> bool:
+        return not self.need_args
+
+    def render(self, values: Dict[str, str]) -> str:
+        return "".join(s if isinstance(s, str) else values[s.key] for s in self.segments)
+
+
+@dataclass(frozen=True)
+class CompiledPrompt:
+    templates: Tuple[CompiledTemplate, ...]
+    # 开头连续的静态模板（无 needArgs）：Message 对象与预编码 JSON 一次生成、每次请求复用
+    static_messages: Tuple[Message, ...]
+    static_json: bytes
+    # 静态前缀的摘要：相同摘要的请求共享同一段可被上游缓存的前缀
+    prefix_hash: str = ""
+    # 相邻的动态 system 消息渲染后合并为一条（consolidated 布局）
+    merge_context: bool = False
+
+    @property
+    def static_count(self) -> int:
+        return len(self.static_messages)
+
+    def render(
+        self,
+        resolve: Callable[[str], Any],
+        render_value: Callable[[str, Any], str],
+    ) -> List[Message]:
+        """
+        渲染完整消息列表：静态前缀直接复用，其余模板按 needArgs 取值拼接。
+        needArgs 中任一参数缺失（None）则跳过该模板，与旧的逐条替换路径（见 bench/bench_prompt_build.py）行为一致。
+        """
+        out: List[Message] = list(self.static_messages)
+        cache: Dict[str, Any] = {}
+        for tpl in self.templates[self.static_count:]:
+            if tpl.is_static:
+                out.append(Message(role=tpl.role, content=tpl.segments[0] if tpl.segments else ""))
+                continue
+            values: Dict[str, str] = {}
+            for k in tpl.need_args:
+                if k not in cache:
+                    cache[k] = resolve(k)
+                v = cache[k]
+                if v is None:
+                    break
+                values[k] = v if isinstance(v, str) else render_value(k, v)
+            else:
+                text = tpl.render(values)
+                if (
+                    self.merge_context and tpl.role == "system"
+                    and len(out) > self.static_count and out[-1].role == "system"
+                ):
+                    out[-1] = Message(role="system", content=out[-1].content + "\n" + text)
+                else:
+                    out.append(Message(role=tpl.role, content=text))
+        return out
+
+
+def _volatility(tpl: CompiledTemplate, ranks: Dict[str, Any]) -> float:
+    return max((float(ranks.get(k, 1)) for k in tpl.need_args), default=0.0)
+
+
+def _consolidate(templates: List[CompiledTemplate], ranks: Dict[str, Any]) -> List[CompiledTemplate]:
+    """
+    静态 system 模板合并为一条放在最前；其后是其他静态模板（示例对话等），
+    再是按变化频率排序的动态 system 模板，最后是动态的 user / assistant 模板（保持原顺序）。
+    """
+    static_system = [t for t in templates if t.is_static and t.role == "system"]
+    static_other = [t for t in templates if t.is_static and t.role != "system"]
+    dynamic_system = sorted(
+        (t for t in templates if not t.is_static and t.role == "system"), key=lambda t: _volatility(t, ranks)
+    )
+    dynamic_other = [t for t in templates if not t.is_static and t.role != "system"]
+    merged: List[CompiledTemplate] = []
+    if static_system:
+        text = "\n\n".join("".join(t.segments) for t in static_system)
+        merged.append(CompiledTemplate(role="system", need_args=(), segments=(text,)))
+    return merged + static_other + dynamic_system + dynamic_other
+
+
+def compile_prompt(
+    prompts: Dict[str, Any],
+    sections: Sequence[str] = DEFAULT_SECTIONS,
+    layout: str = "sections",
+) -> CompiledPrompt:
+    templates: List[CompiledTemplate] = []
+    for section in sections:
+        for m in (prompts.get(section) or []):
+            if not isinstance(m, dict):
+                continue
+            role = m.get("role")
+            content = m.get("content")
+            if not role or content is None:
+                continue
+            need_args = tuple(str(k) for k in (m.get("needArgs") or []))
+            content = str(content)
+            segments = _split_segments(content, need_args) if need_args else (content,)
+            templates.append(CompiledTemplate(role=str(role), need_args=need_args, segments=segments))
+
+    consolidated = layout == "consolidated"
+    if consolidated:
+        templates = _consolidate(templates, {**ARG_VOLATILITY, **(prompts.get("argVolatility") or {})})
+
+    static: List[Message] = []
+    for tpl in templates:
+        if not tpl.is_static:
+            break
+        static.append(Message(role=tpl.role, content=tpl.segments[0] if tpl.segments else ""))
+
+    static_json = b",".join(encode_message(m.role, m.content) for m in static)
+    return CompiledPrompt(
+        templates=tuple(templates),
+        static_messages=tuple(static),
+        static_json=static_json,
+        prefix_hash=hashlib.sha1(static_json).hexdigest()[:16] if static_json else "",
+        merge_context=consolidated,
+    )
+
+
+# (name, sections, layout) -> (etag, CompiledPrompt)；配置热加载后 etag 变化自动重新编译
+_compiled: Dict[Tuple[str, Tuple[str, ...], str], Tuple[str, CompiledPrompt]] = {}
+
+
+def get_compiled(name: str, sections: Sequence[str] = DEFAULT_SECTIONS, layout: Optional[str] = None) -> CompiledPrompt:
+    prompts = prompt_registry.get(name)
+    etag = prompt_registry.etag(name)
+    layout = layout or PROMPT_LAYOUT
+    key = (name, tuple(sections), layout)
+    hit: Optional[Tuple[str, CompiledPrompt]] = _compiled.get(key)
+    if hit is not None and hit[0] == etag:
+        return hit[1]
+    compiled = compile_prompt(prompts, sections, layout)
+    _compiled[key] = (etag, compiled)
+    return compiled
@@ -0,0 +1,187 @@
+# 提示词配置注册表：启动时一次性加载 config/*.json 到内存，文件变更时后台原子替换
+
+import asyncio
+import hashlib
+import json
+import logging
+import os
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional
+
+from core.config import PROMPT_CONFIG_DIR, PROMPT_RELOAD_INTERVAL
+
+logger = logging.getLogger("uvicorn.error")
+
+__all__ = ["PromptEntry", "PromptRegistry", "prompt_registry"]
+
+
+@dataclass(frozen=True)
+class PromptEntry:
+    name: str          # 文件名去掉 .json，例如 chat_prompts_v2
+    data: Dict[str, Any]
+    mtime: float
+    etag: str          # 文件内容 sha1 前 16 位
+
+
+def _read_entry(path: str, mtime: float) -> PromptEntry:
+    """
+    读取并解析单个配置文件（在线程池中执行）。解析失败直接抛出。
+    mtime 须在读文件之前取得：读的过程中文件被改写时，记下的是旧 mtime，下一轮轮询会再加载新内容。
+    """
+    with open(path, "rb") as f:
+        raw = f.read()
+    data = json.loads(raw.decode("utf-8"))
+    if not isinstance(data, dict):
+        raise ValueError("prompt config 顶层必须是 JSON object")
+    name = os.path.splitext(os.path.basename(path))[0]
+    return PromptEntry(name=name, data=data, mtime=mtime, etag=hashlib.sha1(raw).hexdigest()[:16])
+
+
+class PromptRegistry:
+    """
+    - get(name): 读内存，不做任何文件 I/O
+    - 后台任务发现文件变化后重新解析，成功才替换；失败保留上一次的有效版本
+    - etag(name) / version: 供缓存 key、排查问题使用
+    """
+
+    def __init__(self, config_dir: str = PROMPT_CONFIG_DIR, interval: float = PROMPT_RELOAD_INTERVAL):
+        self.config_dir = config_dir
+        self.interval = interval
+        self._entries: Dict[str, PromptEntry] = {}
+        # 解析失败的文件版本（name → mtime）：同一个坏版本只报一次错，文件再次修改后才重试
+        self._failed_mtime: Dict[str, float] = {}
+        self._task: Optional[asyncio.Task] = None
+        self._stop_event: Optional[asyncio.Event] = None
+
+    # ---------- 读取 ----------
+    def get(self, name: str) -> Dict[str, Any]:
+        entry = self._entries.get(name)
+        if entry is None:
+            # 未经 lifespan 启动（脚本/测试直接调用）时兜底加载一次
+            entry = self._load_one(os.path.join(self.config_dir, name + ".json"))
+        if entry is None:
+            raise KeyError(name)
+        return entry.data
+
+    def entry(self, name: str) -> Optional[PromptEntry]:
+        return self._entries.get(name)
+
+    def etag(self, name: str) -> str:
+        entry = self._entries.get(name)
+        return entry.etag if entry else ""
+
+    @property
+    def version(self) -> str:
+        """所有配置 etag 的组合摘要，任一文件变化都会变化。"""
+        h = hashlib.sha1()
+        for name in sorted(self._entries):
+            h.update(name.encode("utf-8"))
+            h.update(self._entries[name].etag.encode("ascii"))
+        return h.hexdigest()[:16]
+
+    def entries(self, prefix: str = "") -> List[PromptEntry]:
+        return [e for n, e in sorted(self._entries.items()) if n.startswith(prefix)]
+
+    # ---------- 加载 ----------
+    def _paths(self) -> List[str]:
+        try:
+            names = os.listdir(self.config_dir)
+        except FileNotFoundError:
+            logger.error("[prompts] config dir not found: %s", self.config_dir)
+            return []
+        return [os.path.join(self.config_dir, n) for n in sorted(names) if n.endswith(".json")]
+
+    def _load_one(self, path: str) -> Optional[PromptEntry]:
+        name = os.path.splitext(os.path.basename(path))[0]
+        mtime: Optional[float] = None
+        try:
+            mtime = os.stat(path).st_mtime
+            entry = _read_entry(path, mtime)
+        except FileNotFoundError:
+            return None
+        except Exception:
+            logger.exception("[prompts] load failed, keep last good version: %s", path)
+            if mtime is not None:
+                self._failed_mtime[name] = mtime
+            return None
+        self._failed_mtime.pop(name, None)
+        old = self._entries.get(entry.name)
+        # 整体替换 entry 引用，读方要么看到旧版本要么看到新版本
+        self._entries[entry.name] = entry
+        if old is not None and old.etag != entry.etag:
+            logger.info("[prompts] reloaded %s etag %s -> %s", entry.name, old.etag, entry.etag)
+        return entry
+
+    def load_all(self) -> None:
+        """启动时同步加载全部配置。"""
+        for path in self._paths():
+            self._load_one(path)
+        logger.info("[prompts] loaded %s version=%s", sorted(self._entries), self.version)
+
+    async def reload_changed(self) -> List[str]:
+        """检查 mtime，变化的文件在线程池中重新加载；返回重新加载的配置名。"""
+        changed: List[str] = []
+        for path in self._paths():
+            name = os.path.splitext(os.path.basename(path))[0]
+            try:
+                mtime = os.stat(path).st_mtime
+            except FileNotFoundError:
+                continue
+            old = self._entries.get(name)
+            if old is not None and old.mtime == mtime:
+                continue
+            if self._failed_mtime.get(name) == mtime:
+                continue
+            entry = await asyncio.to_thread(self._load_one, path)
+            if entry is not None and (old is None or old.etag != entry.etag):
+                changed.append(name)
+        return changed
+
+    # ---------- 后台监听 ----------
+    async def _watch(self) -> None:
+        try:
+            from watchfiles import awatch
+        except ImportError:
+            awatch = None
+
+        if awatch is not None:
+            try:
+                async for _ in awatch(
+                    self.config_dir, debounce=200, recursive=False, stop_event=self._stop_event
+                ):
+                    await self.reload_changed()
+                return
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("[prompts] watchfiles failed, fallback to mtime polling")
+
+        while not self._stop_event.is_set():
+            try:
+                await asyncio.wait_for(self._stop_event.wait(), timeout=self.interval)
+                return
+            except asyncio.TimeoutError:
+                pass
+            try:
+                await self.reload_changed()
+            except Exception:
+                logger.exception("[prompts] reload check failed")
+
+    async def start(self) -> None:
+        self.load_all()
+        if self._task is None and self.interval > 0:
+            self._stop_event = asyncio.Event()
+            self._task = asyncio.create_task(self._watch())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            # 通过 stop_event 让 watchfiles 线程 / 轮询循环自行退出
+            self._stop_event.set()
+            try:
+                await asyncio.wait_for(self._task, timeout=1.0)
+            except (asyncio.TimeoutError, asyncio.CancelledError, Exception):
+                pass
+            self._task = None
+
+
+prompt_registry = PromptRegistry()
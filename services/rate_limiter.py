@@ -0,0 +1,275 @@
+# 上游限流：按 provider / model 的令牌桶（请求数 + 估算 token）与 AIMD 自适应并发
+#
+# 每个 provider 有一个总限流器（整个 provider 的上限）；LLM_LIMITS 中单独配置了 "provider:model" 的模型
+# 另有自己的限流器，调用时两级都要拿到名额。未单独配置的模型（含客户端传入的任意模型名）只走 provider 总限流器，
+# 限流器数量因此有界。
+
+import asyncio
+import json
+import logging
+import time
+from typing import Any, Dict, List, Tuple
+
+import httpx
+from fastapi import HTTPException
+
+from core.config import (
+    LLM_LIMIT_DEFAULTS,
+    LLM_LIMITS,
+    LLM_LIMIT_MIN_CONCURRENCY,
+    LLM_LIMIT_MAX_CONCURRENCY,
+    LLM_LIMIT_MAX_WAIT,
+    SERVE_WORKERS,
+)
+
+logger = logging.getLogger("uvicorn.error")
+
+__all__ = ["RateLimitTimeout", "TokenBucket", "AdaptiveLimiter", "get_limiter", "limiter_stats"]
+
+# 这些状态码视为上游过载，触发并发收缩
+_OVERLOAD_STATUS = {429, 500, 502, 503, 504}
+# 两次收缩之间的最小间隔，避免同一波失败把并发一路砍到底
+_DECREASE_COOLDOWN = 1.0
+
+
+class RateLimitTimeout(HTTPException):
+    """本地排队超过最长等待时间。"""
+
+    def __init__(self, name: str, waited: float):
+        super().__init__(status_code=503, detail=f"upstream {name} busy, queued {waited:.1f}s")
+
+
+class TokenBucket:
+    """容量 capacity、每秒补充 rate 的令牌桶；rate <= 0 表示不限。"""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = max(capacity, 1.0)
+        self.tokens = self.capacity
+        self._ts = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self._ts) * self.rate)
+        self._ts = now
+
+    def wait_time(self, n: float) -> float:
+        """取 n 个令牌还需等待的秒数；为 0 时表示已取走。"""
+        if self.rate <= 0:
+            return 0.0
+        n = min(n, self.capacity)
+        self._refill()
+        if self.tokens >= n:
+            self.tokens -= n
+            return 0.0
+        return (n - self.tokens) / self.rate
+
+
+class AdaptiveLimiter:
+    """
+    单个 provider / model 的限流器：
+      - 并发：AIMD，成功时加性增长（每个 limit 次成功 +1），429/5xx/超时时减半
+      - 速率：请求数令牌桶（rps）+ 估算 token 令牌桶（tpm）
+      - 排队：最多等待 max_wait 秒，超时抛 RateLimitTimeout(503)
+    """
+
+    def __init__(
+        self,
+        name: str,
+        rps: float,
+        tpm: float,
+        concurrency: int,
+        min_concurrency: int = LLM_LIMIT_MIN_CONCURRENCY,
+        max_concurrency: int = LLM_LIMIT_MAX_CONCURRENCY,
+        max_wait: float = LLM_LIMIT_MAX_WAIT,
+        parent: "AdaptiveLimiter | None" = None,
+    ):
+        self.name = name
+        self.parent = parent
+        self.min_concurrency = max(1, min_concurrency)
+        self.max_concurrency = max(self.min_concurrency, max_concurrency)
+        self.limit = float(min(max(concurrency, self.min_concurrency), self.max_concurrency))
+        self.max_wait = max_wait
+        self.requests = TokenBucket(rps, max(rps, 1.0))
+        self.tokens = TokenBucket(tpm / 60.0, tpm / 6.0 if tpm > 0 else 1.0)  # 突发容量 = 10 秒的量
+        self.inflight = 0
+        self.waiting = 0
+        self._cond = asyncio.Condition()
+        self._last_decrease = 0.0
+        self.stats: Dict[str, int] = {"acquired": 0, "timeouts": 0, "overloads": 0}
+
+    # ---------- AIMD ----------
+    def on_success(self) -> None:
+        self.limit = min(self.max_concurrency, self.limit + 1.0 / self.limit)
+
+    def on_overload(self) -> None:
+        self.stats["overloads"] += 1
+        now = time.monotonic()
+        if now - self._last_decrease < _DECREASE_COOLDOWN:
+            return
+        self._last_decrease = now
+        old = self.limit
+        self.limit = max(float(self.min_concurrency), self.limit / 2.0)
+        logger.warning("[limiter] %s overload, concurrency %.1f -> %.1f", self.name, old, self.limit)
+
+    def observe_status(self, status_code: int) -> None:
+        if status_code in _OVERLOAD_STATUS:
+            self.on_overload()
+        elif status_code < 400:
+            self.on_success()
+
+    # ---------- 获取 / 释放 ----------
+    async def acquire(self, est_tokens: int = 0) -> None:
+        start = time.monotonic()
+        deadline = start + self.max_wait
+        self.waiting += 1
+        try:
+            async with self._cond:
+                while self.inflight >= int(self.limit):
+                    remain = deadline - time.monotonic()
+                    if remain <= 0:
+                        raise self._timeout(start)
+                    try:
+                        await asyncio.wait_for(self._cond.wait(), timeout=remain)
+                    except asyncio.TimeoutError:
+                        raise self._timeout(start)
+                self.inflight += 1
+            try:
+                for bucket, n in ((self.requests, 1), (self.tokens, est_tokens)):
+                    while True:
+                        wait = bucket.wait_time(n)
+                        if wait <= 0:
+                            break
+                        if time.monotonic() + wait > deadline:
+                            raise self._timeout(start)
+                        await asyncio.sleep(wait)
+            except BaseException:
+                await self.release()
+                raise
+        finally:
+            self.waiting -= 1
+        self.stats["acquired"] += 1
+
+    async def release(self) -> None:
+        async with self._cond:
+            self.inflight -= 1
+            self._cond.notify()
+
+    def _timeout(self, start: float) -> RateLimitTimeout:
+        self.stats["timeouts"] += 1
+        return RateLimitTimeout(self.name, time.monotonic() - start)
+
+    def slot(self, est_tokens: int = 0) -> "_Slot":
+        return _Slot(self, est_tokens)
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            **self.stats,
+            "concurrency_limit": round(self.limit, 2),
+            "inflight": self.inflight,
+            "queue_depth": self.waiting,
+            "rps": self.requests.rate,
+            "tpm": round(self.tokens.rate * 60.0),
+        }
+
+
+class _Slot:
+    """
+    async with limiter.slot(est) as slot:
+        r = await client.post(...)
+        slot.observe(r.status_code)
+    未显式 observe 时：正常退出视为成功，超时/连接错误视为过载。
+    """
+
+    def __init__(self, limiter: AdaptiveLimiter, est_tokens: int):
+        self.limiter = limiter
+        self.est_tokens = est_tokens
+        self._observed = False
+        # 先拿 provider 总名额，再拿模型名额
+        self._chain: List[AdaptiveLimiter] = [x for x in (limiter.parent, limiter) if x is not None]
+        self._held: List[AdaptiveLimiter] = []
+
+    def observe(self, status_code: int) -> None:
+        self._observed = True
+        for limiter in self._chain:
+            limiter.observe_status(status_code)
+
+    async def __aenter__(self) -> "_Slot":
+        try:
+            for limiter in self._chain:
+                await limiter.acquire(self.est_tokens)
+                self._held.append(limiter)
+        except BaseException:
+            await self._release()
+            raise
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb) -> None:
+        try:
+            if not self._observed:
+                for limiter in self._chain:
+                    if exc_type is None:
+                        limiter.on_success()
+                    elif issubclass(exc_type, (httpx.TimeoutException, httpx.NetworkError)):
+                        limiter.on_overload()
+        finally:
+            await self._release()
+
+    async def _release(self) -> None:
+        while self._held:
+            await self._held.pop().release()
+
+
+def _load_overrides() -> Dict[str, Dict[str, Any]]:
+    if not LLM_LIMITS:
+        return {}
+    try:
+        data = json.loads(LLM_LIMITS)
+        return data if isinstance(data, dict) else {}
+    except Exception:
+        logger.exception("[limiter] invalid LLM_LIMITS, ignored")
+        return {}
+
+
+_overrides = _load_overrides()
+# 配置的限额是整个实例（所有 worker）的总量，每个 worker 进程按份额执行
+_WORKER_SHARE = 1.0 / max(SERVE_WORKERS, 1)
+_limiters: Dict[Tuple[str, str], AdaptiveLimiter] = {}
+
+
+def _build(name: str, cfg: Dict[str, Any], parent: AdaptiveLimiter | None = None) -> AdaptiveLimiter:
+    return AdaptiveLimiter(
+        name=name,
+        rps=float(cfg.get("rps", 0)) * _WORKER_SHARE,
+        tpm=float(cfg.get("tpm", 0)) * _WORKER_SHARE,
+        concurrency=max(1, round(int(cfg.get("concurrency", 16)) * _WORKER_SHARE)),
+        parent=parent,
+    )
+
+
+def _provider_limiter(provider: str) -> AdaptiveLimiter:
+    key = (provider, "")
+    limiter = _limiters.get(key)
+    if limiter is None:
+        cfg: Dict[str, Any] = dict(LLM_LIMIT_DEFAULTS.get(provider) or {"rps": 0, "tpm": 0, "concurrency": 16})
+        cfg.update(_overrides.get(provider) or {})
+        limiter = _limiters[key] = _build(provider, cfg)
+    return limiter
+
+
+def get_limiter(provider: str, model: str) -> AdaptiveLimiter:
+    """单独配置过的模型返回其模型限流器（挂在 provider 总限流器下），其余模型返回 provider 总限流器。"""
+    parent = _provider_limiter(provider)
+    model_cfg = _overrides.get(f"{provider}:{model}")
+    if not model or not isinstance(model_cfg, dict):
+        return parent
+    key = (provider, model)
+    limiter = _limiters.get(key)
+    if limiter is None:
+        cfg: Dict[str, Any] = {"concurrency": LLM_LIMIT_MAX_CONCURRENCY, **model_cfg}
+        limiter = _limiters[key] = _build(f"{provider}:{model}", cfg, parent=parent)
+    return limiter
+
+
+def limiter_stats() -> Dict[str, Dict[str, Any]]:
+    return {limiter.name: limiter.snapshot() for limiter in _limiters.values()}
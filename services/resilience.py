@@ -0,0 +1,196 @@
+# 调用韧性基础组件：瞬时错误判定、抖动退避、延迟分位统计、对冲请求、熔断器
+
+import asyncio
+import logging
+import random
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Optional, Tuple
+
+import httpx
+from fastapi import HTTPException
+
+from core.config import (
+    RETRY_BASE_DELAY,
+    RETRY_MAX_DELAY,
+    HEDGE_PERCENTILE,
+    HEDGE_MIN_DELAY,
+    HEDGE_MIN_SAMPLES,
+    BREAKER_FAILURE_THRESHOLD,
+    BREAKER_OPEN_SECONDS,
+)
+from services.rate_limiter import RateLimitTimeout
+
+logger = logging.getLogger("uvicorn.error")
+
+__all__ = [
+    "CircuitOpenError",
+    "CircuitBreaker",
+    "LatencyTracker",
+    "is_transient",
+    "backoff_delay",
+    "hedged",
+    "get_breaker",
+    "get_latency",
+    "count",
+    "resilience_stats",
+]
+
+_TRANSIENT_STATUS = {408, 429, 500, 502, 503, 504}
+
+
+class CircuitOpenError(HTTPException):
+    def __init__(self, name: str):
+        super().__init__(status_code=503, detail=f"circuit open: {name}")
+
+
+def is_transient(exc: BaseException) -> bool:
+    """可以重试 / 切换 provider 的错误：限流、5xx、超时、网络错误、本地排队超时（只切换，不重试）。"""
+    if isinstance(exc, (RateLimitTimeout, CircuitOpenError)):
+        return True
+    if isinstance(exc, HTTPException):
+        return exc.status_code in _TRANSIENT_STATUS
+    return isinstance(exc, (httpx.TimeoutException, httpx.NetworkError, httpx.RemoteProtocolError))
+
+
+def backoff_delay(attempt: int) -> float:
+    """full jitter 指数退避：uniform(0, min(max, base * 2^attempt))。"""
+    return random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * (2 ** attempt)))
+
+
+class LatencyTracker:
+    """最近 N 次成功调用的耗时（秒），用于计算对冲阈值。"""
+
+    def __init__(self, size: int = 200):
+        self._samples: Deque[float] = deque(maxlen=size)
+
+    def observe(self, seconds: float) -> None:
+        self._samples.append(seconds)
+
+    def percentile(self, p: float) -> Optional[float]:
+        if len(self._samples) < HEDGE_MIN_SAMPLES:
+            return None
+        data = sorted(self._samples)
+        return data[min(len(data) - 1, int(p * len(data)))]
+
+    def hedge_delay(self) -> Optional[float]:
+        p = self.percentile(HEDGE_PERCENTILE)
+        return None if p is None else max(HEDGE_MIN_DELAY, p)
+
+
+class CircuitBreaker:
+    """
+    closed：正常放行，连续失败达到阈值 → open
+    open：拒绝，open_seconds 后 → half_open
+    half_open：只放行一个探测请求，成功 → closed，失败 → open；
+               探测请求被取消而没有结果时，open_seconds 后再放行一个
+    """
+
+    def __init__(self, name: str, threshold: int = BREAKER_FAILURE_THRESHOLD, open_seconds: float = BREAKER_OPEN_SECONDS):
+        self.name = name
+        self.threshold = threshold
+        self.open_seconds = open_seconds
+        self.state = "closed"
+        self.failures = 0
+        self._opened_at = 0.0
+        self._probing = False
+        self._probe_at = 0.0
+        self.stats: Dict[str, int] = {"opened": 0, "rejected": 0}
+
+    def allow(self) -> bool:
+        if self.state == "closed":
+            return True
+        if self.state == "open" and time.monotonic() - self._opened_at >= self.open_seconds:
+            self.state = "half_open"
+            self._probing = False
+        if self.state == "half_open":
+            now = time.monotonic()
+            if not self._probing or now - self._probe_at >= self.open_seconds:
+                self._probing = True
+                self._probe_at = now
+                return True
+        self.stats["rejected"] += 1
+        return False
+
+    def record_success(self) -> None:
+        if self.state != "closed":
+            logger.info("[breaker] %s closed", self.name)
+        self.state = "closed"
+        self.failures = 0
+        self._probing = False
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        if self.state == "half_open" or self.failures >= self.threshold:
+            if self.state != "open":
+                self.stats["opened"] += 1
+                logger.warning("[breaker] %s open after %s failures", self.name, self.failures)
+            self.state = "open"
+            self._opened_at = time.monotonic()
+            self._probing = False
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {**self.stats, "state": self.state, "failures": self.failures}
+
+
+async def hedged(fn: Callable[[], Awaitable[Any]], delay: Optional[float]) -> Any:
+    """
+    先发一个请求；delay 秒内未完成则再发一个相同请求，取先成功者并取消另一个。
+    delay 为 None 时不对冲。两个都失败时抛出最后一个异常。
+    """
+    first = asyncio.ensure_future(fn())
+    if delay is None:
+        return await first
+    pending = {first}
+    try:
+        done, _ = await asyncio.wait(pending, timeout=delay)
+        if not done:
+            logger.info("[hedge] no reply after %.2fs, sending hedged request", delay)
+            _stats["hedged"] += 1
+            pending.add(asyncio.ensure_future(fn()))
+        last_exc: Optional[BaseException] = None
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for t in done:
+                exc = t.exception()
+                if exc is None:
+                    if t is not first:
+                        _stats["hedge_wins"] += 1
+                    return t.result()
+                last_exc = exc
+        raise last_exc  # type: ignore[misc]
+    finally:
+        for t in pending:
+            t.cancel()
+
+
+_stats: Dict[str, int] = {"hedged": 0, "hedge_wins": 0, "retries": 0, "failovers": 0}
+_breakers: Dict[str, CircuitBreaker] = {}
+_latency: Dict[Tuple[str, str], LatencyTracker] = {}
+
+
+def get_breaker(provider: str) -> CircuitBreaker:
+    b = _breakers.get(provider)
+    if b is None:
+        b = _breakers[provider] = CircuitBreaker(provider)
+    return b
+
+
+def get_latency(provider: str, route: Optional[str]) -> LatencyTracker:
+    key = (provider, route or "default")
+    t = _latency.get(key)
+    if t is None:
+        t = _latency[key] = LatencyTracker()
+    return t
+
+
+def count(name: str) -> None:
+    _stats[name] = _stats.get(name, 0) + 1
+
+
+def resilience_stats() -> Dict[str, Any]:
+    return {
+        **_stats,
+        "breakers": {name: b.snapshot() for name, b in _breakers.items()},
+        "hedge_delay": {f"{p}:{r}": t.hedge_delay() for (p, r), t in _latency.items()},
+    }
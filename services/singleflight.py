@@ -0,0 +1,112 @@
+# 并发请求合并：相同 key 的并发调用共享一次上游执行，完成结果短期保留供迟到的重试复用
+
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from core.config import SINGLEFLIGHT_RESULT_TTL
+
+logger = logging.getLogger("uvicorn.error")
+
+__all__ = ["SingleFlight", "summary_flight"]
+
+
+class _Call:
+    __slots__ = ("task", "waiters")
+
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    do(key, fn)：
+      - 窗口内已有完成结果 → 直接返回（use_recent=False 时跳过）
+      - 已有同 key 调用在执行 → 等待同一个结果
+      - 否则启动 fn()，作为独立 task 执行
+    传了 remember(value) 时只保留它判定为 True 的结果（如解析失败 / 缺字段的结果不应被重试复用）。
+    上游 task 与发起者解耦：某个等待者被取消（客户端断开）不影响其他等待者；
+    最后一个等待者离开时才取消上游调用，避免浪费 token。异常会传给所有等待者，但不缓存。
+    """
+
+    def __init__(self, result_ttl: float = SINGLEFLIGHT_RESULT_TTL, max_results: int = 4096):
+        self.result_ttl = result_ttl
+        self.max_results = max_results
+        self._inflight: Dict[str, _Call] = {}
+        self._results: Dict[str, Tuple[float, Any]] = {}
+        self.stats: Dict[str, int] = {"started": 0, "joined": 0, "recent_hits": 0, "cancelled": 0}
+
+    def _recent(self, key: str) -> Optional[Tuple[float, Any]]:
+        hit = self._results.get(key)
+        if hit is None:
+            return None
+        if hit[0] < time.monotonic():
+            self._results.pop(key, None)
+            return None
+        return hit
+
+    def _remember(self, key: str, value: Any) -> None:
+        if self.result_ttl <= 0:
+            return
+        now = time.monotonic()
+        if len(self._results) >= self.max_results:
+            # 先清过期，仍超限则丢弃最早写入的一半
+            for k in [k for k, (exp, _) in self._results.items() if exp < now]:
+                self._results.pop(k, None)
+            if len(self._results) >= self.max_results:
+                for k in list(self._results)[: self.max_results // 2]:
+                    self._results.pop(k, None)
+        self._results[key] = (now + self.result_ttl, value)
+
+    async def do(
+        self,
+        key: str,
+        fn: Callable[[], Awaitable[Any]],
+        use_recent: bool = True,
+        remember: Optional[Callable[[Any], bool]] = None,
+    ) -> Any:
+        if use_recent:
+            hit = self._recent(key)
+            if hit is not None:
+                self.stats["recent_hits"] += 1
+                return hit[1]
+
+        call = self._inflight.get(key)
+        if call is None:
+            call = _Call(asyncio.ensure_future(self._run(key, fn, remember)))
+            self._inflight[key] = call
+            self.stats["started"] += 1
+        else:
+            self.stats["joined"] += 1
+            logger.info("[singleflight] join in-flight call key=%s", key[:16])
+
+        call.waiters += 1
+        try:
+            return await asyncio.shield(call.task)
+        except asyncio.CancelledError:
+            if call.waiters == 1 and not call.task.done():
+                self.stats["cancelled"] += 1
+                logger.info("[singleflight] last waiter gone, cancel upstream key=%s", key[:16])
+                call.task.cancel()
+            raise
+        finally:
+            call.waiters -= 1
+
+    async def _run(
+        self, key: str, fn: Callable[[], Awaitable[Any]], remember: Optional[Callable[[Any], bool]] = None
+    ) -> Any:
+        try:
+            value = await fn()
+            if remember is None or remember(value):
+                self._remember(key, value)
+            return value
+        finally:
+            self._inflight.pop(key, None)
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {**self.stats, "inflight": len(self._inflight), "recent": len(self._results)}
+
+
+summary_flight = SingleFlight()
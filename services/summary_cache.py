@@ -0,0 +1,214 @@
+# daily summary 结果缓存：进程内 LRU（带 TTL）+ 本地 SQLite（容器重启后仍可命中）
+
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, Optional, Tuple
+
+from core.config import (
+    SUMMARY_CACHE_ENABLED,
+    SUMMARY_CACHE_MAX_ITEMS,
+    SUMMARY_CACHE_TTL,
+    SUMMARY_CACHE_DB,
+    SUMMARY_CACHE_DISK_TTL,
+)
+
+logger = logging.getLogger("uvicorn.error")
+
+__all__ = ["CacheControl", "SummaryCache", "summary_cache", "make_cache_key"]
+
+
+def make_cache_key(normalized: Any, prompt_version: str, model: str) -> str:
+    """内容寻址 key：规范化请求 + 提示词版本 + 模型。"""
+    raw = json.dumps(normalized, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+    h = hashlib.sha256()
+    h.update(model.encode("utf-8"))
+    h.update(b"|")
+    h.update(prompt_version.encode("utf-8"))
+    h.update(b"|")
+    h.update(raw.encode("utf-8"))
+    return h.hexdigest()
+
+
+@dataclass(frozen=True)
+class CacheControl:
+    """
+    单次请求的缓存控制，来自 Cache-Control 请求头：
+      no-cache  → 不读缓存（仍写入新结果）
+      no-store  → 不读也不写
+      max-age=N → 只接受 N 秒内生成的缓存
+    """
+    read: bool = True
+    write: bool = True
+    max_age: Optional[float] = None
+
+    @classmethod
+    def parse(cls, header: Optional[str]) -> "CacheControl":
+        if not header:
+            return cls()
+        read, write, max_age = True, True, None
+        for part in header.lower().split(","):
+            part = part.strip()
+            if part == "no-cache":
+                read = False
+            elif part == "no-store":
+                read = write = False
+            elif part.startswith("max-age="):
+                try:
+                    max_age = max(0.0, float(part[len("max-age="):]))
+                except ValueError:
+                    pass
+        return cls(read=read, write=write, max_age=max_age)
+
+
+class SummaryCache:
+    def __init__(
+        self,
+        max_items: int = SUMMARY_CACHE_MAX_ITEMS,
+        ttl: float = SUMMARY_CACHE_TTL,
+        db_path: Optional[str] = SUMMARY_CACHE_DB,
+        disk_ttl: float = SUMMARY_CACHE_DISK_TTL,
+        enabled: bool = SUMMARY_CACHE_ENABLED,
+    ):
+        self.max_items = max_items
+        self.ttl = ttl
+        self.db_path = db_path or None
+        self.disk_ttl = disk_ttl
+        self.enabled = enabled
+        # key -> (created_at, value)
+        self._mem: "OrderedDict[str, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self._db: Optional[sqlite3.Connection] = None
+        self._db_lock = threading.Lock()
+        self.stats: Dict[str, int] = {
+            "memory_hits": 0,
+            "disk_hits": 0,
+            "misses": 0,
+            "bypass": 0,
+            "writes": 0,
+        }
+
+    # ---------- 生命周期 ----------
+    def open(self) -> None:
+        if not self.enabled or not self.db_path or self._db is not None:
+            return
+        try:
+            os.makedirs(os.path.dirname(self.db_path) or ".", exist_ok=True)
+            db = sqlite3.connect(self.db_path, check_same_thread=False)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS summary_cache ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, created_at REAL NOT NULL)"
+            )
+            db.execute("DELETE FROM summary_cache WHERE created_at < ?", (time.time() - self.disk_ttl,))
+            db.commit()
+            self._db = db
+            logger.info("[summary_cache] sqlite ready path=%s", self.db_path)
+        except Exception:
+            logger.exception("[summary_cache] open sqlite failed, memory tier only: %s", self.db_path)
+            self._db = None
+
+    def close(self) -> None:
+        with self._db_lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+    # ---------- 磁盘层（线程池中执行）----------
+    def _disk_get(self, key: str) -> Optional[Tuple[float, Dict[str, Any]]]:
+        with self._db_lock:
+            if self._db is None:
+                return None
+            row = self._db.execute(
+                "SELECT created_at, value FROM summary_cache WHERE key = ?", (key,)
+            ).fetchone()
+        if row is None:
+            return None
+        return row[0], json.loads(row[1])
+
+    def _disk_put(self, key: str, created_at: float, value: Dict[str, Any]) -> None:
+        data = json.dumps(value, ensure_ascii=False)
+        with self._db_lock:
+            if self._db is None:
+                return
+            self._db.execute(
+                "INSERT OR REPLACE INTO summary_cache (key, value, created_at) VALUES (?, ?, ?)",
+                (key, data, created_at),
+            )
+            self._db.commit()
+
+    # ---------- 内存层 ----------
+    def _mem_put(self, key: str, created_at: float, value: Dict[str, Any]) -> None:
+        self._mem[key] = (created_at, value)
+        self._mem.move_to_end(key)
+        while len(self._mem) > self.max_items:
+            self._mem.popitem(last=False)
+
+    @staticmethod
+    def _fresh(created_at: float, ttl: float, cc: CacheControl) -> bool:
+        age = time.time() - created_at
+        if age > ttl:
+            return False
+        return cc.max_age is None or age <= cc.max_age
+
+    # ---------- 对外接口 ----------
+    async def get(self, key: str, cc: CacheControl = CacheControl()) -> Optional[Dict[str, Any]]:
+        if not self.enabled:
+            return None
+        if not cc.read:
+            self.stats["bypass"] += 1
+            return None
+
+        hit = self._mem.get(key)
+        if hit is not None:
+            if self._fresh(hit[0], self.ttl, cc):
+                self._mem.move_to_end(key)
+                self.stats["memory_hits"] += 1
+                return hit[1]
+            if time.time() - hit[0] > self.ttl:
+                self._mem.pop(key, None)
+
+        if self._db is not None:
+            try:
+                row = await asyncio.to_thread(self._disk_get, key)
+            except Exception:
+                logger.exception("[summary_cache] disk get failed")
+                row = None
+            if row is not None and self._fresh(row[0], self.disk_ttl, cc):
+                self._mem_put(key, row[0], row[1])
+                self.stats["disk_hits"] += 1
+                return row[1]
+
+        self.stats["misses"] += 1
+        return None
+
+    async def put(self, key: str, value: Dict[str, Any], cc: CacheControl = CacheControl()) -> None:
+        if not self.enabled or not cc.write:
+            return
+        now = time.time()
+        self._mem_put(key, now, value)
+        self.stats["writes"] += 1
+        if self._db is not None:
+            try:
+                await asyncio.to_thread(self._disk_put, key, now, value)
+            except Exception:
+                logger.exception("[summary_cache] disk put failed")
+
+    def snapshot(self) -> Dict[str, Any]:
+        lookups = self.stats["memory_hits"] + self.stats["disk_hits"] + self.stats["misses"]
+        hits = self.stats["memory_hits"] + self.stats["disk_hits"]
+        return {
+            **self.stats,
+            "hit_ratio": round(hits / lookups, 4) if lookups else 0.0,
+            "memory_items": len(self._mem),
+            "disk_enabled": self._db is not None,
+        }
+
+
+summary_cache = SummaryCache()
@@ -0,0 +1,203 @@
+# 时间线索引：历史条目的时间戳只解析一次（按格式特征直接切片 + 记忆化），按与 pivot 的距离做部分选择
+
+import heapq
+import logging
+from datetime import datetime, timedelta, timezone, tzinfo
+from functools import lru_cache
+from typing import Any, Iterator, List, Optional, Tuple
+from zoneinfo import ZoneInfo
+
+from core.config import BUSINESS_TZ
+
+logger = logging.getLogger("uvicorn.error")
+
+__all__ = ["parse_dt", "extract_item_dt", "TimelineIndex", "parse_cache_info", "business_now", "business_today"]
+
+# 条目中可能携带时间的字段，按优先级
+DT_FIELDS = (
+    "time",
+    "timestamp",
+    "ts",
+    "createdAt",
+    "created_at",
+    "date",
+    "datetime",
+    "summaryDate",
+    "summary_date",
+)
+
+_FALLBACK_FORMATS = (
+    "%Y-%m-%d %H:%M:%S",
+    "%Y-%m-%d %H:%M",
+    "%Y-%m-%d",
+    "%Y%m%d",
+    "%Y%m%d%H%M%S",
+)
+
+
+def _fast_parse(s: str) -> Optional[datetime]:
+    """
+    常见格式按位置直接取数字，不走异常：
+      YYYY-MM-DD / YYYY-MM-DD HH:MM / YYYY-MM-DD HH:MM:SS（分隔符 T 或空格）
+      YYYYMMDD / YYYYMMDDHHMMSS
+    不匹配时返回 None，由调用方退回通用解析。
+    """
+    n = len(s)
+    try:
+        if n in (10, 16, 19) and s[4] == "-" and s[7] == "-":
+            if n == 10:
+                return datetime(int(s[0:4]), int(s[5:7]), int(s[8:10]))
+            if s[10] in " T" and s[13] == ":" and (n == 16 or s[16] == ":"):
+                return datetime(
+                    int(s[0:4]), int(s[5:7]), int(s[8:10]),
+                    int(s[11:13]), int(s[14:16]), int(s[17:19]) if n == 19 else 0,
+                )
+        elif s.isdigit():
+            if n == 8:
+                return datetime(int(s[0:4]), int(s[4:6]), int(s[6:8]))
+            if n == 14:
+                return datetime(int(s[0:4]), int(s[4:6]), int(s[6:8]), int(s[8:10]), int(s[10:12]), int(s[12:14]))
+    except ValueError:
+        return None
+    return None
+
+
+@lru_cache(maxsize=16384)
+def _parse_str(raw: str) -> Optional[datetime]:
+    s = raw.strip()
+    if not s:
+        return None
+    s = s.replace("/", "-")
+    if s.endswith("Z"):
+        s = s[:-1]
+    dt = _fast_parse(s)
+    if dt is not None:
+        return dt
+    try:
+        return datetime.fromisoformat(s)
+    except ValueError:
+        pass
+    for fmt in _FALLBACK_FORMATS:
+        try:
+            return datetime.strptime(s, fmt)
+        except ValueError:
+            continue
+    return None
+
+
+@lru_cache(maxsize=16384)
+def _parse_num(ts: float) -> Optional[datetime]:
+    # ms -> s
+    if ts > 1e12:
+        ts = ts / 1000.0
+    try:
+        return datetime.fromtimestamp(ts)
+    except (OverflowError, OSError, ValueError):
+        return None
+
+
+def parse_dt(x: Any) -> Optional[datetime]:
+    """Best-effort parse timestamps/dates（秒 / 毫秒时间戳或字符串），结果记忆化。"""
+    if x is None:
+        return None
+    if isinstance(x, str):
+        return _parse_str(x)
+    if isinstance(x, (int, float)) and not isinstance(x, bool):
+        return _parse_num(float(x))
+    return None
+
+
+def extract_item_dt(item: Any) -> Optional[datetime]:
+    """Extract a datetime from common fields in a dict item."""
+    if not isinstance(item, dict):
+        return None
+    for k in DT_FIELDS:
+        if k in item:
+            dt = parse_dt(item[k])
+            if dt is not None:
+                return dt
+    return None
+
+
+_NAIVE_EPOCH = datetime(1970, 1, 1)
+
+
+def _epoch(dt: datetime) -> float:
+    """排序用的秒数。naive 时间直接按字面值计算（只比较差值，不需要经过本地时区换算）。"""
+    if dt.tzinfo is None:
+        return (dt - _NAIVE_EPOCH).total_seconds()
+    return dt.timestamp()
+
+
+class TimelineIndex:
+    """
+    对一个历史列表建索引：每条的时间只解析一次，保存 datetime 与 epoch 秒。
+      - dt(i)：渲染时直接复用解析结果
+      - iter_closest(pivot)：按与 pivot 的距离由近到远惰性产出下标（无 pivot 时由新到旧，
+        无时间的条目排最后且保持原顺序）。堆化 O(n)，每取一个 O(log n)，预算用完即停。
+      - closest(pivot, k)：前 k 个（heapq.nsmallest），不做全量排序
+    """
+
+    __slots__ = ("items", "_dts", "_epochs")
+
+    def __init__(self, items: List[Any]):
+        self.items = items
+        self._dts: List[Optional[datetime]] = [extract_item_dt(it) for it in items]
+        self._epochs: List[Optional[float]] = [None if d is None else _epoch(d) for d in self._dts]
+
+    def __len__(self) -> int:
+        return len(self.items)
+
+    def dt(self, i: int) -> Optional[datetime]:
+        return self._dts[i]
+
+    def _keys(self, pivot: Optional[datetime]) -> List[Tuple[int, float, int]]:
+        p = None if pivot is None else _epoch(pivot)
+        keys = []
+        for i, e in enumerate(self._epochs):
+            if e is None:
+                keys.append((1, 0.0, i))
+            elif p is None:
+                keys.append((0, -e, i))
+            else:
+                keys.append((0, abs(e - p), i))
+        return keys
+
+    def iter_closest(self, pivot: Optional[datetime]) -> Iterator[int]:
+        heap = self._keys(pivot)
+        heapq.heapify(heap)
+        while heap:
+            yield heapq.heappop(heap)[2]
+
+    def closest(self, pivot: Optional[datetime], k: Optional[int] = None) -> List[int]:
+        keys = self._keys(pivot)
+        if k is None or k >= len(keys):
+            keys.sort()
+            return [t[2] for t in keys]
+        return [t[2] for t in heapq.nsmallest(k, keys)]
+
+
+def parse_cache_info():
+    return {"str": _parse_str.cache_info()._asdict(), "num": _parse_num.cache_info()._asdict()}
+
+
+def _load_business_tz() -> tzinfo:
+    try:
+        return ZoneInfo(BUSINESS_TZ)
+    except Exception:
+        # 精简镜像可能没有 tzdata；国内不使用夏令时，固定 +08:00 等价
+        logger.warning("[timeline] time zone %s unavailable, using UTC+08:00", BUSINESS_TZ)
+        return timezone(timedelta(hours=8))
+
+
+_BUSINESS_TZ = _load_business_tz()
+
+
+def business_now() -> str:
+    """业务时区的当前时间，格式 YYYY-MM-DD HH:MM:SS（与客户端 currentTime 一致）。"""
+    return datetime.now(_BUSINESS_TZ).strftime("%Y-%m-%d %H:%M:%S")
+
+
+def business_today() -> str:
+    """业务时区的今天，YYYY-MM-DD。"""
+    return datetime.now(_BUSINESS_TZ).strftime("%Y-%m-%d")
@@ -0,0 +1,244 @@
+# 按 openid 持久化的用户记忆：每日总结 + 聊天轮次（本地 SQLite），客户端不必每次上传完整历史
+#
+# 调用方只能传入已校验身份的 openid（见 services/identity.py），不能直接用客户端 payload 里的 openid。
+# - 磁盘：SQLite（WAL），每个用户保留最近 USER_MEMORY_MAX_SUMMARIES 条总结、USER_MEMORY_MAX_TURNS 条消息
+# - 内存：最近活跃的 USER_MEMORY_HOT_USERS 个用户常驻（LRU），命中时不访问磁盘；
+#   超过 USER_MEMORY_HOT_TTL 的条目从磁盘重读，其他 worker 写入的总结 / 轮次因此最迟 TTL 秒后可见
+# - 磁盘读写在线程池中执行，不阻塞事件循环；磁盘不可用时退化为仅内存
+# 多 worker 部署时内存层各自独立，磁盘层共享同一个文件。
+
+import asyncio
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict, deque
+from dataclasses import dataclass, field
+from typing import Any, Deque, Dict, List, Optional
+
+from core.config import (
+    USER_MEMORY_ENABLED,
+    USER_MEMORY_DB,
+    USER_MEMORY_HOT_TTL,
+    USER_MEMORY_HOT_USERS,
+    USER_MEMORY_MAX_SUMMARIES,
+    USER_MEMORY_MAX_TURNS,
+)
+from services.memory_index import doc_key, memory_store
+from utils.json_codec import dumps, loads
+
+logger = logging.getLogger("uvicorn.error")
+
+__all__ = ["UserHistory", "UserMemoryStore", "user_memory"]
+
+
+@dataclass
+class UserHistory:
+    # summaryDate → 总结（SummarizeResultResp 字段 + summaryDate），按日期升序
+    summaries: Dict[str, Dict[str, Any]] = field(default_factory=dict)
+    # 每条：{"role": "user"|"assistant", "content": str, "ts": str}
+    turns: Deque[Dict[str, Any]] = field(default_factory=lambda: deque(maxlen=USER_MEMORY_MAX_TURNS))
+    # 进入内存层的时间（monotonic），用于 TTL
+    loaded_at: float = field(default_factory=time.monotonic)
+
+    def summary_list(self, exclude_date: Optional[str] = None) -> List[Dict[str, Any]]:
+        return [v for k, v in self.summaries.items() if k != exclude_date]
+
+
+class UserMemoryStore:
+    def __init__(
+        self,
+        db_path: Optional[str] = USER_MEMORY_DB,
+        hot_users: int = USER_MEMORY_HOT_USERS,
+        hot_ttl: float = USER_MEMORY_HOT_TTL,
+        max_summaries: int = USER_MEMORY_MAX_SUMMARIES,
+        max_turns: int = USER_MEMORY_MAX_TURNS,
+        enabled: bool = USER_MEMORY_ENABLED,
+    ):
+        self.db_path = db_path or None
+        self.hot_users = hot_users
+        self.hot_ttl = hot_ttl
+        self.max_summaries = max_summaries
+        self.max_turns = max_turns
+        self.enabled = enabled
+        self._hot: "OrderedDict[str, UserHistory]" = OrderedDict()
+        self._db: Optional[sqlite3.Connection] = None
+        self._db_lock = threading.Lock()
+        self.stats: Dict[str, int] = {
+            "hot_hits": 0,
+            "hot_refreshes": 0,
+            "disk_loads": 0,
+            "summary_writes": 0,
+            "turn_writes": 0,
+        }
+
+    # ---------- 生命周期 ----------
+    def open(self) -> None:
+        if not self.enabled or not self.db_path or self._db is not None:
+            return
+        try:
+            os.makedirs(os.path.dirname(self.db_path) or ".", exist_ok=True)
+            db = sqlite3.connect(self.db_path, check_same_thread=False)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS daily_summary ("
+                "openid TEXT NOT NULL, summary_date TEXT NOT NULL, data TEXT NOT NULL, updated_at REAL NOT NULL, "
+                "PRIMARY KEY (openid, summary_date))"
+            )
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS chat_turn ("
+                "id INTEGER PRIMARY KEY AUTOINCREMENT, openid TEXT NOT NULL, role TEXT NOT NULL, "
+                "content TEXT NOT NULL, ts TEXT NOT NULL)"
+            )
+            db.execute("CREATE INDEX IF NOT EXISTS chat_turn_openid ON chat_turn (openid, id)")
+            db.commit()
+            self._db = db
+            logger.info("[user_memory] sqlite ready path=%s", self.db_path)
+        except Exception:
+            logger.exception("[user_memory] open sqlite failed, memory tier only: %s", self.db_path)
+            self._db = None
+
+    def close(self) -> None:
+        with self._db_lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+        self._hot.clear()
+
+    # ---------- 磁盘层（线程池中执行）----------
+    def _disk_load(self, openid: str) -> UserHistory:
+        hist = UserHistory(turns=deque(maxlen=self.max_turns))
+        with self._db_lock:
+            if self._db is None:
+                return hist
+            rows = self._db.execute(
+                "SELECT summary_date, data FROM daily_summary WHERE openid = ? ORDER BY summary_date",
+                (openid,),
+            ).fetchall()
+            turns = self._db.execute(
+                "SELECT role, content, ts FROM chat_turn WHERE openid = ? ORDER BY id DESC LIMIT ?",
+                (openid, self.max_turns),
+            ).fetchall()
+        for date, data in rows:
+            try:
+                hist.summaries[date] = loads(data)
+            except ValueError:
+                continue
+        for role, content, ts in reversed(turns):
+            hist.turns.append({"role": role, "content": content, "ts": ts})
+        return hist
+
+    def _disk_put_summaries(self, openid: str, items: List[Dict[str, Any]]) -> None:
+        now = time.time()
+        rows = [(openid, doc_key(it), dumps(it), now) for it in items]
+        with self._db_lock:
+            if self._db is None:
+                return
+            self._db.executemany(
+                "INSERT OR REPLACE INTO daily_summary (openid, summary_date, data, updated_at) VALUES (?, ?, ?, ?)",
+                rows,
+            )
+            self._db.execute(
+                "DELETE FROM daily_summary WHERE openid = ? AND summary_date NOT IN ("
+                "SELECT summary_date FROM daily_summary WHERE openid = ? ORDER BY summary_date DESC LIMIT ?)",
+                (openid, openid, self.max_summaries),
+            )
+            self._db.commit()
+
+    def _disk_put_turns(self, openid: str, turns: List[Dict[str, Any]]) -> None:
+        with self._db_lock:
+            if self._db is None:
+                return
+            self._db.executemany(
+                "INSERT INTO chat_turn (openid, role, content, ts) VALUES (?, ?, ?, ?)",
+                [(openid, t["role"], t["content"], t["ts"]) for t in turns],
+            )
+            self._db.execute(
+                "DELETE FROM chat_turn WHERE openid = ? AND id <= ("
+                "SELECT id FROM chat_turn WHERE openid = ? ORDER BY id DESC LIMIT 1 OFFSET ?)",
+                (openid, openid, self.max_turns),
+            )
+            self._db.commit()
+
+    # ---------- 内存层 ----------
+    def _hot_put(self, openid: str, hist: UserHistory) -> None:
+        self._hot[openid] = hist
+        self._hot.move_to_end(openid)
+        while len(self._hot) > self.hot_users:
+            self._hot.popitem(last=False)
+
+    # ---------- 对外接口 ----------
+    async def load(self, openid: str) -> Optional[UserHistory]:
+        """该用户的历史（常驻内存或从磁盘加载）；未启用或 openid 为空时返回 None。"""
+        if not self.enabled or not openid:
+            return None
+        stale = self._hot.get(openid)
+        if stale is not None and not self._expired(stale):
+            self._hot.move_to_end(openid)
+            self.stats["hot_hits"] += 1
+            return stale
+        hist = None
+        if stale is not None:
+            self.stats["hot_refreshes"] += 1
+        if self._db is not None:
+            try:
+                hist = await asyncio.to_thread(self._disk_load, openid)
+                self.stats["disk_loads"] += 1
+            except Exception:
+                logger.exception("[user_memory] disk load failed")
+        # 并发加载同一用户时以先完成者为准
+        current = self._hot.get(openid)
+        if current is not None and current is not stale:
+            return current
+        hist = hist or stale or UserHistory(turns=deque(maxlen=self.max_turns))
+        hist.loaded_at = time.monotonic()
+        self._hot_put(openid, hist)
+        # 同时灌入相关度检索索引
+        memory_store.add(openid, hist.summaries.values())
+        return hist
+
+    def _expired(self, hist: UserHistory) -> bool:
+        # 没有磁盘层时内存就是唯一的数据，不过期
+        return self._db is not None and self.hot_ttl > 0 and time.monotonic() - hist.loaded_at > self.hot_ttl
+
+    async def save_summaries(self, openid: str, items: List[Dict[str, Any]]) -> int:
+        """写入（或覆盖同一天的）总结；与已存内容相同的条目跳过。返回写入条数。"""
+        hist = await self.load(openid)
+        if hist is None:
+            return 0
+        changed = []
+        for it in items:
+            key = doc_key(it)
+            if hist.summaries.get(key) != it:
+                hist.summaries[key] = it
+                changed.append(it)
+        if not changed:
+            return 0
+        hist.summaries = dict(sorted(hist.summaries.items())[-self.max_summaries:])
+        self.stats["summary_writes"] += len(changed)
+        if self._db is not None:
+            try:
+                await asyncio.to_thread(self._disk_put_summaries, openid, changed)
+            except Exception:
+                logger.exception("[user_memory] disk put summaries failed")
+        return len(changed)
+
+    async def append_turns(self, openid: str, turns: List[Dict[str, Any]]) -> None:
+        hist = await self.load(openid)
+        if hist is None or not turns:
+            return
+        hist.turns.extend(turns)
+        self.stats["turn_writes"] += len(turns)
+        if self._db is not None:
+            try:
+                await asyncio.to_thread(self._disk_put_turns, openid, turns)
+            except Exception:
+                logger.exception("[user_memory] disk put turns failed")
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {**self.stats, "hot_users": len(self._hot), "disk_enabled": self._db is not None}
+
+
+user_memory = UserMemoryStore()
@@ -0,0 +1,130 @@
+# 启动预热：部署后的第一批请求不再承担 DNS、TCP+TLS 建连、提示词编译与首次组装的开销
+#
+# lifespan 启动后在后台按顺序执行（总时长不超过 WARMUP_TIMEOUT），结束或超时后才标记就绪（/readyz）：
+#   1. dns：解析各 provider 的域名（同时填充系统 / 上游 DNS 缓存）
+#   2. connect：每个 provider 并发发 WARMUP_CONNECTIONS 个 HEAD 请求，建好的连接以 keep-alive 留在连接池
+#   3. prompts：执行各路由注册的预热函数（编译提示词、用示例数据完整组装一次请求）
+#   4. probe：可选，对 WARMUP_PROBE_MODELS 各发一次 max_tokens=1 的真实请求
+# 任一步失败只记日志，不阻止就绪：上游暂时不可达时实例仍应接流量（由重试 / 熔断兜底）。
+
+import asyncio
+import logging
+import socket
+import time
+from typing import Any, Callable, Dict, List, Tuple
+from urllib.parse import urlsplit
+
+from core.config import (
+    DASH_URL,
+    OPEN_URL,
+    WARMUP_CONNECTIONS,
+    WARMUP_ENABLED,
+    WARMUP_PROBE_MODELS,
+    WARMUP_TIMEOUT,
+)
+from models.chat_models import ChatRequest
+from services.http_pool import get_client, pool_stats
+from services.llm_clients import smart_call
+
+logger = logging.getLogger("uvicorn.error")
+
+__all__ = ["register_warmup", "run_warmup", "warmup_stats"]
+
+PROVIDER_URLS = {"dashscope": DASH_URL, "openai": OPEN_URL}
+
+_hooks: List[Tuple[str, Callable[[], Any]]] = []
+_stats: Dict[str, Any] = {"done": False, "total_ms": 0.0, "steps": {}}
+
+
+def register_warmup(name: str, fn: Callable[[], Any]) -> None:
+    """注册一个同步预热函数（路由模块导入时调用）。"""
+    _hooks.append((name, fn))
+
+
+async def _warm_dns() -> Dict[str, Any]:
+    loop = asyncio.get_running_loop()
+    out: Dict[str, Any] = {}
+    for provider, url in PROVIDER_URLS.items():
+        parts = urlsplit(url)
+        port = parts.port or (443 if parts.scheme == "https" else 80)
+        infos = await loop.getaddrinfo(parts.hostname, port, type=socket.SOCK_STREAM)
+        out[provider] = len(infos)
+    return out
+
+
+async def _warm_connections() -> Dict[str, Any]:
+    async def _open(provider: str, url: str) -> None:
+        parts = urlsplit(url)
+        origin = f"{parts.scheme}://{parts.netloc}/"
+        client = get_client(provider)
+        # 并发请求时连接池里没有空闲连接，每个请求各建一条；响应状态无关紧要（404 / 405 也说明连接已建立）
+        await asyncio.gather(
+            *(client.head(origin, timeout=WARMUP_TIMEOUT) for _ in range(max(WARMUP_CONNECTIONS, 1))),
+            return_exceptions=True,
+        )
+
+    await asyncio.gather(*(_open(p, u) for p, u in PROVIDER_URLS.items()))
+    stats = pool_stats()
+    return {provider: stats.get(provider, {}).get("idle", 0) for provider in PROVIDER_URLS}
+
+
+async def _warm_prompts() -> Dict[str, Any]:
+    out: Dict[str, Any] = {}
+    for name, fn in _hooks:
+        try:
+            fn()
+            out[name] = "ok"
+        except Exception:
+            logger.exception("[warmup] hook failed: %s", name)
+            out[name] = "error"
+    return out
+
+
+async def _warm_probe() -> Dict[str, Any]:
+    out: Dict[str, Any] = {}
+    for model in WARMUP_PROBE_MODELS:
+        req = ChatRequest.builder().model(model).addMessage("user", "hi").max_completion_tokens(1).build()
+        try:
+            await smart_call(req, route="warmup")
+            out[model] = "ok"
+        except Exception as e:
+            out[model] = f"error: {getattr(e, 'detail', None) or type(e).__name__}"
+    return out
+
+
+async def _step(name: str, fn: Callable[[], Any]) -> None:
+    start = time.perf_counter()
+    try:
+        result = await fn()
+        _stats["steps"][name] = {"ok": True, "ms": round((time.perf_counter() - start) * 1000, 1), "result": result}
+    except Exception as e:
+        logger.warning("[warmup] step %s failed: %r", name, e)
+        _stats["steps"][name] = {"ok": False, "ms": round((time.perf_counter() - start) * 1000, 1), "error": repr(e)}
+
+
+async def _run_steps() -> None:
+    await _step("dns", _warm_dns)
+    await _step("connect", _warm_connections)
+    await _step("prompts", _warm_prompts)
+    if WARMUP_PROBE_MODELS:
+        await _step("probe", _warm_probe)
+
+
+async def run_warmup(on_done: Callable[[], None]) -> None:
+    """执行预热（WARMUP_ENABLED=0 时跳过），结束或超时后调用 on_done（标记就绪）。"""
+    start = time.perf_counter()
+    try:
+        if WARMUP_ENABLED:
+            await asyncio.wait_for(_run_steps(), timeout=WARMUP_TIMEOUT)
+    except asyncio.TimeoutError:
+        logger.warning("[warmup] not finished within %.0fs, marking ready anyway", WARMUP_TIMEOUT)
+    finally:
+        _stats["done"] = True
+        _stats["total_ms"] = round((time.perf_counter() - start) * 1000, 1)
+        on_done()
+    logger.info("[warmup] done in %.0fms steps=%s", _stats["total_ms"],
+                {k: v.get("ms") for k, v in _stats["steps"].items()})
+
+
+def warmup_stats() -> Dict[str, Any]:
+    return _stats
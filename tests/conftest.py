@@ -0,0 +1,9 @@
+# 测试环境：core.config 导入时要求 API key，这里给占位值；并把项目根目录加入 sys.path
+
+import os
+import sys
+
+os.environ.setdefault("OPEN_API_KEY", "test")
+os.environ.setdefault("DASHSCOPE_API_KEY", "test")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,39 @@
+# services.identity：签名 token 的校验
+
+import pytest
+
+from services.identity import bearer_token, sign_token, verify_token
+
+SECRET = "s3cret"
+
+
+def test_roundtrip():
+    assert verify_token(sign_token("o-abc_1", 60, SECRET), SECRET) == "o-abc_1"
+
+
+@pytest.mark.parametrize(
+    "token",
+    [
+        None,
+        "",
+        "o1",
+        "o1.123",
+        sign_token("o1", -10, SECRET),                      # 已过期
+        sign_token("o1", 60, "other"),                      # 其他密钥签发
+        sign_token("o1", 60, SECRET).replace("o1", "o2", 1),  # 篡改 openid
+    ],
+)
+def test_rejected(token):
+    assert verify_token(token, SECRET) is None
+
+
+def test_no_secret_rejects_everything():
+    assert verify_token(sign_token("o1", 60, SECRET), "") is None
+
+
+@pytest.mark.parametrize(
+    "headers, expected",
+    [({"authorization": "Bearer abc"}, "abc"), ({"authorization": "Basic abc"}, None), ({}, None)],
+)
+def test_bearer_token(headers, expected):
+    assert bearer_token(headers) == expected
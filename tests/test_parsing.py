@@ -0,0 +1,39 @@
+# utils.parsing.parse_json_object：LLM 输出常见缺陷的修复结果与 outcome
+
+import pytest
+
+from utils.parsing import parse_json_object
+
+CASES = [
+    # (说明, 原始输出, 期望对象, 期望 outcome)
+    ("strict", '{"a": "x", "b": 1}', {"a": "x", "b": 1}, "ok"),
+    ("fence", '```json\n{"a": "x"}\n```', {"a": "x"}, "ok"),
+    ("fence_no_lang", '```\n{"a": "x"}\n```', {"a": "x"}, "ok"),
+    ("double_encoded", '"{\\"a\\": \\"x\\"}"', {"a": "x"}, "ok"),
+    ("trailing_comma", '{"a": "x", "b": [1, 2,],}', {"a": "x", "b": [1, 2]}, "repaired"),
+    ("trailing_text", '{"a": "x"}\n以上是总结。', {"a": "x"}, "repaired"),
+    ("smart_quotes", "{“a”：“x”，“b”: 1}", {"a": "x", "b": 1}, "repaired"),
+    ("smart_quotes_inside_string", '{"a": "“你好”"}', {"a": "“你好”"}, "ok"),
+    ("unescaped_quote", '{"a": "他说"你好"了", "b": 1}', {"a": '他说"你好"了', "b": 1}, "repaired"),
+    ("raw_newline", '{"a": "第一行\n第二行"}', {"a": "第一行\n第二行"}, "repaired"),
+    ("missing_comma_string", '{"a":"x"\n"b":"y"}', {"a": "x", "b": "y"}, "repaired"),
+    ("missing_comma_number", '{"a": 1\n"b": 2}', {"a": 1, "b": 2}, "repaired"),
+    ("truncated_string", '{"a": "x", "b": "y', {"a": "x"}, "repaired"),
+    ("truncated_nested", '{"a": "x", "b": {"c": [1, 2', {"a": "x", "b": {"c": [1]}}, "repaired"),
+    ("truncated_number_only", '{"a": 12', {}, "failed"),
+    ("truncated_key", '{"a', {}, "failed"),
+    ("empty_object", "{}", {}, "failed"),
+    ("empty_input", "", {}, "failed"),
+    ("no_object", "抱歉，我无法生成。", {}, "failed"),
+]
+
+
+@pytest.mark.parametrize("raw, expected, outcome", [c[1:] for c in CASES], ids=[c[0] for c in CASES])
+def test_parse_json_object(raw, expected, outcome):
+    assert parse_json_object(raw) == (expected, outcome)
+
+
+def test_empty_result_is_never_repaired():
+    for raw in ('{"a": 12', '{"a": tr', '{ ', '{"a":'):
+        obj, outcome = parse_json_object(raw)
+        assert obj == {} and outcome == "failed", raw
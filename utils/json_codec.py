@@ -0,0 +1,73 @@
+# JSON 编解码层：orjson 可用时走 orjson，否则退回标准库 json。
+#
+# 输出格式两边一致：紧凑分隔符、不转义中文、UTF-8。
+# JSON_BACKEND=auto|orjson|json 可强制选择实现（orjson 未安装时总是退回 json）。
+
+import json
+import logging
+from typing import Any, Callable, Optional, Union
+
+from fastapi.responses import JSONResponse
+
+from core.config import JSON_BACKEND
+
+try:
+    import orjson
+except ImportError:  # 可选依赖
+    orjson = None
+
+__all__ = ["BACKEND", "dumps", "dumps_bytes", "loads", "FastJSONResponse"]
+
+logger = logging.getLogger("uvicorn.error")
+
+if JSON_BACKEND == "orjson" and orjson is None:
+    logger.warning("[json] JSON_BACKEND=orjson but orjson is not installed, using stdlib json")
+
+_USE_ORJSON = orjson is not None and JSON_BACKEND in ("auto", "orjson")
+BACKEND = "orjson" if _USE_ORJSON else "json"
+
+# 非 str 的 dict key（int 等）按标准库的方式转成字符串
+_ORJSON_OPTS = orjson.OPT_NON_STR_KEYS if orjson is not None else 0
+
+
+def _std_dumps(obj: Any, default: Optional[Callable[[Any], Any]]) -> str:
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":"), default=default)
+
+
+def dumps_bytes(obj: Any, default: Optional[Callable[[Any], Any]] = None) -> bytes:
+    """编码为 UTF-8 bytes（上游请求体、HTTP 响应体）。"""
+    if _USE_ORJSON:
+        try:
+            return orjson.dumps(obj, default=default, option=_ORJSON_OPTS)
+        except TypeError:
+            # orjson 不支持的输入（超过 64 位的整数等）交给标准库；真正不可序列化时标准库同样抛 TypeError
+            pass
+    return _std_dumps(obj, default).encode("utf-8")
+
+
+def dumps(obj: Any, default: Optional[Callable[[Any], Any]] = None) -> str:
+    """编码为 str（WebSocket 文本帧、NDJSON / SSE 行、日志）。"""
+    if _USE_ORJSON:
+        try:
+            return orjson.dumps(obj, default=default, option=_ORJSON_OPTS).decode("utf-8")
+        except TypeError:
+            pass
+    return _std_dumps(obj, default)
+
+
+def loads(data: Union[str, bytes, bytearray, memoryview]) -> Any:
+    """解码 str 或 bytes（bytes 无需先 decode）；格式错误时抛 ValueError。"""
+    if _USE_ORJSON:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+class FastJSONResponse(JSONResponse):
+    """
+    用本模块的编码器渲染的 JSONResponse，用于直接返回 dict 的接口。
+    声明了 response_model 的路由保持默认 response_class：FastAPI 此时直接用 pydantic-core
+    把模型序列化成 JSON bytes，比先转成 dict 再编码更快。
+    """
+
+    def render(self, content: Any) -> bytes:
+        return dumps_bytes(content)
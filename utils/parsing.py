@@ -1 +1,253 @@
-# 预留：复杂 payload 解析、清洗工具
\ No newline at end of file
+# 预留：复杂 payload 解析、清洗工具
+
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+from utils.json_codec import loads
+
+__all__ = ["IncrementalJsonFieldParser", "parse_json_object", "repair_json_object"]
+
+
+class IncrementalJsonFieldParser:
+    """
+    增量解析 LLM 流式输出的 JSON 对象：每喂入一段文本，返回其中新完成的顶层字段 (key, value)。
+
+    - 跳过第一个 '{' 之前的内容（```json 外壳、前置说明等）
+    - 只在顶层（depth == 1）且不在字符串内时，用 ',' / '}' 切分成员；
+      每个成员完整后单独 json.loads，不必等整个对象生成完
+    - 成员解析失败（格式不规范）时跳过该字段，最终结果仍以整体解析为准
+    """
+
+    def __init__(self):
+        self._started = False
+        self._finished = False
+        self._depth = 0
+        self._in_str = False
+        self._escape = False
+        self._member: List[str] = []
+
+    @property
+    def finished(self) -> bool:
+        return self._finished
+
+    def feed(self, chunk: str) -> List[Tuple[str, Any]]:
+        out: List[Tuple[str, Any]] = []
+        if self._finished or not chunk:
+            return out
+
+        i = 0
+        if not self._started:
+            i = chunk.find("{")
+            if i < 0:
+                return out
+            self._started = True
+            self._depth = 1
+            i += 1
+
+        start = i
+        n = len(chunk)
+        while i < n:
+            c = chunk[i]
+            if self._in_str:
+                if self._escape:
+                    self._escape = False
+                elif c == "\\":
+                    self._escape = True
+                elif c == '"':
+                    self._in_str = False
+            elif c == '"':
+                self._in_str = True
+            elif c in "{[":
+                self._depth += 1
+            elif c in "}]":
+                self._depth -= 1
+                if self._depth == 0:
+                    self._member.append(chunk[start:i])
+                    self._emit(out)
+                    self._finished = True
+                    return out
+            elif c == "," and self._depth == 1:
+                self._member.append(chunk[start:i])
+                self._emit(out)
+                start = i + 1
+            i += 1
+
+        self._member.append(chunk[start:])
+        return out
+
+    def _emit(self, out: List[Tuple[str, Any]]) -> None:
+        text = "".join(self._member).strip()
+        self._member = []
+        if not text:
+            return
+        try:
+            obj = loads("{" + text + "}")
+        except Exception:
+            return
+        if isinstance(obj, dict):
+            out.extend(obj.items())
+
+
+# ================= 容错 JSON 解析 =================
+
+# 字符串外出现时按 '"' 处理的引号（模型偶尔用中文引号包裹 key / value）
+_SMART_QUOTES = "\u201c\u201d\u201e\uff02"
+# 字符串外的全角标点
+_FULLWIDTH = {"\uff0c": ",", "\uff1a": ":", "\uff5b": "{", "\uff5d": "}"}
+# 引号后紧跟这些字符（跳过空白）时才视为字符串结束，否则按内容中未转义的引号处理
+_AFTER_STRING = ',:}]\uff0c\uff1a'
+_CONTROL_ESCAPES = {"\n": "\\n", "\r": "\\r", "\t": "\\t"}
+# 值字符串的引号后紧跟下一个 "key": 时，视为字符串结束、成员之间漏了逗号
+_NEXT_KEY = re.compile(r'\s*["\u201c\u201d\u201e\uff02][^"\u201c\u201d\u201e\uff02\n]*["\u201c\u201d\u201e\uff02]\s*[:\uff1a]')
+
+
+def _strip_fence(text: str) -> str:
+    text = text.strip()
+    if text.startswith("```"):
+        text = text.strip("`").strip()
+        if text[:4].lower() == "json":
+            text = text[4:].strip()
+    return text
+
+
+def repair_json_object(text: str) -> Tuple[str, bool]:
+    """
+    从第一个 '{' 开始修复常见缺陷，返回 (修复后的文本, 是否被截断)：
+      - 最外层对象闭合后的内容（解释说明等）丢弃
+      - 字符串外的中文引号 / 全角逗号冒号 → ASCII；字符串内的原样保留
+      - 字符串内未转义的引号、换行 / 制表符等控制字符 → 转义
+      - 尾随逗号删除；成员之间漏掉的逗号补上
+      - 截断：回退到最后一个完整成员，再补齐括号
+    """
+    start = text.find("{")
+    if start < 0:
+        return "", False
+    out: List[str] = []
+    stack: List[str] = []
+    in_str = escape = smart = after_colon = False
+    # 最后一个完整成员之后的位置与当时的括号栈
+    safe: Optional[Tuple[int, Tuple[str, ...]]] = None
+    n = len(text)
+    i = start
+    while i < n:
+        c = text[i]
+        if in_str:
+            if escape:
+                out.append(c)
+                escape = False
+            elif c == "\\":
+                out.append(c)
+                escape = True
+            elif c == '"' or (smart and c in _SMART_QUOTES):
+                j = i + 1
+                while j < n and text[j] in " \t\r\n":
+                    j += 1
+                if j >= n or text[j] in _AFTER_STRING or (after_colon and _NEXT_KEY.match(text, i + 1)):
+                    out.append('"')
+                    in_str = False
+                    # 对象中的值或数组元素结束 → 一个完整成员
+                    if after_colon or (stack and stack[-1] == "]"):
+                        safe = (len(out), tuple(stack))
+                    after_colon = False
+                else:
+                    out.append('\\"' if c == '"' else c)
+            elif c < " ":
+                out.append(_CONTROL_ESCAPES.get(c) or "\\u%04x" % ord(c))
+            else:
+                out.append(c)
+        else:
+            c = _FULLWIDTH.get(c, c)
+            if c == '"' or c in _SMART_QUOTES:
+                if _missing_comma(out):
+                    safe = (len(out), tuple(stack))
+                    out.append(",")
+                in_str, smart = True, c != '"'
+                out.append('"')
+            elif c in "{[":
+                stack.append("}" if c == "{" else "]")
+                out.append(c)
+                after_colon = False
+                safe = (len(out), tuple(stack))
+            elif c in "}]":
+                _rstrip_comma(out)
+                if stack:
+                    stack.pop()
+                out.append(c)
+                after_colon = False
+                if not stack:
+                    return "".join(out), False
+                safe = (len(out), tuple(stack))
+            elif c == ",":
+                _rstrip_comma(out)
+                safe = (len(out), tuple(stack))
+                out.append(c)
+                after_colon = False
+            elif c == ":":
+                out.append(c)
+                after_colon = True
+            else:
+                out.append(c)
+        i += 1
+
+    # 截断（或缺少结尾括号）：丢弃不完整的最后一个成员
+    if safe is None:
+        return "", True
+    pos, open_stack = safe
+    del out[pos:]
+    _rstrip_comma(out)
+    out.extend(reversed(open_stack))
+    return "".join(out), True
+
+
+def _rstrip_comma(out: List[str]) -> None:
+    while out and out[-1] in " \t\r\n":
+        out.pop()
+    if out and out[-1] == ",":
+        out.pop()
+
+
+def _missing_comma(out: List[str]) -> bool:
+    """即将开始一个字符串时，前面紧挨着的是上一个值（而不是 { [ , :）。"""
+    k = len(out) - 1
+    while k >= 0 and out[k] in " \t\r\n":
+        k -= 1
+    return k >= 0 and out[k] not in "{[,:"
+
+
+def _salvage_members(text: str) -> Dict[str, Any]:
+    """逐个顶层成员单独解析，保留能解析的字段。"""
+    parser = IncrementalJsonFieldParser()
+    return dict(parser.feed(text))
+
+
+def parse_json_object(raw: str) -> Tuple[Dict[str, Any], str]:
+    """
+    解析 LLM 输出的 JSON 对象，返回 (对象, outcome)：
+      ok       严格解析成功（含 ```json 外壳、被二次编码成字符串的 JSON）
+      repaired 修复后整体解析成功（截断时只含完整成员）
+      salvaged 整体仍无法解析，只取回了部分字段
+      failed   没有可用字段，对象为 {}（包括解析 / 修复结果本身就是空对象）
+    """
+    text = _strip_fence(raw or "")
+    if not text:
+        return {}, "failed"
+    try:
+        obj = loads(text)
+        if isinstance(obj, str):
+            obj = loads(_strip_fence(obj))
+        if isinstance(obj, dict):
+            return obj, ("ok" if obj else "failed")
+    except ValueError:
+        pass
+
+    repaired, _ = repair_json_object(text)
+    if not repaired:
+        return {}, "failed"
+    try:
+        obj = loads(repaired)
+        if isinstance(obj, dict):
+            return obj, ("repaired" if obj else "failed")
+    except ValueError:
+        pass
+    obj = _salvage_members(repaired)
+    return obj, ("salvaged" if obj else "failed")